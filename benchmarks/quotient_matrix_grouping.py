@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+
+""" Benchmark the binary spill path of the quotient matrix grouping against text files and GNU sort.
+
+Example:
+    python benchmarks/quotient_matrix_grouping.py --num-records 1000000
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.quotient_matrix_grouping import QuotientMatrixGrouping
+
+
+def group_with_text_and_sort(records, directory):
+    """ Reference: the former partition_{id}.1qm path. """
+    filename = str(Path(directory) / "partition.1qm")
+    with open(filename, "w") as file:
+        for quotient_matrix, instance_id, state_id, v_star in records:
+            file.write(f"{quotient_matrix} {instance_id} {state_id} {v_star}\n")
+    subprocess.run(['sort', '-k1,1', '-o', filename, filename], check=True)
+    num_bytes = os.path.getsize(filename)
+    conflict_groups = []
+    with open(filename, "r") as file:
+        prev_quotient_matrix = None
+        group = []
+        for line in file:
+            quotient_matrix, instance_id, state_id, v_star = line.split()
+            if quotient_matrix != prev_quotient_matrix:
+                if len(group) > 1:
+                    conflict_groups.append(group)
+                group = []
+                prev_quotient_matrix = quotient_matrix
+            group.append((int(instance_id), int(state_id), int(v_star)))
+        if len(group) > 1:
+            conflict_groups.append(group)
+    return conflict_groups, num_bytes
+
+
+def group_with_binary_spill(records, memory_budget):
+    with QuotientMatrixGrouping(memory_budget) as grouping:
+        for quotient_matrix, instance_id, state_id, v_star in records:
+            grouping.add(quotient_matrix, instance_id, state_id, v_star)
+        conflict_groups = grouping.get_conflict_groups()
+        num_bytes = grouping.num_spilled_records * 28
+    return conflict_groups, num_bytes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark quotient matrix grouping.")
+    parser.add_argument("--num-records", default=200_000, help="The number of records.", type=int)
+    parser.add_argument("--num-distinct", default=None, help="The number of distinct quotient matrices (default: half the records).", type=int)
+    parser.add_argument("--quotient-matrix-size", default=40, help="The number of rows and columns of the synthetic quotient matrices.", type=int)
+    parser.add_argument("--memory-budget", default=16, help="The memory budget in MiB of the binary path.", type=int)
+    args = parser.parse_args()
+
+    random.seed(0)
+    num_distinct = args.num_distinct or max(1, args.num_records // 2)
+    size = args.quotient_matrix_size
+    quotient_matrices = [repr([[random.randint(0, 9) for _ in range(size)] for _ in range(size)]).replace(" ", "") for _ in range(num_distinct)]
+    records = [(random.choice(quotient_matrices), random.randrange(1000), i, random.randrange(50)) for i in range(args.num_records)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        text_groups, text_bytes = group_with_text_and_sort(records, directory)
+        text_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    binary_groups, binary_bytes = group_with_binary_spill(records, args.memory_budget * 1024 * 1024)
+    binary_time = time.perf_counter() - start
+
+    assert sorted(map(sorted, text_groups)) == sorted(map(sorted, binary_groups))
+
+    print(f"Records: {args.num_records}, conflict groups: {len(binary_groups)}")
+    print(f"Text + GNU sort: {text_time:.2f} s, {text_bytes / (1024 * 1024):.1f} MiB on disk")
+    print(f"Binary spill:    {binary_time:.2f} s, {binary_bytes / (1024 * 1024):.1f} MiB on disk ({text_time / binary_time:.2f}x)")
@@ -0,0 +1,287 @@
+#! /usr/bin/env python
+
+""" Benchmark the stages of the pipeline on fixed subsets of the bundled domains and compare the results against a baseline.
+
+Each repetition of a domain runs in a fresh forked process, such that the peak memory usage of a stage is not inflated by earlier domains.
+Per stage, the best time and the smallest peak memory usage over the repetitions are recorded.
+
+Example:
+    python benchmarks/suite.py run --output baseline.json
+    python benchmarks/suite.py run --output current.json
+    python benchmarks/suite.py compare baseline.json current.json
+"""
+
+import argparse
+import importlib.metadata
+import json
+import multiprocessing
+import platform
+import sys
+
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pymimir import StateSpace, StateSpacesOptions, GlobalFaithfulAbstraction, FaithfulAbstractionsOptions, ProblemColorFunction
+
+from src.color_refinement import compute_coloring_classes
+from src.graph_invariants import INVARIANTS, split_by_invariants
+from src.instrumentation import Instrumentation, MemorySampler
+from src.partition_refinement import SmallerHalfRefinement
+from src.performance import memory_usage
+from src.pykwl_utils import to_uvc_graph_from_arrays, compute_coloring_signature
+from src.quotient_matrix_grouping import QuotientMatrixGrouping
+from src.state_data import StateDataBuilder, create_instance_information
+
+import pykwl as kwl
+
+
+# Increment whenever the layout of the benchmark file or the workload of a stage changes.
+BENCHMARK_FORMAT_VERSION = 1
+
+DATA_PATH = Path(__file__).resolve().parent.parent / "data"
+
+# Problems of different sizes per domain. Changing a subset makes earlier baselines incomparable for that domain.
+BENCHMARK_PROBLEMS: Dict[str, List[str]] = {
+    "gripper": ["p-1-0.pddl", "p-2-0.pddl", "p-3-0.pddl", "p-4-0.pddl", "p-5-0.pddl"],
+    "blocks_4": ["p00.pddl", "p01.pddl", "p120.pddl", "p121.pddl", "p240.pddl", "p241.pddl", "p360.pddl", "p361.pddl", "p480.pddl", "p481.pddl"],
+    "rovers": ["p-1-1-1-1-2-11.pddl", "p-1-1-1-1-2-2.pddl", "p-1-1-1-1-3-11.pddl", "p-1-1-1-1-2-16.pddl", "p-1-1-1-1-3-12.pddl", "p-1-1-1-1-2-20.pddl", "p-1-1-1-1-3-2.pddl"],
+    "ferry": ["p00.pddl", "p30.pddl", "p60.pddl", "p100.pddl", "p120.pddl", "p150.pddl"],
+    "miconic": ["p-2-1-0.pddl", "p-3-2-0.pddl", "p-4-3-0.pddl", "p-2-4-0.pddl", "p-4-4-0.pddl"],
+    "childsnack": ["p-1-1.0-0.0-1-1.pddl", "p-2-1.0-0.0-1-1.pddl", "p-2-1.0-0.5-1-3.pddl", "p-2-1.0-1.0-1-0.pddl"],
+    "spanner": ["p-1-1-1-0.pddl", "p-2-2-2-0.pddl", "p-1-3-3-0.pddl", "p-3-3-3-0.pddl"],
+    "visitall": ["p-1-0.5-3-0.pddl", "p-1-0.5-3-15.pddl", "p-4-0.5-4-12.pddl"],
+}
+
+STAGES = ["state_spaces", "abstractions", "object_graphs", "to_uvc_graph", "invariant_cascade", "canonical_color_refinement", "conflict_grouping", "1wl", "1wl_batched", "1wl_partition_refinement", "2fwl"]
+
+
+def get_version(distribution_name: str) -> Optional[str]:
+    try:
+        return importlib.metadata.version(distribution_name)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def run_domain(domain_name: str, max_num_states: int, max_num_2fwl_states: int, memory_sampling_interval: float) -> Dict[str, Any]:
+    """ Run each stage once on the subset of the domain and return the times, peak memory usages, and the amount of work.
+    """
+    domain_path = DATA_PATH / domain_name
+    instrumentation = Instrumentation(MemorySampler(memory_sampling_interval))
+    memory_usage_after_stage: Dict[str, float] = dict()
+
+    @contextmanager
+    def measure(stage: str):
+        with instrumentation.measure(stage):
+            yield
+        # Stages that are shorter than the sampling interval may get no sample. Nothing is released within a stage, hence this is a close bound.
+        memory_usage_after_stage[stage] = memory_usage()
+
+    state_spaces_options = StateSpacesOptions()
+    state_spaces_options.state_space_options.use_unit_cost_one = True
+    state_spaces_options.state_space_options.remove_if_unsolvable = True
+    state_spaces_options.state_space_options.max_num_states = max_num_states
+    state_spaces_options.sort_ascending_by_num_states = True
+    with measure("state_spaces"):
+        state_spaces = StateSpace.create(str(domain_path / "domain.pddl"), [str(domain_path / problem_name) for problem_name in BENCHMARK_PROBLEMS[domain_name]], state_spaces_options)
+
+    faithful_abstractions_options = FaithfulAbstractionsOptions()
+    faithful_abstractions_options.fa_options.use_unit_cost_one = True
+    faithful_abstractions_options.fa_options.remove_if_unsolvable = True
+    faithful_abstractions_options.fa_options.max_num_concrete_states = max_num_states
+    faithful_abstractions_options.fa_options.max_num_abstract_states = max_num_states
+    faithful_abstractions_options.sort_ascending_by_num_states = True
+    memories = [(state_space.get_problem(), state_space.get_pddl_factories(), state_space.get_aag(), state_space.get_ssg()) for state_space in state_spaces]
+    with measure("abstractions"):
+        gfas = GlobalFaithfulAbstraction.create(memories, faithful_abstractions_options)
+
+    ### Like the pairwise-wl driver, keep one representative per class of states that are isomorphic across instances.
+    with measure("object_graphs"):
+        fas = gfas[0].get_abstractions()
+        color_functions = [ProblemColorFunction(fa.get_problem()) for fa in fas]
+        builder = StateDataBuilder(False)
+        visited_global_indices = set()
+        for gfa in gfas:
+            for gfa_state in gfa.get_states():
+                if gfa_state.get_global_index() in visited_global_indices:
+                    continue
+                visited_global_indices.add(gfa_state.get_global_index())
+                fa_index = gfa_state.get_faithful_abstraction_index()
+                builder.add_abstract_state(fa_index, fas[fa_index], color_functions[fa_index], gfa_state.get_faithful_abstract_state_index())
+        state_data = builder.build([create_instance_information(fa.get_problem()) for fa in fas], sum(state_space.get_num_states() for state_space in state_spaces))
+
+    num_states = state_data.get_num_states()
+    graph_arrays = [state_data.get_graph_arrays(state) for state in range(num_states)]
+    with measure("to_uvc_graph"):
+        graphs = [to_uvc_graph_from_arrays(graph_arrays_i) for graph_arrays_i in graph_arrays]
+
+    groups: Dict[tuple, List[int]] = defaultdict(list)
+    for state in range(num_states):
+        groups[state_data.get_canonical_initial_coloring(state)].append(state)
+    groups = list(groups.values())
+
+    with measure("invariant_cascade"):
+        for group in groups:
+            if len(group) > 1:
+                split_by_invariants([graph_arrays[state] for state in group], INVARIANTS, False)
+
+    with measure("canonical_color_refinement"):
+        wl = kwl.CanonicalColorRefinement(False)
+        quotient_matrices = []
+        for graph in graphs:
+            wl.calculate(graph, True)
+            quotient_matrices.append(wl.get_quotient_matrix_string())
+
+    num_conflict_groups = 0
+    with measure("conflict_grouping"):
+        for group in groups:
+            with QuotientMatrixGrouping(1024 * 1024 * 1024) as grouping:
+                for state in group:
+                    grouping.add(quotient_matrices[state], state_data.instance_ids[state].item(), state, int(state_data.v_stars[state]))
+                num_conflict_groups += len(grouping.get_conflict_groups())
+
+    ### Colors are only comparable within the same WL instance, hence one instance per canonical initial coloring group.
+    with measure("1wl"):
+        for group in groups:
+            wl1 = kwl.WeisfeilerLeman(1, False)
+            for state in group:
+                compute_coloring_signature(wl1, graphs[state])
+
+    ### The same colorings, with one refinement of the disjoint union per canonical initial coloring group.
+    with measure("1wl_batched"):
+        for group in groups:
+            compute_coloring_classes([graph_arrays[state] for state in group], False)
+
+    ### The search of the wl driver, with smaller-half refinement of the disjoint union per canonical initial coloring group.
+    with measure("1wl_partition_refinement"):
+        for group in groups:
+            SmallerHalfRefinement([graph_arrays[state] for state in group], False).run()
+
+    # 2-FWL is cubic in the number of vertices, hence it only runs on the first states.
+    num_2fwl_states = 0
+    with measure("2fwl"):
+        for group in groups:
+            fwl2 = kwl.WeisfeilerLeman(2, False)
+            for state in group[:max_num_2fwl_states - num_2fwl_states]:
+                compute_coloring_signature(fwl2, graphs[state])
+                num_2fwl_states += 1
+
+    measurements = instrumentation.to_dict()
+    return {
+        "stages": { stage: {
+            "seconds": measurements["timings"][stage],
+            "peak_memory_usage": measurements["peak_memory_usage_by_stage"].get(stage, memory_usage_after_stage[stage]) } for stage in STAGES },
+        "work": {
+            "num_problems": len(BENCHMARK_PROBLEMS[domain_name]),
+            "num_concrete_states": state_data.num_total_states,
+            "num_abstract_states": num_states,
+            "num_vertices": sum(graph_arrays_i.get_num_vertices() for graph_arrays_i in graph_arrays),
+            "num_edges": sum(graph_arrays_i.get_num_edges() for graph_arrays_i in graph_arrays),
+            "num_initial_groups": len(groups),
+            "num_conflict_groups": num_conflict_groups,
+            "num_2fwl_states": num_2fwl_states } }
+
+
+def run_suite(args: argparse.Namespace) -> Dict[str, Any]:
+    domains = dict()
+    for domain_name in args.domains:
+        repetitions = []
+        for _ in range(args.repetitions):
+            with multiprocessing.get_context("fork").Pool(1) as pool:
+                repetitions.append(pool.apply(run_domain, (domain_name, args.max_num_states, args.max_num_2fwl_states, args.memory_sampling_interval)))
+        stages = dict()
+        for stage in STAGES:
+            stages[stage] = {
+                "seconds": min(repetition["stages"][stage]["seconds"] for repetition in repetitions),
+                "peak_memory_usage": min(repetition["stages"][stage]["peak_memory_usage"] for repetition in repetitions) }
+        domains[domain_name] = { "problems": BENCHMARK_PROBLEMS[domain_name], "work": repetitions[0]["work"], "stages": stages }
+        print(f"[{domain_name}] {repetitions[0]['work']}")
+        for stage, measurement in stages.items():
+            print(f"[{domain_name}]   {stage:<28} {measurement['seconds']:>9.4f} s {measurement['peak_memory_usage']:>7.0f} MiB")
+    return {
+        "version": BENCHMARK_FORMAT_VERSION,
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "pymimir": get_version("pymimir"),
+            "pykwl": get_version("pykwl") },
+        "options": {
+            "max_num_states": args.max_num_states,
+            "max_num_2fwl_states": args.max_num_2fwl_states,
+            "repetitions": args.repetitions },
+        "domains": domains }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], args: argparse.Namespace) -> int:
+    """ Print the change per stage and return the number of regressions.
+
+        A stage regresses if it got slower by more than the threshold and by more than the minimum absolute difference,
+        or if its peak memory usage grew by more than the memory threshold and by more than the minimum absolute difference.
+        Domains whose work differs, e.g., after a change of the subsets, are skipped.
+    """
+    for key in ["version", "environment", "options"]:
+        if baseline.get(key) != current.get(key):
+            print(f"Warning: {key} differs: {baseline.get(key)} != {current.get(key)}")
+
+    num_regressions = 0
+    for domain_name, current_domain in current["domains"].items():
+        baseline_domain = baseline["domains"].get(domain_name)
+        if baseline_domain is None:
+            print(f"[{domain_name}] not in the baseline")
+            continue
+        if baseline_domain["work"] != current_domain["work"]:
+            print(f"[{domain_name}] skipped because the work differs: {baseline_domain['work']} != {current_domain['work']}")
+            continue
+        for stage, current_measurement in current_domain["stages"].items():
+            baseline_measurement = baseline_domain["stages"].get(stage)
+            if baseline_measurement is None:
+                continue
+            baseline_seconds, current_seconds = baseline_measurement["seconds"], current_measurement["seconds"]
+            slower = current_seconds > baseline_seconds * (1 + args.threshold) and current_seconds - baseline_seconds > args.min_seconds
+            line = f"{'[' + domain_name + ']':<13} {stage:<28} {baseline_seconds:>9.4f} s -> {current_seconds:>9.4f} s ({(current_seconds / baseline_seconds - 1) * 100 if baseline_seconds > 0 else 0.0:+6.1f}%)"
+            baseline_peak, current_peak = baseline_measurement["peak_memory_usage"], current_measurement["peak_memory_usage"]
+            larger = current_peak > baseline_peak * (1 + args.memory_threshold) and current_peak - baseline_peak > args.min_memory
+            line += f" {baseline_peak:>7.0f} MiB -> {current_peak:>7.0f} MiB"
+            if slower or larger:
+                num_regressions += 1
+                line += " REGRESSION"
+            print(line)
+    print(f"Regressions: {num_regressions}")
+    return num_regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark suite over the bundled domains.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks and write the results.")
+    run_parser.add_argument("--output", required=True, help="The JSON file to which the results are written, e.g., a new baseline.")
+    run_parser.add_argument("--domains", nargs="+", default=list(BENCHMARK_PROBLEMS.keys()), choices=list(BENCHMARK_PROBLEMS.keys()), help="The domains to benchmark.")
+    run_parser.add_argument("--repetitions", default=3, help="The number of repetitions per domain.", type=int)
+    run_parser.add_argument("--max-num-states", default=10_000, help="The maximum number of states per problem.", type=int)
+    run_parser.add_argument("--max-num-2fwl-states", default=200, help="The maximum number of states per domain on which 2-FWL runs.", type=int)
+    run_parser.add_argument("--memory-sampling-interval", default=0.01, help="The number of seconds between two samples of the memory usage.", type=float)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare results against a baseline and exit with status 1 on regressions.")
+    compare_parser.add_argument("baseline", help="The JSON file of the baseline.")
+    compare_parser.add_argument("current", help="The JSON file of the results to check.")
+    compare_parser.add_argument("--threshold", default=0.15, help="The relative slowdown of a stage that counts as regression.", type=float)
+    compare_parser.add_argument("--min-seconds", default=0.1, help="Slowdowns of fewer seconds are ignored as noise.", type=float)
+    compare_parser.add_argument("--memory-threshold", default=0.1, help="The relative growth of the peak memory usage of a stage that counts as regression.", type=float)
+    compare_parser.add_argument("--min-memory", default=10.0, help="Growths of the peak memory usage of fewer MiB are ignored as noise.", type=float)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_suite(args)
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.current) as file:
+            current = json.load(file)
+        sys.exit(1 if compare(baseline, current, args) > 0 else 0)
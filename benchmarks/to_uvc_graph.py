@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+
+""" Benchmark the array based object graph conversion against the per element loop.
+
+Example:
+    python benchmarks/to_uvc_graph.py --domain_file_path data/gripper/domain.pddl --problem_file_path data/gripper/p-5-0.pddl
+"""
+
+import argparse
+import sys
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pymimir import StateSpaceOptions, StateSpace, ProblemColorFunction, create_object_graph
+
+from src.pykwl_utils import to_graph_arrays, to_uvc_graph_from_arrays, to_uvc_graph_elementwise
+
+
+def measure(function, object_graphs, repetitions):
+    best = float("inf")
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        for object_graph in object_graphs:
+            function(object_graph)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark to_uvc_graph.")
+    parser.add_argument("--domain_file_path", required=True, help="The path to the domain file.")
+    parser.add_argument("--problem_file_path", required=True, help="The path to the problem file.")
+    parser.add_argument("--max-num-states", default=10_000, help="The maximum number of states.", type=int)
+    parser.add_argument("--repetitions", default=3, help="The number of timed repetitions.", type=int)
+    args = parser.parse_args()
+
+    state_space_options = StateSpaceOptions()
+    state_space_options.max_num_states = args.max_num_states
+    state_space = StateSpace.create(str(Path(args.domain_file_path).absolute()), str(Path(args.problem_file_path).absolute()), state_space_options)
+    if state_space is None:
+        print("State space is none")
+        sys.exit(1)
+
+    color_function = ProblemColorFunction(state_space.get_problem())
+    object_graphs = [create_object_graph(color_function, state_space.get_pddl_factories(), state_space.get_problem(), concrete_state.get_state())
+                     for concrete_state in state_space.get_states()]
+
+    # Both conversions must produce identical graphs.
+    for object_graph in object_graphs:
+        assert str(to_uvc_graph_elementwise(object_graph)) == str(to_uvc_graph_from_arrays(to_graph_arrays(object_graph)))
+
+    graph_arrays = [to_graph_arrays(object_graph) for object_graph in object_graphs]
+
+    elementwise = measure(to_uvc_graph_elementwise, object_graphs, args.repetitions)
+    extraction = measure(to_graph_arrays, object_graphs, args.repetitions)
+    construction = measure(to_uvc_graph_from_arrays, graph_arrays, args.repetitions)
+
+    print(f"Graphs: {len(object_graphs)}, vertices: {sum(g.get_num_vertices() for g in graph_arrays)}, edges: {sum(g.get_num_edges() for g in graph_arrays)}")
+    print(f"Per element loop:      {elementwise:.4f} s")
+    print(f"Array extraction:      {extraction:.4f} s")
+    print(f"Array to kwl graph:    {construction:.4f} s")
+    print(f"Arrays (end to end):   {extraction + construction:.4f} s ({elementwise / (extraction + construction):.2f}x)")
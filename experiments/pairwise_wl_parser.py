@@ -1,30 +1,41 @@
 #! /usr/bin/env python
 
 from lab.parser import Parser
+from results_parser import parse_results
 
 
 def coverage(content, props):
-    props["coverage"] = int("num_instances" in props)
+    # Partial results of a stopped run do not count.
+    props["coverage"] = int("num_instances" in props and props.get("completed", False))
 
 class WLParser(Parser):
-    """
-    2024-05-09 15:31:15,117 - [Results] Ran to completion.
-    2024-05-09 15:31:15,118 - [Results] Domain: /home/dominik/projects/code/weifeiler-lehman-code/data/ferry/domain.pddl
-    2024-05-09 15:31:15,118 - [Results] Configuration: [enable_pruning = False, max_num_states = 1000000, ignore_counting = False, mark_true_goal_atoms = False]
-    2024-05-09 15:31:15,118 - [Results] Table row: [# = 180, #P = 265, #S = 8430, #C = [3, 0], #V = [3, 0], #C/same = [3, 0], #V/same = [3, 0]]
+    """ Reads the results.json file of a run of main.py pairwise-wl, e.g.,
+
+    {
+      "version": 2,
+      "driver": "pairwise-wl",
+      "completed": true,
+      ...
+      "num_instances": 180,
+      "configurations": [
+        {
+          "name": "default",
+          ...
+          "num_final_states": 265,
+          "num_total_states": 8430,
+          "total_conflicts": [3, 0],
+          "value_conflicts": [3, 0],
+          "total_conflicts_same_instance": [3, 0],
+          "value_conflicts_same_instance": [3, 0],
+          ...
+        }
+      ],
+      ...
+    }
     """
     def __init__(self):
         super().__init__()
-        self.add_pattern("num_instances", r".*\[Results\] Table row: \[# = (\d+), .*", type=int)
-        self.add_pattern("num_final_states", r".*\[Results\] Table row: \[# = \d+, #P = (\d+), .*", type=int)
-        self.add_pattern("num_total_states", r".*\[Results\] Table row: \[# = \d+, #P = \d+, #S = (\d+), .*", type=int)
-        self.add_pattern("num_1fwl_total_conflicts", r".*\[Results\] Table row: \[# = \d+, #P = \d+, #S = \d+, #C = \[(\d+), \d+\], .*", type=int)
-        self.add_pattern("num_2fwl_total_conflicts", r".*\[Results\] Table row: \[# = \d+, #P = \d+, #S = \d+, #C = \[\d+, (\d+)\], .*", type=int)
-        self.add_pattern("num_1fwl_total_value_conflicts", r".*\[Results\] Table row: \[# = \d+, #P = \d+, #S = \d+, #C = \[\d+, \d+\], #V = \[(\d+), \d+\], .*", type=int)
-        self.add_pattern("num_2fwl_total_value_conflicts", r".*\[Results\] Table row: \[# = \d+, #P = \d+, #S = \d+, #C = \[\d+, \d+\], #V = \[\d+, (\d+)\], .*", type=int)
-        self.add_pattern("num_1fwl_total_conflicts_same", r".*\[Results\] Table row: \[# = \d+, #P = \d+, #S = \d+, #C = \[\d+, \d+\], #V = \[\d+, \d+\], #C/same = \[(\d+), \d+\], .*", type=int)
-        self.add_pattern("num_2fwl_total_conflicts_same", r".*\[Results\] Table row: \[# = \d+, #P = \d+, #S = \d+, #C = \[\d+, \d+\], #V = \[\d+, \d+\], #C/same = \[\d+, (\d+)\], .*", type=int)
-        self.add_pattern("num_1fwl_total_value_conflicts_same", r".*\[Results\] Table row: \[# = \d+, #P = \d+, #S = \d+, #C = \[\d+, \d+\], #V = \[\d+, \d+\], #C/same = \[\d+, \d+\], #V/same = \[(\d+), \d+\]\]", type=int)
-        self.add_pattern("num_2fwl_total_value_conflicts_same", r".*\[Results\] Table row: \[# = \d+, #P = \d+, #S = \d+, #C = \[\d+, \d+\], #V = \[\d+, \d+\], #C/same = \[\d+, \d+\], #V/same = \[\d+, (\d+)\]\]", type=int)
+        # Must come first such that coverage sees the parsed properties.
+        self.add_function(parse_results, file="results.json")
 
         self.add_function(coverage)
@@ -0,0 +1,58 @@
+import json
+
+
+SUPPORTED_RESULTS_FORMAT_VERSIONS = [2]
+
+
+def parse_configuration_results(results, props, prefix):
+    for key in ["completed", "fraction_processed_partitions", "num_final_states", "num_total_states", "num_initial_partitions", "num_resumed_partitions", "num_conflict_records"]:
+        if key in results:
+            props[f"{prefix}{key}"] = results[key]
+
+    # Configurations that a stopped run did not start have no counters.
+    if "total_conflicts" not in results:
+        return
+
+    for k_index, name in enumerate(["1fwl", "2fwl"]):
+        props[f"{prefix}num_{name}_total_conflicts"] = results["total_conflicts"][k_index]
+        props[f"{prefix}num_{name}_total_value_conflicts"] = results["value_conflicts"][k_index]
+        if "max_num_iterations" in results:
+            props[f"{prefix}num_{name}_iterations"] = results["max_num_iterations"][k_index]
+        if "total_conflicts_same_instance" in results:
+            props[f"{prefix}num_{name}_total_conflicts_same"] = results["total_conflicts_same_instance"][k_index]
+            props[f"{prefix}num_{name}_total_value_conflicts_same"] = results["value_conflicts_same_instance"][k_index]
+
+    parse_instrumentation(results, props, prefix)
+
+
+def parse_instrumentation(results, props, prefix):
+    for stage, seconds in results["timings"].items():
+        props[f"{prefix}time_{stage}"] = seconds
+    for counter, amount in results.get("counters", dict()).items():
+        props[f"{prefix}num_{counter}"] = amount
+    for stage, peak in results.get("peak_memory_usage_by_stage", dict()).items():
+        props[f"{prefix}peak_memory_usage_{stage}"] = peak
+
+
+def parse_results(content, props):
+    """ Copy the counters of the results.json file written by main.py into the properties.
+
+    A run with a single configuration sets the properties without prefix.
+    A run with several configurations prefixes the properties of each configuration with its name, e.g., ignore-counting_num_1fwl_total_conflicts.
+    A run that was stopped early has completed set to False and its counters cover fraction_processed_partitions of the partitions.
+    """
+    results = json.loads(content)
+    if results.get("version") not in SUPPORTED_RESULTS_FORMAT_VERSIONS:
+        props.add_unexplained_error(f"unsupported results format version {results.get('version')}")
+        return
+
+    for key in ["completed", "stop_reason", "fraction_processed_partitions", "num_instances", "peak_memory_usage"]:
+        if key in results:
+            props[key] = results[key]
+
+    parse_instrumentation(results, props, "")
+
+    configurations = results["configurations"]
+    for configuration in configurations:
+        prefix = "" if len(configurations) == 1 else f"{configuration['name']}_"
+        parse_configuration_results(configuration, props, prefix)
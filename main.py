@@ -11,7 +11,7 @@ def add_max_num_states_options(arg_parser: argparse.ArgumentParser):
     arg_parser.add_argument("--max-num-states", default=100_000, help="The maximum number of states.", type=int)
 
 def add_enable_pruning_options(arg_parser: argparse.ArgumentParser):
-    arg_parser.add_argument("--enable-pruning", action="store_true", help="If specified, only a single representative for each equivalence is kept in a breadth-first-search.")
+    arg_parser.add_argument("--enable-pruning", action="store_true", help="If specified, only a single representative for each equivalence is kept in a breadth-first-search. --max-num-states then limits the number of representatives and #S counts the generated states.")
 
 def add_pddl_options(arg_parser: argparse.ArgumentParser):
     arg_parser.add_argument("--domain_file_path", required=True, help="The path to the domain file.")
@@ -22,6 +22,51 @@ def add_verbosity_option(arg_parser: argparse.ArgumentParser):
     level_help = "Set log level for {0}. Allowed values: {1}".format
     arg_parser.add_argument("--verbosity", type=str, choices=log_levels, default="INFO", help=level_help("src", log_levels))
 
+def add_jobs_option(arg_parser: argparse.ArgumentParser, help: str):
+    arg_parser.add_argument("--jobs", default=1, help=help, type=int)
+
+def add_count_only_options(arg_parser: argparse.ArgumentParser):
+    arg_parser.add_argument("--count-only", action="store_true", help="If specified, count conflicts without writing every pair of conflicting states.")
+    arg_parser.add_argument("--num-example-pairs", default=0, help="The maximum number of example pairs written per conflict class in count-only mode.", type=int)
+
+def add_conflict_sink_options(arg_parser: argparse.ArgumentParser):
+    arg_parser.add_argument("--conflicts-file", default="conflicts.jsonl", help="The JSON lines file to which pairs of conflicting states are written.")
+    arg_parser.add_argument("--max-num-conflict-records", default=10_000, help="The maximum number of pairs of conflicting states written to the conflicts file.", type=int)
+
+def add_results_option(arg_parser: argparse.ArgumentParser):
+    arg_parser.add_argument("--results-file", default="results.json", help="The JSON file to which the results of the run are written.")
+
+def add_data_cache_option(arg_parser: argparse.ArgumentParser):
+    arg_parser.add_argument("--data-cache-directory", default=None, help="If specified, the state data generated with pymimir is stored in and loaded from this directory.")
+
+def add_soft_time_limit_option(arg_parser: argparse.ArgumentParser):
+    arg_parser.add_argument("--soft-time-limit", default=None, help="If specified, stop after this many seconds and write partial results, like on SIGTERM or SIGXCPU. Set it below the hard time limit such that there is time left to write the results.", type=float)
+
+def add_instrumentation_options(arg_parser: argparse.ArgumentParser):
+    arg_parser.add_argument("--trace-file", default=None, help="If specified, the time spans of the stages and the memory usage are written to this file in the Chrome trace event format, e.g., for chrome://tracing or https://ui.perfetto.dev.")
+    arg_parser.add_argument("--memory-sampling-interval", default=0.1, help="The number of seconds between two samples of the memory usage that determine the peak memory usage of each stage. 0 disables the sampling.", type=float)
+
+def get_trace_file_path(args: argparse.Namespace):
+    return Path(args.trace_file).absolute() if args.trace_file is not None else None
+
+def add_graph_cache_options(arg_parser: argparse.ArgumentParser):
+    arg_parser.add_argument("--graph-cache-size", default=10_000, help="The maximum number of converted graphs kept in memory.", type=int)
+    arg_parser.add_argument("--graph-cache-memory", default=1024, help="The maximum estimated memory in MiB of converted graphs kept in memory.", type=int)
+
+def add_configurations_option(arg_parser: argparse.ArgumentParser):
+    arg_parser.add_argument("--configurations", nargs="+", default=None, help="Evaluate each configuration, e.g., default ignore-counting mark-true-goal-atoms mark-true-goal-atoms+ignore-counting, on data generated once. Replaces --ignore-counting and --mark-true-goal-atoms.")
+
+def get_configurations(arg_parser: argparse.ArgumentParser, args: argparse.Namespace):
+    from src.configuration import Configuration, parse_configuration
+    if args.configurations is None:
+        return [Configuration(args.ignore_counting, args.mark_true_goal_atoms)]
+    if args.ignore_counting or args.mark_true_goal_atoms:
+        arg_parser.error("--configurations cannot be combined with --ignore-counting or --mark-true-goal-atoms")
+    try:
+        return [parse_configuration(description) for description in args.configurations]
+    except ValueError as error:
+        arg_parser.error(str(error))
+
 def add_dump_dot_option(arg_parser: argparse.ArgumentParser):
     arg_parser.add_argument("--dump-dot", action="store_true", help="If specified, the graph dot representations will be written to files.")
 
@@ -41,6 +86,16 @@ if __name__ == "__main__":
     wl_parser.add_argument("--ignore-counting", action="store_true", help="Disallow counting quantifiers.")
     wl_parser.add_argument("--mark-true-goal-atoms", action="store_true", help="If specified, mark true and false goal atoms.")
     wl_parser.add_argument("--terminate-early", action="store_true", help="If specified, terminate if colors distinguish partitions.")
+    add_jobs_option(wl_parser, "The number of worker processes that refine initial partitions in parallel.")
+    add_count_only_options(wl_parser)
+    add_conflict_sink_options(wl_parser)
+    add_results_option(wl_parser)
+    add_data_cache_option(wl_parser)
+    add_configurations_option(wl_parser)
+    add_soft_time_limit_option(wl_parser)
+    add_instrumentation_options(wl_parser)
+    wl_parser.add_argument("--escalate", action="store_true", help="If specified, skip 2-FWL on the initial partitions that 1-WL splits into single states within no more iterations than 2-FWL needs on the others. The results are the same as without it.")
+    wl_parser.add_argument("--wl1-backend", choices=["pykwl", "partition-refinement"], default="pykwl", help="The 1-WL implementation. pykwl refines each branch of the search with full rounds, partition-refinement refines all graphs of a canonical initial coloring group at once and only revisits the neighbors of vertices whose color changed.")
 
     # Sub parser 2: pairwise-wl
     pairwise_wl_parser = subparsers.add_parser("pairwise-wl", help="k-WL abstraction generator.")
@@ -50,6 +105,23 @@ if __name__ == "__main__":
     add_enable_pruning_options(pairwise_wl_parser)
     pairwise_wl_parser.add_argument("--ignore-counting", action="store_true", help="Disallow counting quantifiers.")
     pairwise_wl_parser.add_argument("--mark-true-goal-atoms", action="store_true", help="If specified, mark true and false goal atoms.")
+    add_graph_cache_options(pairwise_wl_parser)
+    add_jobs_option(pairwise_wl_parser, "The number of worker processes that validate canonical initial coloring groups in parallel.")
+    pairwise_wl_parser.add_argument("--instance-batch-memory", default=None, help="If specified, state spaces are created in batches that grow the memory usage by at most about this many MiB, and each batch is released after its states are reduced to compact records.", type=int)
+    pairwise_wl_parser.add_argument("--certificate-index", default=None, help="If specified, the abstract states of each instance are stored in this SQLite file and only new or changed instances are processed with pymimir.")
+    pairwise_wl_parser.add_argument("--checkpoint-file", default=None, help="If specified, the progress of the validation is stored in this file and a restarted run with the same inputs and options skips the completed canonical initial coloring groups.")
+    pairwise_wl_parser.add_argument("--checkpoint-interval", default=60.0, help="The minimum number of seconds between two writes of the checkpoint file.", type=float)
+    pairwise_wl_parser.add_argument("--wl1-backend", choices=["numpy", "pykwl"], default="numpy", help="The 1-WL implementation. numpy refines the graphs of all conflict groups of a canonical initial coloring group together as one disjoint union, pykwl colors one graph at a time.")
+    pairwise_wl_parser.add_argument("--invariant-cascade", nargs="*", choices=["degrees", "color-pair-edges", "2-hop"], default=["degrees", "color-pair-edges", "2-hop"], help="The invariants of 1-WL that split each canonical initial coloring group, in this order, before canonical color refinement. Only states that share their values with another state are refined. Without values, the cascade is disabled.")
+    pairwise_wl_parser.add_argument("--individualization-budget", default=1_000_000, help="Before 2-FWL, 1-WL refines one copy of each state of a 1-WL conflict per vertex, with the neighbors of the vertex individualized, and only states that this does not separate are colored with 2-FWL. This is the maximum number of vertices of these copies, i.e., the sum of the squared numbers of vertices of the states, per 1-WL conflict. Larger conflicts skip the check, and 0 disables it.", type=int)
+    pairwise_wl_parser.add_argument("--grouping-memory-budget", default=1024, help="The memory budget in MiB for grouping states by quotient matrix before records are spilled to disk.", type=int)
+    add_count_only_options(pairwise_wl_parser)
+    add_conflict_sink_options(pairwise_wl_parser)
+    add_results_option(pairwise_wl_parser)
+    add_data_cache_option(pairwise_wl_parser)
+    add_configurations_option(pairwise_wl_parser)
+    add_soft_time_limit_option(pairwise_wl_parser)
+    add_instrumentation_options(pairwise_wl_parser)
 
     # Sub parser 3: gnn
     gnn_parser = subparsers.add_parser("gnn", help="GNN trainer.")
@@ -67,17 +139,49 @@ if __name__ == "__main__":
             args.verbosity,
             args.enable_pruning,
             args.max_num_states,
-            args.ignore_counting,
-            args.mark_true_goal_atoms)
+            get_configurations(wl_parser, args),
+            num_jobs=args.jobs,
+            escalate=args.escalate,
+            count_only=args.count_only,
+            num_example_pairs=args.num_example_pairs,
+            conflicts_file_path=Path(args.conflicts_file).absolute(),
+            max_num_conflict_records=args.max_num_conflict_records,
+            results_file_path=Path(args.results_file).absolute(),
+            data_cache_directory=Path(args.data_cache_directory).absolute() if args.data_cache_directory is not None else None,
+            soft_time_limit=args.soft_time_limit,
+            trace_file_path=get_trace_file_path(args),
+            memory_sampling_interval=args.memory_sampling_interval,
+            wl1_backend=args.wl1_backend)
     elif args.type == "pairwise-wl":
+        if args.certificate_index is not None and (args.enable_pruning or args.instance_batch_memory is not None):
+            pairwise_wl_parser.error("--certificate-index cannot be combined with --enable-pruning or --instance-batch-memory")
         from src.pairwise_wl_analysis import Driver
         driver = Driver(
             Path(args.data_path).absolute(),
             args.verbosity,
             args.enable_pruning,
             args.max_num_states,
-            args.ignore_counting,
-            args.mark_true_goal_atoms)
+            get_configurations(pairwise_wl_parser, args),
+            graph_cache_size=args.graph_cache_size,
+            graph_cache_memory=args.graph_cache_memory,
+            grouping_memory_budget=args.grouping_memory_budget,
+            num_jobs=args.jobs,
+            count_only=args.count_only,
+            num_example_pairs=args.num_example_pairs,
+            conflicts_file_path=Path(args.conflicts_file).absolute(),
+            max_num_conflict_records=args.max_num_conflict_records,
+            results_file_path=Path(args.results_file).absolute(),
+            data_cache_directory=Path(args.data_cache_directory).absolute() if args.data_cache_directory is not None else None,
+            instance_batch_memory=args.instance_batch_memory,
+            certificate_index_path=Path(args.certificate_index).absolute() if args.certificate_index is not None else None,
+            checkpoint_file_path=Path(args.checkpoint_file).absolute() if args.checkpoint_file is not None else None,
+            checkpoint_interval=args.checkpoint_interval,
+            soft_time_limit=args.soft_time_limit,
+            trace_file_path=get_trace_file_path(args),
+            memory_sampling_interval=args.memory_sampling_interval,
+            wl1_backend=args.wl1_backend,
+            invariant_cascade=args.invariant_cascade,
+            individualization_budget=args.individualization_budget)
     elif args.type == "gnn":
         from src.gnn import Driver
         driver = Driver(
@@ -0,0 +1,157 @@
+import json
+import sqlite3
+
+import numpy as np
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .pykwl_utils import GraphArrays
+
+
+# Increment whenever the schema or the meaning of the stored values changes.
+CERTIFICATE_INDEX_FORMAT_VERSION = 2
+
+
+@dataclass
+class IndexedInstance:
+    """ Summary of one problem file. Instances whose state space or abstraction could not be created are stored as not included.
+    """
+    included: bool
+    num_concrete_states: int
+    num_abstract_states: int
+    problem_file_path: str
+    goal: Dict[str, List[str]]
+    static_atoms: List[str]
+    atoms: List[str]  # the fluent and derived atoms of the states, referenced by IndexedState
+
+
+@dataclass
+class IndexedState:
+    """ Everything the analyses need to know about one abstract state of an instance.
+    """
+    state_id: int
+    certificate_key: bytes
+    v_star: float
+    canonical_initial_coloring: List[int]
+    graph: GraphArrays
+    state_index: int
+    fluent_atoms: List[int]
+    derived_atoms: List[int]
+
+
+class CertificateIndex:
+    """ Persistent SQLite index of the abstract states of single instances.
+
+        Instances are identified by file path, content hash, and an options key that covers everything else that affects the states.
+        The certificate keys identify isomorphic states across instances, hence new instances can be checked against the stored ones
+        without recreating their state spaces.
+    """
+    def __init__(self, file_path: Path):
+        self._file_path = file_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(file_path), timeout=600)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            # Each instance is one transaction. With WAL, a crash can lose the last transactions but never corrupt the index.
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+            ### The options keys cover the format version, but the tables of older versions have different columns.
+            if self._connection.execute("PRAGMA user_version").fetchone()[0] != CERTIFICATE_INDEX_FORMAT_VERSION:
+                self._connection.execute("DROP TABLE IF EXISTS instances")
+                self._connection.execute("DROP TABLE IF EXISTS states")
+                self._connection.execute(f"PRAGMA user_version = {CERTIFICATE_INDEX_FORMAT_VERSION}")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS instances (
+                    file_path TEXT NOT NULL,
+                    options_key TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    included INTEGER NOT NULL,
+                    num_concrete_states INTEGER NOT NULL,
+                    num_abstract_states INTEGER NOT NULL,
+                    problem_file_path TEXT NOT NULL,
+                    goal TEXT NOT NULL,
+                    static_atoms TEXT NOT NULL,
+                    atoms TEXT NOT NULL,
+                    PRIMARY KEY (file_path, options_key))""")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS states (
+                    file_path TEXT NOT NULL,
+                    options_key TEXT NOT NULL,
+                    state_id INTEGER NOT NULL,
+                    certificate_key BLOB NOT NULL,
+                    v_star REAL NOT NULL,
+                    canonical_initial_coloring BLOB NOT NULL,
+                    vertex_colors BLOB NOT NULL,
+                    indptr BLOB NOT NULL,
+                    indices BLOB NOT NULL,
+                    state_index INTEGER NOT NULL,
+                    fluent_atoms BLOB NOT NULL,
+                    derived_atoms BLOB NOT NULL,
+                    PRIMARY KEY (file_path, options_key, state_id))""")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS states_by_certificate_key ON states (options_key, certificate_key)")
+
+    def get_instance(self, file_path: str, options_key: str, content_hash: str) -> Optional[IndexedInstance]:
+        """ Return the instance or None if it is not indexed or if the file changed since.
+        """
+        row = self._connection.execute(
+            "SELECT included, num_concrete_states, num_abstract_states, problem_file_path, goal, static_atoms, atoms FROM instances WHERE file_path = ? AND options_key = ? AND content_hash = ?",
+            (file_path, options_key, content_hash)).fetchone()
+        if row is None:
+            return None
+        included, num_concrete_states, num_abstract_states, problem_file_path, goal, static_atoms, atoms = row
+        return IndexedInstance(bool(included), num_concrete_states, num_abstract_states, problem_file_path, json.loads(goal), json.loads(static_atoms), json.loads(atoms))
+
+    def put_instance(self, file_path: str, options_key: str, content_hash: str, instance: IndexedInstance, states: List[IndexedState]):
+        """ Replace the instance and its states in a single transaction.
+        """
+        with self._connection:
+            self._connection.execute("DELETE FROM states WHERE file_path = ? AND options_key = ?", (file_path, options_key))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO instances VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (file_path, options_key, content_hash, int(instance.included), instance.num_concrete_states, instance.num_abstract_states, instance.problem_file_path, json.dumps(instance.goal), json.dumps(instance.static_atoms), json.dumps(instance.atoms)))
+            self._connection.executemany(
+                "INSERT INTO states VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((file_path,
+                  options_key,
+                  state.state_id,
+                  state.certificate_key,
+                  state.v_star,
+                  np.asarray(state.canonical_initial_coloring, dtype=np.int64).tobytes(),
+                  state.graph.vertex_colors.astype(np.int32).tobytes(),
+                  state.graph.indptr.astype(np.int32).tobytes(),
+                  state.graph.indices.astype(np.int32).tobytes(),
+                  state.state_index,
+                  np.asarray(state.fluent_atoms, dtype=np.int32).tobytes(),
+                  np.asarray(state.derived_atoms, dtype=np.int32).tobytes()) for state in states))
+
+    def get_certificate_keys(self, file_path: str, options_key: str) -> List[Tuple[int, bytes]]:
+        """ Return the pairs of state id and certificate key of the instance.
+        """
+        return self._connection.execute(
+            "SELECT state_id, certificate_key FROM states WHERE file_path = ? AND options_key = ? ORDER BY state_id",
+            (file_path, options_key)).fetchall()
+
+    def get_states(self, file_path: str, options_key: str, state_ids: List[int]) -> List[IndexedState]:
+        """ Return the states of the instance with the given ids in ascending order of id.
+        """
+        wanted_state_ids = set(state_ids)
+        states = []
+        for state_id, certificate_key, v_star, canonical_initial_coloring, vertex_colors, indptr, indices, state_index, fluent_atoms, derived_atoms in self._connection.execute(
+                "SELECT state_id, certificate_key, v_star, canonical_initial_coloring, vertex_colors, indptr, indices, state_index, fluent_atoms, derived_atoms FROM states WHERE file_path = ? AND options_key = ? ORDER BY state_id",
+                (file_path, options_key)):
+            if state_id not in wanted_state_ids:
+                continue
+            states.append(IndexedState(
+                state_id,
+                certificate_key,
+                v_star,
+                np.frombuffer(canonical_initial_coloring, dtype=np.int64).tolist(),
+                GraphArrays(np.frombuffer(vertex_colors, dtype=np.int32), np.frombuffer(indptr, dtype=np.int32), np.frombuffer(indices, dtype=np.int32)),
+                state_index,
+                np.frombuffer(fluent_atoms, dtype=np.int32).tolist(),
+                np.frombuffer(derived_atoms, dtype=np.int32).tolist()))
+        return states
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,96 @@
+import json
+import os
+import time
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+
+# Increment whenever the layout or the meaning of the stored values changes.
+CHECKPOINT_FORMAT_VERSION = 1
+
+
+@dataclass
+class ConfigurationProgress:
+    """ Progress of the validation of one configuration.
+
+        The result holds the summed counters of exactly the completed partitions.
+    """
+    num_partitions: int
+    completed_partitions: Set[int] = field(default_factory=set)
+    result: Dict[str, Any] = field(default_factory=dict)
+    num_conflict_records: int = 0
+
+
+class Checkpoint:
+    """ Progress of a run, stored as JSON such that a restarted run can skip the partitions that are already validated.
+
+        The key identifies the state data and the options that affect the counters. A file with a different key is ignored.
+        Together with the progress, the size of the conflicts file is stored such that records written after the
+        last save can be discarded on resume.
+    """
+    def __init__(self, file_path: Optional[Path], key: str, save_interval: float):
+        self._file_path = file_path
+        self._key = key
+        self._save_interval = save_interval
+        self._last_save_time = time.monotonic()
+        self.conflicts_file_size: Optional[int] = None
+        self._progress: Dict[str, ConfigurationProgress] = dict()
+
+    @staticmethod
+    def load(file_path: Optional[Path], key: str, save_interval: float) -> "Checkpoint":
+        """ Return the checkpoint stored in the file if it has the key, and an empty checkpoint otherwise.
+        """
+        checkpoint = Checkpoint(file_path, key, save_interval)
+        if file_path is None or not file_path.is_file():
+            return checkpoint
+        with open(file_path) as file:
+            content = json.load(file)
+        if content.get("format_version") != CHECKPOINT_FORMAT_VERSION or content.get("key") != key:
+            return checkpoint
+        checkpoint.conflicts_file_size = content["conflicts_file_size"]
+        for name, progress in content["configurations"].items():
+            checkpoint._progress[name] = ConfigurationProgress(
+                progress["num_partitions"],
+                set(progress["completed_partitions"]),
+                progress["result"],
+                progress["num_conflict_records"])
+        return checkpoint
+
+    def is_resumed(self) -> bool:
+        return self.conflicts_file_size is not None
+
+    def get_progress(self, name: str, num_partitions: int) -> ConfigurationProgress:
+        progress = self._progress.get(name)
+        if progress is None or progress.num_partitions != num_partitions:
+            progress = ConfigurationProgress(num_partitions)
+            self._progress[name] = progress
+        return progress
+
+    def is_save_due(self) -> bool:
+        return self._file_path is not None and time.monotonic() - self._last_save_time >= self._save_interval
+
+    def save(self, conflicts_file_size: int):
+        """ Write the checkpoint atomically. Readers see either the previous or the new checkpoint.
+        """
+        if self._file_path is None:
+            return
+        content = {
+            "format_version": CHECKPOINT_FORMAT_VERSION,
+            "key": self._key,
+            "conflicts_file_size": conflicts_file_size,
+            "configurations": {
+                name: {
+                    "num_partitions": progress.num_partitions,
+                    "completed_partitions": sorted(progress.completed_partitions),
+                    "result": progress.result,
+                    "num_conflict_records": progress.num_conflict_records }
+                for name, progress in self._progress.items() } }
+        temporary_file_path = self._file_path.with_name(self._file_path.name + ".tmp")
+        with open(temporary_file_path, "w") as file:
+            json.dump(content, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_file_path, self._file_path)
+        self._last_save_time = time.monotonic()
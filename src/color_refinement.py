@@ -0,0 +1,144 @@
+import numpy as np
+
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from .pykwl_utils import GraphArrays
+
+
+@dataclass
+class DisjointUnion:
+    """ Disjoint union of undirected vertex colored graphs in CSR format.
+
+        The vertices of graph i are graph_offsets[i], ..., graph_offsets[i + 1] - 1.
+    """
+    vertex_colors: np.ndarray  # int64, shape (n,)
+    indptr: np.ndarray         # int64, shape (n + 1,)
+    indices: np.ndarray        # int64, shape (2m,)
+    graph_offsets: np.ndarray  # int64, shape (g + 1,)
+
+    def get_num_graphs(self) -> int:
+        return len(self.graph_offsets) - 1
+
+    def get_num_vertices(self) -> int:
+        return len(self.vertex_colors)
+
+    def get_sources(self) -> np.ndarray:
+        return np.repeat(np.arange(self.get_num_vertices(), dtype=np.int64), np.diff(self.indptr))
+
+
+def create_disjoint_union(graphs: List[GraphArrays]) -> DisjointUnion:
+    graph_offsets = np.zeros(len(graphs) + 1, dtype=np.int64)
+    np.cumsum([graph.get_num_vertices() for graph in graphs], out=graph_offsets[1:])
+    if graph_offsets[-1] == 0:
+        return DisjointUnion(np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64), graph_offsets)
+
+    vertex_colors = np.concatenate([graph.vertex_colors for graph in graphs]).astype(np.int64)
+    degrees = np.concatenate([np.diff(graph.indptr) for graph in graphs])
+    indptr = np.zeros(len(vertex_colors) + 1, dtype=np.int64)
+    np.cumsum(degrees, out=indptr[1:])
+    ### Shift the neighbors of each graph by the index of its first vertex in the union.
+    num_adjacent = [len(graph.indices) for graph in graphs]
+    indices = np.concatenate([graph.indices for graph in graphs]).astype(np.int64) + np.repeat(graph_offsets[:-1], num_adjacent)
+    return DisjointUnion(vertex_colors, indptr, indices, graph_offsets)
+
+
+def _rank_colors_and_hashes(colors: np.ndarray, num_colors: int, hashes: np.ndarray) -> Tuple[np.ndarray, int]:
+    """ Return dense ranks of the pairs of colors and hashes and the number of distinct pairs.
+
+        Both are packed into one 64 bit key, the color in the high bits and the high bits of the hash in the low bits,
+        hence vertices of different colors never get the same rank.
+    """
+    color_bits = max(1, (num_colors - 1).bit_length())
+    keys = (colors.astype(np.uint64) << np.uint64(64 - color_bits)) | (hashes >> np.uint64(color_bits))
+    unique_keys, ranks = np.unique(keys, return_inverse=True)
+    return ranks.reshape(-1).astype(np.int64), len(unique_keys)
+
+
+def _get_neighbor_colors(union: DisjointUnion, sources: np.ndarray, colors: np.ndarray, num_colors: int, ignore_counting: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """ Return the boundaries of the neighborhoods of the vertices and the colors of the neighbors.
+
+        If ignore_counting is true, each color occurs at most once per vertex.
+    """
+    neighbor_colors = colors[union.indices]
+    if not ignore_counting:
+        return union.indptr, neighbor_colors
+    keys = np.unique(sources * num_colors + neighbor_colors)
+    boundaries = np.zeros(union.get_num_vertices() + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // num_colors, minlength=union.get_num_vertices()), out=boundaries[1:])
+    return boundaries, keys % num_colors
+
+
+def _hash_neighbor_colors(boundaries: np.ndarray, neighbor_colors: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """ Return the sum of the weights of the neighbor colors of each vertex modulo 2^64.
+    """
+    sums = np.zeros(len(neighbor_colors) + 1, dtype=np.uint64)
+    np.cumsum(weights[neighbor_colors], out=sums[1:])
+    return sums[boundaries[1:]] - sums[boundaries[:-1]]
+
+
+def is_stable_coloring(sources: np.ndarray, neighbor_colors: np.ndarray, colors: np.ndarray, num_colors: int) -> bool:
+    """ Return true iff all vertices of the same color have the same multiset of neighbor colors.
+
+        Each (color, neighbor color, multiplicity) triple must occur at every vertex of the color.
+    """
+    keys, multiplicities = np.unique(sources * num_colors + neighbor_colors, return_counts=True)
+    if len(keys) == 0:
+        return True
+    triples = np.stack([colors[keys // num_colors], keys % num_colors, multiplicities])
+    num_multiplicities = int(multiplicities.max()) + 1
+    if num_colors * num_colors * num_multiplicities < 2 ** 63:
+        ### Pack the triples into one key, which is much faster to sort.
+        packed_triples, num_vertices_per_triple = np.unique((triples[0] * num_colors + triples[1]) * num_multiplicities + triples[2], return_counts=True)
+        triple_colors = packed_triples // num_multiplicities // num_colors
+    else:
+        unique_triples, num_vertices_per_triple = np.unique(triples, axis=1, return_counts=True)
+        triple_colors = unique_triples[0]
+    return bool(np.all(num_vertices_per_triple == np.bincount(colors, minlength=num_colors)[triple_colors]))
+
+
+def refine_colors(union: DisjointUnion, ignore_counting: bool, seed: int = 0) -> Tuple[np.ndarray, int]:
+    """ Run 1-WL on all graphs of the union at once until the coloring of the union is stable.
+
+        Return the final color of each vertex and the number of iterations.
+        The new color of a vertex is its current color together with the multiset of colors of its neighbors,
+        or the set of colors of its neighbors if ignore_counting is true.
+        Multisets are compared by sums of random 64 bit weights per color, which can only merge colors that 1-WL distinguishes.
+        The refinement stops once the coloring is verified to be stable, hence the final coloring is exact.
+        Colors are shared by all graphs of the union, hence they are only comparable within one union.
+    """
+    rng = np.random.default_rng(seed)
+    _, colors = np.unique(union.vertex_colors, return_inverse=True)
+    colors = colors.reshape(-1).astype(np.int64)
+    num_colors = int(colors.max()) + 1 if len(colors) > 0 else 0
+    sources = union.get_sources()
+    num_iterations = 0
+    while True:
+        num_iterations += 1
+        boundaries, neighbor_colors = _get_neighbor_colors(union, sources, colors, num_colors, ignore_counting)
+        weights = rng.integers(0, np.iinfo(np.uint64).max, num_colors, dtype=np.uint64, endpoint=True)
+        hashes = _hash_neighbor_colors(boundaries, neighbor_colors, weights)
+        next_colors, num_next_colors = _rank_colors_and_hashes(colors, num_colors, hashes)
+        ### The current color is part of the new color, hence the coloring only gets finer.
+        # A collision of the weights could hide a split, hence an unchanged number of colors is verified before stopping.
+        if num_next_colors == num_colors and is_stable_coloring(np.repeat(np.arange(union.get_num_vertices(), dtype=np.int64), np.diff(boundaries)), neighbor_colors, colors, num_colors):
+            return colors, num_iterations
+        colors, num_colors = next_colors, num_next_colors
+
+
+def compute_coloring_classes(graphs: List[GraphArrays], ignore_counting: bool) -> Tuple[np.ndarray, int]:
+    """ Return the index of the 1-WL coloring class of each graph and the number of iterations.
+
+        Two graphs get the same index if and only if their final colorings have the same color histogram.
+        All graphs are refined together as one disjoint union.
+    """
+    union = create_disjoint_union(graphs)
+    colors, num_iterations = refine_colors(union, ignore_counting)
+    num_colors = int(colors.max()) + 1 if len(colors) > 0 else 1
+    graph_ids = np.repeat(np.arange(union.get_num_graphs(), dtype=np.int64), np.diff(union.graph_offsets))
+    sorted_colors = np.sort(graph_ids * num_colors + colors) % num_colors
+    ### The sorted colors of a graph are its histogram, and graphs with different numbers of vertices get keys of different lengths.
+    class_ids: Dict[bytes, int] = dict()
+    graph_offsets = union.graph_offsets.tolist()
+    graph_class_ids = [class_ids.setdefault(sorted_colors[begin:end].tobytes(), len(class_ids)) for begin, end in zip(graph_offsets[:-1], graph_offsets[1:])]
+    return np.array(graph_class_ids, dtype=np.int64), num_iterations
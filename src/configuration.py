@@ -0,0 +1,36 @@
+from dataclasses import dataclass
+from typing import Dict, List
+
+
+@dataclass(frozen=True)
+class Configuration:
+    """ A variant of the analysis. Variants with the same mark_true_goal_atoms share the generated state data.
+    """
+    ignore_counting: bool = False
+    mark_true_goal_atoms: bool = False
+
+    def get_name(self) -> str:
+        options = [name for name, enabled in [("mark-true-goal-atoms", self.mark_true_goal_atoms), ("ignore-counting", self.ignore_counting)] if enabled]
+        return "+".join(options) if options else "default"
+
+    def to_dict(self) -> Dict[str, bool]:
+        return { "ignore_counting": self.ignore_counting, "mark_true_goal_atoms": self.mark_true_goal_atoms }
+
+
+def parse_configuration(description: str) -> Configuration:
+    """ Parse a configuration name such as default, ignore-counting, or mark-true-goal-atoms+ignore-counting.
+    """
+    options = set(description.split("+")) - {"default"}
+    unknown_options = options - {"ignore-counting", "mark-true-goal-atoms"}
+    if unknown_options:
+        raise ValueError(f"Unknown options in configuration {description}: {', '.join(sorted(unknown_options))}")
+    return Configuration("ignore-counting" in options, "mark-true-goal-atoms" in options)
+
+
+def group_by_mark_true_goal_atoms(configurations: List[Configuration]) -> Dict[bool, List[Configuration]]:
+    """ Group the configurations by the state data they need, in order of first occurrence.
+    """
+    groups: Dict[bool, List[Configuration]] = dict()
+    for configuration in configurations:
+        groups.setdefault(configuration.mark_true_goal_atoms, []).append(configuration)
+    return groups
@@ -0,0 +1,47 @@
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from itertools import chain, combinations, islice, product
+from typing import Any, Callable, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+
+def count_pairs(n: int) -> int:
+    return n * (n - 1) // 2
+
+
+@dataclass
+class ConflictCounts:
+    """ Number of pairs of states in a class of states that WL cannot distinguish.
+    """
+    total: int = 0
+    value: int = 0
+    total_same_instance: int = 0
+    value_same_instance: int = 0
+
+
+def count_conflicts(v_stars: Sequence[int], instance_ids: Optional[Sequence[int]] = None) -> ConflictCounts:
+    """ Count the pairs in a class of indistinguishable states from histograms instead of enumerating the pairs.
+
+        Pairs with different v* are value conflicts, i.e., all pairs minus the pairs with equal v*.
+    """
+    conflict_counts = ConflictCounts()
+    conflict_counts.total = count_pairs(len(v_stars))
+    conflict_counts.value = conflict_counts.total - sum(count_pairs(count) for count in Counter(v_stars).values())
+    if instance_ids is not None:
+        conflict_counts.total_same_instance = sum(count_pairs(count) for count in Counter(instance_ids).values())
+        conflict_counts.value_same_instance = conflict_counts.total_same_instance - sum(count_pairs(count) for count in Counter(zip(instance_ids, v_stars)).values())
+    return conflict_counts
+
+
+def sample_conflict_pairs(conflict_class: List[Any], get_v_star: Callable[[Any], Hashable], max_num_pairs: int) -> Iterator[Tuple[Any, Any]]:
+    """ Yield at most max_num_pairs pairs of the class, value conflicts first.
+
+        Pairs are generated lazily, hence the cost is independent of the size of the class.
+    """
+    groups = defaultdict(list)
+    for element in conflict_class:
+        groups[get_v_star(element)].append(element)
+    groups = list(groups.values())
+
+    value_conflict_pairs = chain.from_iterable(product(group_1, group_2) for group_1, group_2 in combinations(groups, 2))
+    other_pairs = chain.from_iterable(combinations(group, 2) for group in groups)
+    return islice(chain(value_conflict_pairs, other_pairs), max_num_pairs)
@@ -0,0 +1,61 @@
+import json
+import multiprocessing
+import os
+
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+
+class ConflictSink:
+    """ Writes pairs of conflicting states as JSON lines.
+
+        Records are only formatted if they are actually written and at most max_num_records records are written.
+        The limit is shared with forked worker processes. Each record is appended with a single write,
+        hence records of different processes do not interleave.
+        If resume_file_size is given, an existing file is truncated to that size instead of being emptied.
+    """
+    def __init__(self, file_path: Optional[Path], max_num_records: int, resume_file_size: Optional[int] = None):
+        self._file_path = file_path
+        self._max_num_records = max_num_records if file_path is not None else 0
+        self._num_records = multiprocessing.get_context("fork").Value("q", 0)
+        self._fd = None
+        if self._max_num_records > 0:
+            self._fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            os.ftruncate(self._fd, min(resume_file_size or 0, os.fstat(self._fd).st_size))
+
+    def write(self, create_record: Callable[[], Dict[str, Any]]) -> bool:
+        """ Write the record returned by create_record unless the limit is reached.
+        """
+        with self._num_records.get_lock():
+            accepted = self._num_records.value < self._max_num_records
+            if accepted:
+                self._num_records.value += 1
+        if not accepted:
+            return False
+        os.write(self._fd, (json.dumps(create_record()) + "\n").encode())
+        return True
+
+    def reset_num_records(self, num_records: int = 0):
+        """ Count records towards the limit anew, e.g., for the next configuration of a run, starting from num_records.
+        """
+        with self._num_records.get_lock():
+            self._num_records.value = num_records
+
+    def sync(self) -> int:
+        """ Flush the written records to disk and return the size of the file.
+        """
+        if self._fd is None:
+            return 0
+        os.fsync(self._fd)
+        return os.fstat(self._fd).st_size
+
+    def get_num_records(self) -> int:
+        return self._num_records.value
+
+    def get_file_path(self) -> Optional[Path]:
+        return self._file_path
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
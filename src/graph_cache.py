@@ -0,0 +1,58 @@
+from collections import OrderedDict
+from typing import Callable, Hashable, Tuple
+
+import pykwl as kwl
+
+
+class GraphCache:
+    """ Bounded LRU cache of converted pykwl graphs.
+
+        Entries are evicted in least recently used order as soon as either
+        the number of entries or the estimated number of bytes exceeds its limit.
+    """
+    def __init__(self, max_num_entries: int, max_num_bytes: int):
+        self._max_num_entries = max_num_entries
+        self._max_num_bytes = max_num_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[kwl.EdgeColoredGraph, int]]" = OrderedDict()
+        self._num_bytes = 0
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evictions = 0
+
+    def get(self, key: Hashable, create: Callable[[], Tuple[kwl.EdgeColoredGraph, int]]) -> kwl.EdgeColoredGraph:
+        """ Return the graph for the key and call create() on a miss.
+
+            create must return the graph together with its estimated size in bytes.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.num_hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+        self.num_misses += 1
+        wl_graph, num_bytes = create()
+        if self._max_num_entries > 0 and num_bytes <= self._max_num_bytes:
+            self._entries[key] = (wl_graph, num_bytes)
+            self._num_bytes += num_bytes
+            self._evict()
+        return wl_graph
+
+    def clear(self):
+        self._entries.clear()
+        self._num_bytes = 0
+
+    def get_num_entries(self) -> int:
+        return len(self._entries)
+
+    def get_num_bytes(self) -> int:
+        return self._num_bytes
+
+    def _evict(self):
+        while len(self._entries) > self._max_num_entries or self._num_bytes > self._max_num_bytes:
+            _, (_, num_bytes) = self._entries.popitem(last=False)
+            self._num_bytes -= num_bytes
+            self.num_evictions += 1
+
+    def __str__(self):
+        return f"[hits = {self.num_hits}, misses = {self.num_misses}, evictions = {self.num_evictions}, entries = {len(self._entries)}, MiB = {self._num_bytes // (1024 * 1024)}]"
@@ -0,0 +1,115 @@
+import numpy as np
+
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from .pykwl_utils import GraphArrays
+from .color_refinement import DisjointUnion, create_disjoint_union
+
+
+# Invariants in the order of the cascade, from cheapest to most expensive.
+INVARIANTS = ["degrees", "color-pair-edges", "2-hop"]
+
+
+def _get_histograms(item_graph_ids: np.ndarray, item_keys: np.ndarray, num_graphs: int) -> List[bytes]:
+    """ Return the sorted keys of the items of each graph as bytes. The items must be ordered by graph.
+    """
+    item_keys = item_keys.astype(np.uint64)
+    order = np.lexsort((item_keys, item_graph_ids))
+    sorted_keys = item_keys[order]
+    boundaries = np.searchsorted(item_graph_ids, np.arange(num_graphs + 1), side="left").tolist()
+    return [sorted_keys[begin:end].tobytes() for begin, end in zip(boundaries[:-1], boundaries[1:])]
+
+
+def _get_adjacent_colors(union: DisjointUnion, ignore_counting: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """ Return the sources and the colors of the targets of the adjacencies of the union.
+
+        If ignore_counting is true, each color occurs at most once per source.
+    """
+    sources = union.get_sources()
+    target_colors = union.vertex_colors[union.indices]
+    if not ignore_counting:
+        return sources, target_colors
+    num_colors = int(union.vertex_colors.max()) + 1
+    keys = np.unique(sources * num_colors + target_colors)
+    return keys // num_colors, keys % num_colors
+
+
+def _compute_degrees(union: DisjointUnion, ignore_counting: bool) -> np.ndarray:
+    """ Return the number of neighbors of each vertex, or of distinct colors of neighbors if ignore_counting is true.
+    """
+    sources, _ = _get_adjacent_colors(union, ignore_counting)
+    return np.bincount(sources, minlength=union.get_num_vertices())
+
+
+def compute_invariants(graphs: List[GraphArrays], invariant: str, ignore_counting: bool) -> List[bytes]:
+    """ Return the value of the invariant for each graph. Graphs with different values are distinguished by 1-WL.
+
+        The colors of the graphs must be comparable, e.g., because the graphs have the same canonical initial coloring.
+
+        degrees: the number of vertices per color and degree.
+        color-pair-edges: the number of adjacencies per pair of colors.
+        2-hop: the number of vertices per color and multiset of colors and degrees of their neighbors, compared by a hash.
+
+        If ignore_counting is true, degrees count distinct colors of neighbors and multisets are sets,
+        such that the invariants are also invariants of 1-WL without counting.
+    """
+    union = create_disjoint_union(graphs)
+    num_graphs, num_vertices = union.get_num_graphs(), union.get_num_vertices()
+    graph_ids = np.repeat(np.arange(num_graphs, dtype=np.int64), np.diff(union.graph_offsets))
+    if num_vertices == 0:
+        return [b""] * num_graphs
+    colors = union.vertex_colors
+    num_colors = int(colors.max()) + 1
+
+    if invariant == "degrees":
+        degrees = _compute_degrees(union, ignore_counting)
+        return _get_histograms(graph_ids, colors * (int(degrees.max()) + 1) + degrees, num_graphs)
+
+    if invariant == "color-pair-edges":
+        sources, target_colors = _get_adjacent_colors(union, ignore_counting)
+        return _get_histograms(graph_ids[sources], colors[sources] * num_colors + target_colors, num_graphs)
+
+    if invariant == "2-hop":
+        ### Neighbors are compared by their color and degree, i.e., their color after one iteration of 1-WL.
+        degrees = _compute_degrees(union, ignore_counting)
+        _, neighbor_types = np.unique(colors * (int(degrees.max()) + 1) + degrees, return_inverse=True)
+        neighbor_types = neighbor_types.reshape(-1)
+        sources, targets = union.get_sources(), union.indices
+        num_types = int(neighbor_types.max()) + 1
+        type_keys = sources * num_types + neighbor_types[targets]
+        if ignore_counting:
+            type_keys = np.unique(type_keys)
+        ### Multisets of types are compared by sums of random 64 bit weights, which can only make different invariants equal.
+        weights = np.random.default_rng(0).integers(0, np.iinfo(np.uint64).max, num_types, dtype=np.uint64, endpoint=True)
+        hashes = np.zeros(num_vertices, dtype=np.uint64)
+        np.add.at(hashes, type_keys // num_types, weights[type_keys % num_types])
+        vertex_keys = hashes ^ weights[neighbor_types]
+        return _get_histograms(graph_ids, vertex_keys, num_graphs)
+
+    raise ValueError(f"Unknown invariant {invariant}.")
+
+
+def split_by_invariants(graphs: List[GraphArrays], invariants: List[str], ignore_counting: bool) -> Tuple[List[List[int]], Dict[str, int]]:
+    """ Split the graphs by a cascade of invariants and return the buckets with more than one graph as indices into graphs.
+
+        Each invariant is only computed for the graphs that share a bucket with another graph after the previous invariants.
+        Also returns the number of graphs that each invariant separated from all other graphs.
+    """
+    buckets = [list(range(len(graphs)))] if len(graphs) > 1 else []
+    num_separated_graphs: Dict[str, int] = dict()
+    for invariant in invariants:
+        candidates = [index for bucket in buckets for index in bucket]
+        if not candidates:
+            break
+        values = compute_invariants([graphs[index] for index in candidates], invariant, ignore_counting)
+        value_by_index = dict(zip(candidates, values))
+        next_buckets = []
+        for bucket in buckets:
+            sub_buckets = defaultdict(list)
+            for index in bucket:
+                sub_buckets[value_by_index[index]].append(index)
+            next_buckets.extend(sub_bucket for sub_bucket in sub_buckets.values() if len(sub_bucket) > 1)
+        num_separated_graphs[invariant] = len(candidates) - sum(len(bucket) for bucket in next_buckets)
+        buckets = next_buckets
+    return buckets, num_separated_graphs
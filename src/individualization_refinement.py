@@ -0,0 +1,61 @@
+import numpy as np
+
+from typing import Dict, List
+
+from .pykwl_utils import GraphArrays
+from .color_refinement import DisjointUnion, create_disjoint_union, refine_colors
+
+
+def _get_class_ids(keys: List[bytes]) -> np.ndarray:
+    class_ids: Dict[bytes, int] = dict()
+    return np.array([class_ids.setdefault(key, len(class_ids)) for key in keys], dtype=np.int64)
+
+
+def get_num_individualized_vertices(graphs: List[GraphArrays]) -> int:
+    """ Return the number of vertices that compute_individualization_classes refines, i.e., one copy of each graph per vertex.
+    """
+    return sum(graph.get_num_vertices() ** 2 for graph in graphs)
+
+
+def _individualize_neighborhoods(graphs: List[GraphArrays]) -> DisjointUnion:
+    """ Return the disjoint union of one copy of each graph per vertex v, in which the neighbors of v get a new color.
+    """
+    copies = create_disjoint_union([graph for graph in graphs for _ in range(graph.get_num_vertices())])
+    if copies.get_num_vertices() == 0:
+        return copies
+    ### The vertex v of a copy is the v-th vertex of the copy.
+    centers = copies.graph_offsets[:-1] + np.concatenate([np.arange(graph.get_num_vertices(), dtype=np.int64) for graph in graphs])
+    begins, ends = copies.indptr[centers], copies.indptr[centers + 1]
+    lengths = ends - begins
+    positions = np.repeat(begins - np.cumsum(lengths) + lengths, lengths) + np.arange(int(lengths.sum()), dtype=np.int64)
+    marks = np.zeros(copies.get_num_vertices(), dtype=np.int64)
+    marks[copies.indices[positions]] = 1
+    return DisjointUnion(copies.vertex_colors * 2 + marks, copies.indptr, copies.indices, copies.graph_offsets)
+
+
+def compute_individualization_classes(graphs: List[GraphArrays], ignore_counting: bool) -> np.ndarray:
+    """ Return the index of a class of each graph such that 2-FWL distinguishes graphs of different classes.
+
+        For each vertex v, 1-WL refines a copy of the graph in which the neighbors of v are individualized as one color.
+        The class of a graph is the multiset of the final color histograms of its copies, or of the sets of final colors if ignore_counting is true.
+        The stable 2-FWL color of a pair (v, u) determines the final 1-WL color of u in the copy of v,
+        hence graphs with the same 2-FWL coloring have the same class.
+        The neighbors of v are individualized instead of v itself because pykwl's 2-FWL does not distinguish the pairs (v, v) initially.
+        The colors of the graphs must be comparable, e.g., because the graphs have the same canonical initial coloring.
+    """
+    copies = _individualize_neighborhoods(graphs)
+    if copies.get_num_vertices() == 0:
+        return _get_class_ids([b""] * len(graphs))
+    colors, _ = refine_colors(copies, ignore_counting)
+    num_colors = int(colors.max()) + 1
+    copy_ids = np.repeat(np.arange(copies.get_num_graphs(), dtype=np.int64), np.diff(copies.graph_offsets))
+    keys = np.unique(copy_ids * num_colors + colors) if ignore_counting else np.sort(copy_ids * num_colors + colors)
+    boundaries = np.searchsorted(keys // num_colors, np.arange(copies.get_num_graphs() + 1), side="left").tolist()
+    sorted_colors = keys % num_colors
+    copy_class_ids = _get_class_ids([sorted_colors[begin:end].tobytes() for begin, end in zip(boundaries[:-1], boundaries[1:])])
+
+    ### The copies of each graph are consecutive, hence the multiset of the classes of its copies is a sorted slice.
+    graph_offsets = np.zeros(len(graphs) + 1, dtype=np.int64)
+    np.cumsum([graph.get_num_vertices() for graph in graphs], out=graph_offsets[1:])
+    graph_offsets = graph_offsets.tolist()
+    return _get_class_ids([np.sort(copy_class_ids[begin:end]).tobytes() for begin, end in zip(graph_offsets[:-1], graph_offsets[1:])])
@@ -0,0 +1,154 @@
+import json
+import os
+import resource
+import threading
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Spans of stages that are shorter than this many seconds are only accumulated, such that hot stages do not flood the trace.
+MIN_TRACE_EVENT_DURATION = 0.001
+
+
+def _get_max_rss() -> float:
+    """ Return the peak resident set size in MiB of this process so far. On Linux, ru_maxrss is reported in KiB. """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class MemorySampler:
+    """ Background thread that samples the resident set size of this process and its children, e.g., forked workers.
+
+        Each sample is attributed to the stages that run at that moment, hence the peak of a stage is the maximum
+        over the samples taken while it ran. Stages that are shorter than the interval may get no sample.
+        Extension code that holds the GIL, e.g., pymimir, blocks the thread, hence Instrumentation.measure
+        additionally records the peak of the process itself whenever it grew during a stage.
+        The thread is started again in forked child processes, where it samples the child.
+    """
+    def __init__(self, interval: float, record_samples: bool = False):
+        self._interval = interval
+        self._record_samples = record_samples
+        self.running_stages: List[Tuple["Instrumentation", str]] = []
+        self.samples: List[Tuple[float, float]] = []  # (perf_counter seconds, MiB), only if record_samples
+        self._start()
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        import psutil
+        self._process = psutil.Process(os.getpid())
+        self.samples = []
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _sample(self) -> float:
+        import psutil
+        rss = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return rss / float(1024 * 1024)
+
+    def _run(self):
+        last_recorded = (0.0, 0.0)
+        while True:
+            rss = self._sample()
+            # The main thread pushes and pops stages concurrently, hence iterate over a copy.
+            for instrumentation, stage in list(self.running_stages):
+                instrumentation._add_memory_sample(stage, rss)
+            now = time.perf_counter()
+            ### Only record samples that differ noticeably from the last one to bound the size of long traces.
+            if self._record_samples and (abs(rss - last_recorded[1]) >= 1.0 or now - last_recorded[0] >= 1.0):
+                self.samples.append((now, rss))
+                last_recorded = (now, rss)
+            time.sleep(self._interval)
+
+
+class Instrumentation:
+    """ Wall clock time and peak memory usage per stage, and named counters.
+
+        Stages can nest, e.g., graphs are converted while colorings are computed, hence the times of stages do not add up.
+        Instrumentations of worker processes are sent to the parent as snapshots and merged.
+    """
+    def __init__(self, sampler: Optional[MemorySampler] = None, category: str = "run"):
+        self._sampler = sampler
+        self._category = category
+        self._seconds: Dict[str, float] = dict()
+        self._peaks: Dict[str, float] = dict()
+        self._counters: Dict[str, int] = dict()
+        self._events: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def measure(self, stage: str):
+        if self._sampler is not None:
+            self._sampler.running_stages.append((self, stage))
+            max_rss = _get_max_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            if self._sampler is not None:
+                self._sampler.running_stages.pop()
+                ### A new peak of the process was reached during the stage.
+                new_max_rss = _get_max_rss()
+                if new_max_rss > max_rss:
+                    self._add_memory_sample(stage, new_max_rss)
+            self._seconds[stage] = self._seconds.get(stage, 0.0) + duration
+            if duration >= MIN_TRACE_EVENT_DURATION:
+                self._events.append({
+                    "name": stage,
+                    "cat": self._category,
+                    "ph": "X",
+                    "ts": start * 1e6,
+                    "dur": duration * 1e6,
+                    "pid": os.getpid(),
+                    "tid": threading.get_native_id() })
+
+    def count(self, counter: str, amount: int = 1):
+        self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def _add_memory_sample(self, stage: str, rss: float):
+        if rss > self._peaks.get(stage, 0.0):
+            self._peaks[stage] = rss
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ Return the times in seconds, the counters, and the peak memory usage in MiB per stage.
+        """
+        return {
+            "timings": dict(self._seconds),
+            "counters": dict(self._counters),
+            "peak_memory_usage_by_stage": dict(self._peaks) }
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        return { **self.to_dict(), "events": list(self._events) }
+
+    def merge(self, snapshot: Dict[str, Any]):
+        """ Add the times and counters of the snapshot and take the maximum of the peaks.
+        """
+        for stage, seconds in snapshot["timings"].items():
+            self._seconds[stage] = self._seconds.get(stage, 0.0) + seconds
+        for counter, amount in snapshot["counters"].items():
+            self.count(counter, amount)
+        for stage, rss in snapshot["peak_memory_usage_by_stage"].items():
+            self._add_memory_sample(stage, rss)
+        self._events.extend(snapshot["events"])
+
+    def get_trace_events(self) -> List[Dict[str, Any]]:
+        return self._events
+
+
+def write_chrome_trace(file_path: Path, instrumentations: List[Instrumentation], sampler: Optional[MemorySampler]):
+    """ Write the spans of all instrumentations and the memory samples in the Chrome trace event format.
+
+        The file can be opened in chrome://tracing or https://ui.perfetto.dev.
+    """
+    events = [event for instrumentation in instrumentations for event in instrumentation.get_trace_events()]
+    if sampler is not None:
+        events.extend({ "name": "memory_usage", "ph": "C", "ts": seconds * 1e6, "pid": os.getpid(), "args": { "MiB": rss } } for seconds, rss in sampler.samples)
+    temporary_file_path = file_path.with_name(file_path.name + ".tmp")
+    with open(temporary_file_path, "w") as file:
+        json.dump({ "traceEvents": events, "displayTimeUnit": "ms" }, file)
+    os.replace(temporary_file_path, file_path)
@@ -1,15 +1,34 @@
 from collections import defaultdict
 from pathlib import Path
-from pymimir import PDDLParser, IApplicableActionGenerator, StateRepository, Problem, State, StateSpacesOptions, StateSpace, FaithfulAbstractState, FaithfulAbstractionsOptions, FaithfulAbstraction, GlobalFaithfulAbstractState, GlobalFaithfulAbstraction, Certificate, SparseNautyGraph, StaticVertexColoredDigraph, ProblemColorFunction, create_object_graph
-from typing import List, Tuple, Dict, Any, MutableSet
+from pymimir import PDDLParser, IApplicableActionGenerator, StateRepository, Problem, State, StateSpaceOptions, StateSpacesOptions, StateSpace, FaithfulAbstractState, FaithfulAbstractionOptions, FaithfulAbstractionsOptions, FaithfulAbstraction, GlobalFaithfulAbstractState, GlobalFaithfulAbstraction, Certificate, SparseNautyGraph, StaticVertexColoredDigraph, ProblemColorFunction, create_object_graph
+from typing import List, Tuple, Dict, Any, MutableSet, Optional
 from itertools import combinations
-from dataclasses import dataclass
-import subprocess
+from dataclasses import asdict, dataclass, field
 
-from .performance import memory_usage
+from .performance import memory_usage, peak_memory_usage
 from .logger import initialize_logger, add_console_handler
-from .pykwl_utils import to_uvc_graph
-
+from .pykwl_utils import to_graph_arrays, to_uvc_graph_from_arrays, estimate_uvc_graph_nbytes, compute_coloring_signature
+from .graph_cache import GraphCache
+from .quotient_matrix_grouping import QuotientMatrixGrouping
+from .parallel import imap_forked
+from .conflict_counting import ConflictCounts, count_conflicts, sample_conflict_pairs
+from .conflict_sink import ConflictSink
+from .results import write_results
+from .state_data import AtomTable, InstanceInformation, StateData, StateDataBuilder, create_instance_information, compute_state_data_digest, compute_state_data_key, load_state_data, save_state_data
+from .configuration import Configuration, group_by_mark_true_goal_atoms
+from .pruned_search import PrunedStateSpace, create_pruned_state_space, compute_certificate_key, compute_graph_certificate, get_certificate_key
+from .certificate_index import CERTIFICATE_INDEX_FORMAT_VERSION, CertificateIndex, IndexedInstance, IndexedState
+from .checkpoint import Checkpoint, ConfigurationProgress
+from .stop_condition import StopCondition, StopRequested
+from .instrumentation import Instrumentation, MemorySampler, write_chrome_trace
+from .color_refinement import compute_coloring_classes
+from .graph_invariants import INVARIANTS, split_by_invariants
+from .individualization_refinement import compute_individualization_classes, get_num_individualized_vertices
+
+import gc
+import hashlib
+import json
+import numpy as np
 import pykwl as kwl
 
 
@@ -27,12 +46,45 @@ class InstanceData:
     num_total_states: int
 
 @dataclass
-class StateInformation:
-    gfa_state: GlobalFaithfulAbstractState
-    v_star: int
+class PartitionResult:
+    """ Conflict counters of one or more partitions. Index 0 refers to 1-WL and index 1 to 2-FWL.
+    """
+    total_conflicts: List[int] = field(default_factory=lambda: [0, 0])
+    value_conflicts: List[int] = field(default_factory=lambda: [0, 0])
+    total_conflicts_same_instance: List[int] = field(default_factory=lambda: [0, 0])
+    value_conflicts_same_instance: List[int] = field(default_factory=lambda: [0, 0])
+    num_spilled_records: int = 0
+    num_graph_cache_hits: int = 0
+    num_graph_cache_misses: int = 0
+
+    def add_conflict_counts(self, k: int, conflict_counts: ConflictCounts):
+        self.total_conflicts[k] += conflict_counts.total
+        self.value_conflicts[k] += conflict_counts.value
+        self.total_conflicts_same_instance[k] += conflict_counts.total_same_instance
+        self.value_conflicts_same_instance[k] += conflict_counts.value_same_instance
+
+    def merge(self, other: "PartitionResult"):
+        for k in range(2):
+            self.total_conflicts[k] += other.total_conflicts[k]
+            self.value_conflicts[k] += other.value_conflicts[k]
+            self.total_conflicts_same_instance[k] += other.total_conflicts_same_instance[k]
+            self.value_conflicts_same_instance[k] += other.value_conflicts_same_instance[k]
+        self.num_spilled_records += other.num_spilled_records
+        self.num_graph_cache_hits += other.num_graph_cache_hits
+        self.num_graph_cache_misses += other.num_graph_cache_misses
+
+
+def _group_indices(keys: List[Any]) -> List[List[int]]:
+    """ Return the indices of equal keys, in the order of their first occurrence.
+    """
+    groups = defaultdict(list)
+    for index, key in enumerate(keys):
+        groups[key].append(index)
+    return list(groups.values())
+
 
 class Driver:
-    def __init__(self, data_path : Path, verbosity: str, enable_pruning: bool, max_num_states: int, ignore_counting: bool, mark_true_goal_atoms: bool):
+    def __init__(self, data_path : Path, verbosity: str, enable_pruning: bool, max_num_states: int, configurations: List[Configuration], *, graph_cache_size: int = 10_000, graph_cache_memory: int = 1024, grouping_memory_budget: int = 1024, num_jobs: int = 1, count_only: bool = False, num_example_pairs: int = 0, conflicts_file_path: Path = Path("conflicts.jsonl"), max_num_conflict_records: int = 10_000, results_file_path: Path = Path("results.json"), data_cache_directory: Optional[Path] = None, instance_batch_memory: Optional[int] = None, certificate_index_path: Optional[Path] = None, checkpoint_file_path: Optional[Path] = None, checkpoint_interval: float = 60.0, soft_time_limit: Optional[float] = None, trace_file_path: Optional[Path] = None, memory_sampling_interval: float = 0.1, wl1_backend: str = "numpy", invariant_cascade: Optional[List[str]] = None, individualization_budget: int = 1_000_000):
         self._domain_file_path = (data_path / "domain.pddl").resolve()
         self._problem_file_paths = [file.resolve() for file in data_path.iterdir() if file.is_file() and file.name != "domain.pddl"]
         self._coloring_function = None
@@ -41,42 +93,78 @@ class Driver:
         self._verbosity = verbosity.upper()
         self._enable_pruning = enable_pruning
         self._max_num_states = max_num_states
-        self._ignore_counting = ignore_counting
-        self._mark_true_goal_literals = mark_true_goal_atoms
+        # Duplicates would only be evaluated twice.
+        self._configurations = list(dict.fromkeys(configurations))
+        self._configuration: Configuration = None
+        self._graph_cache = GraphCache(graph_cache_size, graph_cache_memory * 1024 * 1024)
+        self._grouping_memory_budget = grouping_memory_budget * 1024 * 1024
+        self._num_jobs = num_jobs
+        self._count_only = count_only
+        self._num_example_pairs = num_example_pairs
+        self._conflicts_file_path = conflicts_file_path
+        self._max_num_conflict_records = max_num_conflict_records
+        self._conflict_sink: ConflictSink = None
+        self._results_file_path = results_file_path
+        self._trace_file_path = trace_file_path
+        self._memory_sampler = MemorySampler(memory_sampling_interval, trace_file_path is not None) if memory_sampling_interval > 0 else None
+        self._instrumentation = Instrumentation(self._memory_sampler)
+        self._configuration_instrumentations: List[Instrumentation] = []
+        self._data_cache_directory = data_cache_directory
+        self._instance_batch_memory = instance_batch_memory  # MiB
+        self._certificate_index_path = certificate_index_path
+        self._checkpoint_file_path = checkpoint_file_path
+        self._checkpoint_interval = checkpoint_interval  # seconds
+        self._checkpoint: Checkpoint = None
+        self._stop_condition = StopCondition(soft_time_limit)
+        self._wl1_backend = wl1_backend
+        self._invariant_cascade = list(INVARIANTS) if invariant_cascade is None else invariant_cascade
+        self._individualization_budget = individualization_budget
         add_console_handler(self._logger)
 
 
-    def _generate_data(self) -> MutableSet[GlobalFaithfulAbstractState]:
+    def _create_faithful_abstractions_options(self, mark_true_goal_literals: bool) -> FaithfulAbstractionsOptions:
+        faithful_abstractions_options = FaithfulAbstractionsOptions()
+        faithful_abstractions_options.fa_options.mark_true_goal_literals = mark_true_goal_literals
+        faithful_abstractions_options.fa_options.use_unit_cost_one = True
+        faithful_abstractions_options.fa_options.remove_if_unsolvable = True
+        faithful_abstractions_options.fa_options.max_num_concrete_states = self._max_num_states
+        faithful_abstractions_options.fa_options.max_num_abstract_states = self._max_num_states
+        faithful_abstractions_options.sort_ascending_by_num_states = True
+        return faithful_abstractions_options
+
+    def _create_state_spaces(self) -> Tuple[List[StateSpace], int]:
+        """ Create the state spaces of all instances and return them together with the total number of states.
+        """
         ### 1. Create state spaces to obtain the total number of states.
         state_spaces_options = StateSpacesOptions()
         state_spaces_options.state_space_options.use_unit_cost_one = True
         state_spaces_options.state_space_options.remove_if_unsolvable = True
         state_spaces_options.state_space_options.max_num_states = self._max_num_states
         state_spaces_options.sort_ascending_by_num_states = True
-        state_spaces = StateSpace.create(
-            str(self._domain_file_path),
-            [str(problem_file_path) for problem_file_path in self._problem_file_paths],
-            state_spaces_options)
+        with self._instrumentation.measure("state_spaces"):
+            state_spaces = StateSpace.create(
+                str(self._domain_file_path),
+                [str(problem_file_path) for problem_file_path in self._problem_file_paths],
+                state_spaces_options)
         num_states = sum(state_space.get_num_states() for state_space in state_spaces)
         self._logger.info(f"[Generate data] Total number of states: {num_states}")
-        self._logger.info(f"[Generate data] Peak memory usage: {int(memory_usage())} MiB.")
+        self._logger.info(f"[Generate data] Peak memory usage: {int(peak_memory_usage())} MiB.")
+
+        return state_spaces, num_states
 
+    def _create_state_data(self, state_spaces: List[StateSpace], num_states: int, mark_true_goal_literals: bool) -> Optional[StateData]:
         ### 2. Fetch memory from state spaces to create gfas using the same factories, aag, and ssg.
         memories = []
         for state_space in state_spaces:
             memories.append((state_space.get_problem(), state_space.get_pddl_factories(), state_space.get_aag(), state_space.get_ssg()))
 
         ### 3. Perform pairwise isomorphism reduction across instances.
-        faithful_abstractions_options = FaithfulAbstractionsOptions()
-        faithful_abstractions_options.fa_options.mark_true_goal_literals = self._mark_true_goal_literals
-        faithful_abstractions_options.fa_options.use_unit_cost_one = True
-        faithful_abstractions_options.fa_options.remove_if_unsolvable = True
-        faithful_abstractions_options.fa_options.max_num_concrete_states = self._max_num_states
-        faithful_abstractions_options.fa_options.max_num_abstract_states = self._max_num_states
-        faithful_abstractions_options.sort_ascending_by_num_states = True
-        gfas = GlobalFaithfulAbstraction.create(
-            memories,
-            faithful_abstractions_options)
+        with self._instrumentation.measure("abstractions"):
+            gfas = GlobalFaithfulAbstraction.create(
+                memories,
+                self._create_faithful_abstractions_options(mark_true_goal_literals))
+        if not gfas:
+            return None
 
         ### 4. Create combined data set where each state is non-isomorphic to all other states.
         gfa_states: MutableSet[GlobalFaithfulAbstractState] = set()
@@ -84,221 +172,695 @@ class Driver:
             gfa_states.update(set(gfa.get_states()))
         num_gfa_states = len(gfa_states)
         self._logger.info(f"[Generate data] Total number of gfa states: {num_gfa_states}")
-        self._logger.info(f"[Generate data] Peak memory usage: {int(memory_usage())} MiB.")
+        self._logger.info(f"[Generate data] Peak memory usage: {int(peak_memory_usage())} MiB.")
 
-        ### 5. Group gfa states by canonical initial coloring.
-        # Assumption: if two object graphs have same canonical initial coloring
-        # then they also have same number of vertices and edges.
-        grouped_gfa_states: Dict[Tuple[int], StateInformation] = defaultdict(list)
-        ### Fetch underlying fas to access the representative abstract state.
+        ### 5. Collect the data of the representative states that the analysis needs.
         fas = gfas[0].get_abstractions()
-        for gfa_state in gfa_states:
-            fa_index = gfa_state.get_faithful_abstraction_index()
-            fa = fas[fa_index]
-            fa_state = fa.get_states()[gfa_state.get_faithful_abstract_state_index()]
-            v_star = int(fa.get_goal_distances()[fa_state.get_index()])
-            isomorphism_certificate = fa_state.get_certificate()
-            grouped_gfa_states[tuple(isomorphism_certificate.get_canonical_initial_coloring())].append(StateInformation(gfa_state, v_star))
-        self._logger.info(f"[Generate data] Total number of gfa groups: {len(grouped_gfa_states)}")
-        self._logger.info(f"[Generate data] Peak memory usage: {int(memory_usage())} MiB.")
-
-        ### Important: return gfas since they own the memory to all data.
-        return gfas, grouped_gfa_states, num_states, num_gfa_states
-
-    def _validate_wl_correctness(self, gfas: List[GlobalFaithfulAbstraction], grouped_gfa_states: Dict[Tuple[int], StateInformation]):
-        total_conflicts = [0] * 2
-        value_conflicts = [0] * 2
-        total_conflicts_same_instance = [0] * 2
-        value_conflicts_same_instance = [0] * 2
+        color_functions = [ProblemColorFunction(fa.get_problem()) for fa in fas]
+        builder = StateDataBuilder(mark_true_goal_literals, self._instrumentation)
+        visited_global_indices = set()
+        for gfa in gfas:
+            for gfa_state in gfa.get_states():
+                if gfa_state.get_global_index() in visited_global_indices:
+                    continue
+                visited_global_indices.add(gfa_state.get_global_index())
+                # fa_index can also be seen as gfa_index
+                fa_index = gfa_state.get_faithful_abstraction_index()
+                builder.add_abstract_state(fa_index, fas[fa_index], color_functions[fa_index], gfa_state.get_faithful_abstract_state_index())
+        state_data = builder.build([create_instance_information(fa.get_problem()) for fa in fas], num_states)
+        self._logger.info(f"[Generate data] Size of state data: {state_data.nbytes() // (1024 * 1024)} MiB.")
+        self._logger.info(f"[Generate data] Peak memory usage: {int(peak_memory_usage())} MiB.")
+
+        return state_data
+
+    def _create_pruned_state_data(self, mark_true_goal_literals: bool) -> Optional[StateData]:
+        """ Create the state data with a search per instance that only expands one representative per class of isomorphic states.
+
+            Like the global faithful abstractions, instances are sorted ascending by number of abstract states
+            and each class of states that are isomorphic across instances is represented by its first occurrence.
+        """
+        ### 1. Run a pruned search on each instance.
+        pruned_state_spaces: List[PrunedStateSpace] = []
+        for problem_file_path in self._problem_file_paths:
+            self._stop_condition.check()
+            with self._instrumentation.measure("pruned_search"):
+                pruned_state_space = create_pruned_state_space(self._domain_file_path, problem_file_path, self._max_num_states, mark_true_goal_literals)
+            if pruned_state_space is not None:
+                pruned_state_spaces.append(pruned_state_space)
+        if not pruned_state_spaces:
+            return None
+        pruned_state_spaces.sort(key=lambda pruned_state_space: pruned_state_space.get_num_states())
+        num_states = sum(pruned_state_space.num_generated_states for pruned_state_space in pruned_state_spaces)
+        self._logger.info(f"[Pruned search] Total number of generated states: {num_states}")
+        self._logger.info(f"[Pruned search] Peak memory usage: {int(peak_memory_usage())} MiB.")
+
+        ### 2. Collect the data of the states that are non-isomorphic to all states before them.
+        builder = StateDataBuilder(mark_true_goal_literals, self._instrumentation)
+        visited_certificates = set()
+        for instance_id, pruned_state_space in enumerate(pruned_state_spaces):
+            problem = pruned_state_space.get_problem()
+            factories = pruned_state_space.get_pddl_factories()
+            for state_id, (state, certificate, v_star) in enumerate(zip(pruned_state_space.representatives, pruned_state_space.certificates, pruned_state_space.goal_distances)):
+                if certificate in visited_certificates:
+                    continue
+                visited_certificates.add(certificate)
+                builder.add_state(instance_id, problem, factories, pruned_state_space.color_function, state, state_id, v_star, list(certificate[3]))
+        state_data = builder.build([create_instance_information(pruned_state_space.get_problem()) for pruned_state_space in pruned_state_spaces], num_states)
+        self._logger.info(f"[Pruned search] Total number of gfa states: {state_data.get_num_states()}")
+        self._logger.info(f"[Pruned search] Size of state data: {state_data.nbytes() // (1024 * 1024)} MiB.")
+
+        return state_data
+
+    def _create_state_data_in_batches(self, mark_true_goal_literals_values: List[bool]) -> Dict[bool, Optional[StateData]]:
+        """ Create the state data for each value of mark_true_goal_literals from batches of instances.
+
+            State spaces are added to a batch until the memory usage grew by more than the batch memory budget.
+            Each batch is reduced with global faithful abstractions to compact rows, after which its pymimir objects are released.
+            States that are isomorphic across batches are identified by certificate keys.
+            Like in a single global faithful abstraction, the representative of a class of states is taken from the instance
+            with the fewest abstract states, hence the result is the same up to ties between instances of equal size.
+        """
+        builders = { value: StateDataBuilder(value, self._instrumentation) for value in mark_true_goal_literals_values }
+        # Per value and certificate key: rank of the instance of the representative and its row.
+        selected_rows: Dict[bool, Dict[bytes, Tuple[Tuple[int, int, int], int]]] = { value: dict() for value in mark_true_goal_literals_values }
+        instances: Dict[bool, Dict[int, Tuple[Tuple[int, int, int], InstanceInformation]]] = { value: dict() for value in mark_true_goal_literals_values }
+
+        def reduce_batch(batch: List[Tuple[int, StateSpace]]):
+            memories = [(state_space.get_problem(), state_space.get_pddl_factories(), state_space.get_aag(), state_space.get_ssg()) for _, state_space in batch]
+            instance_by_file_path = { str(state_space.get_problem().get_filepath()): (file_index, state_space.get_num_states()) for file_index, state_space in batch }
+            for value in mark_true_goal_literals_values:
+                with self._instrumentation.measure("abstractions"):
+                    gfas = GlobalFaithfulAbstraction.create(memories, self._create_faithful_abstractions_options(value))
+                if not gfas:
+                    continue
+                fas = gfas[0].get_abstractions()
+                color_functions = [ProblemColorFunction(fa.get_problem()) for fa in fas]
+                ranks = []
+                for fa in fas:
+                    file_index, num_concrete_states = instance_by_file_path[str(fa.get_problem().get_filepath())]
+                    ranks.append((fa.get_num_states(), num_concrete_states, file_index))
+                visited_global_indices = set()
+                for gfa in gfas:
+                    for gfa_state in gfa.get_states():
+                        if gfa_state.get_global_index() in visited_global_indices:
+                            continue
+                        visited_global_indices.add(gfa_state.get_global_index())
+                        fa_index = gfa_state.get_faithful_abstraction_index()
+                        fa = fas[fa_index]
+                        fa_state_index = gfa_state.get_faithful_abstract_state_index()
+                        with self._instrumentation.measure("certificates"):
+                            key = compute_certificate_key(color_functions[fa_index], fa.get_pddl_factories(), fa.get_problem(), fa.get_states()[fa_state_index].get_representative_state(), value)
+                        selected_row = selected_rows[value].get(key)
+                        if selected_row is not None and selected_row[0] <= ranks[fa_index]:
+                            continue
+                        # The instance id is the file index until all instances are known.
+                        file_index = ranks[fa_index][2]
+                        if selected_row is None:
+                            selected_rows[value][key] = (ranks[fa_index], builders[value].get_num_states())
+                            builders[value].add_abstract_state(file_index, fa, color_functions[fa_index], fa_state_index)
+                        else:
+                            ### Overwrite the row of the superseded representative, hence the builders only hold selected rows.
+                            selected_rows[value][key] = (ranks[fa_index], selected_row[1])
+                            builders[value].add_abstract_state(file_index, fa, color_functions[fa_index], fa_state_index, selected_row[1])
+                        if file_index not in instances[value]:
+                            instances[value][file_index] = (ranks[fa_index], create_instance_information(fa.get_problem()))
+
+        state_space_options = StateSpaceOptions()
+        state_space_options.use_unit_cost_one = True
+        state_space_options.remove_if_unsolvable = True
+        state_space_options.max_num_states = self._max_num_states
+        num_states = 0
+        num_batches = 0
+        batch: List[Tuple[int, StateSpace]] = []
+        batch_memory_usage = memory_usage()
+        for file_index, problem_file_path in enumerate(self._problem_file_paths):
+            self._stop_condition.check()
+            with self._instrumentation.measure("state_spaces"):
+                state_space = StateSpace.create(str(self._domain_file_path), str(problem_file_path), state_space_options)
+            if state_space is not None:
+                num_states += state_space.get_num_states()
+                batch.append((file_index, state_space))
+            if batch and (memory_usage() - batch_memory_usage > self._instance_batch_memory or file_index + 1 == len(self._problem_file_paths)):
+                self._logger.info(f"[Generate data] Reducing batch {num_batches} with {len(batch)} instances, memory usage {int(memory_usage())} MiB.")
+                reduce_batch(batch)
+                num_batches += 1
+                ### Release the pymimir objects of the batch before the next batch is created.
+                del state_space
+                batch = []
+                gc.collect()
+                batch_memory_usage = memory_usage()
+        self._logger.info(f"[Generate data] Total number of states: {num_states}")
+        self._logger.info(f"[Generate data] Number of batches: {num_batches}")
+        self._logger.info(f"[Generate data] Peak memory usage: {int(peak_memory_usage())} MiB.")
 
-        wl = kwl.CanonicalColorRefinement(False)
+        return { value: self._build_selected_state_data(builders[value], selected_rows[value], instances[value], num_states) for value in mark_true_goal_literals_values }
 
-        ### Fetch fas to access data underlying of gfa_states
-        fas = gfas[0].get_abstractions()
+    def _build_selected_state_data(self, builder: StateDataBuilder, selected_rows: Dict[bytes, Tuple[Tuple[int, int, int], int]], instances: Dict[int, Tuple[Tuple[int, int, int], InstanceInformation]], num_states: int) -> Optional[StateData]:
+        """ Build the state data from the selected row of each certificate key, where instance ids of the rows are file indices.
+
+            Instances and rows are ordered like a single global faithful abstraction would order them.
+        """
+        if not selected_rows:
+            return None
+        file_indices = sorted(instances.keys(), key=lambda file_index: instances[file_index][0])
+        instance_id_by_file_index = np.zeros(len(self._problem_file_paths), dtype=np.int32)
+        instance_id_by_file_index[file_indices] = np.arange(len(file_indices), dtype=np.int32)
+        rows = [row for _, row in sorted(selected_rows.values())]
+        state_data = builder.build([instances[file_index][1] for file_index in file_indices], num_states, rows)
+        state_data.instance_ids = instance_id_by_file_index[state_data.instance_ids]
+        self._logger.info(f"[Generate data] Total number of gfa states: {state_data.get_num_states()}")
+        self._logger.info(f"[Generate data] Size of state data: {state_data.nbytes() // (1024 * 1024)} MiB.")
+        return state_data
+
+    def _index_instance(self, certificate_index: CertificateIndex, problem_file_path: Path, content_hash: str, options_keys: Dict[bool, str]):
+        """ Create the state space of the instance once and store its abstract states for each value of mark_true_goal_literals.
+        """
+        state_space_options = StateSpaceOptions()
+        state_space_options.use_unit_cost_one = True
+        state_space_options.remove_if_unsolvable = True
+        state_space_options.max_num_states = self._max_num_states
+        with self._instrumentation.measure("state_spaces"):
+            state_space = StateSpace.create(str(self._domain_file_path), str(problem_file_path), state_space_options)
+
+        for value, options_key in options_keys.items():
+            fa = None
+            if state_space is not None:
+                faithful_abstraction_options = FaithfulAbstractionOptions()
+                faithful_abstraction_options.mark_true_goal_literals = value
+                faithful_abstraction_options.use_unit_cost_one = True
+                faithful_abstraction_options.remove_if_unsolvable = True
+                faithful_abstraction_options.max_num_concrete_states = self._max_num_states
+                faithful_abstraction_options.max_num_abstract_states = self._max_num_states
+                faithful_abstraction_options.compute_complete_abstraction_mapping = False
+                with self._instrumentation.measure("abstractions"):
+                    fa = FaithfulAbstraction.create(state_space.get_problem(), state_space.get_pddl_factories(), state_space.get_aag(), state_space.get_ssg(), faithful_abstraction_options)
+            if fa is None:
+                certificate_index.put_instance(str(problem_file_path), options_key, content_hash, IndexedInstance(False, state_space.get_num_states() if state_space is not None else 0, 0, str(problem_file_path), dict(), [], []), [])
+                continue
+
+            problem = fa.get_problem()
+            factories = fa.get_pddl_factories()
+            color_function = ProblemColorFunction(problem)
+            goal_distances = fa.get_goal_distances()
+            atom_table = AtomTable()
+            states = []
+            for fa_state_index, fa_state in enumerate(fa.get_states()):
+                representative_state = fa_state.get_representative_state()
+                with self._instrumentation.measure("object_graphs"):
+                    object_graph = create_object_graph(color_function, factories, problem, representative_state, mark_true_goal_literals=value)
+                    graph_arrays = to_graph_arrays(object_graph)
+                with self._instrumentation.measure("certificates"):
+                    certificate_key = get_certificate_key(compute_graph_certificate(object_graph, graph_arrays))
+                states.append(IndexedState(
+                    fa_state_index,
+                    certificate_key,
+                    goal_distances[fa_state.get_index()],
+                    list(fa_state.get_certificate().get_canonical_initial_coloring()),
+                    graph_arrays,
+                    representative_state.get_index(),
+                    *atom_table.get_state_atom_ids(0, factories, representative_state)))
+            instance_information = create_instance_information(problem)
+            self._instrumentation.count("object_graphs", len(states))
+            certificate_index.put_instance(str(problem_file_path), options_key, content_hash, IndexedInstance(True, state_space.get_num_states(), fa.get_num_states(), instance_information.problem_file_path, instance_information.goal, instance_information.static_atoms, atom_table.get_atom_strings()), states)
+
+    def _create_state_data_from_index(self, mark_true_goal_literals_values: List[bool]) -> Dict[bool, Optional[StateData]]:
+        """ Create the state data for each value of mark_true_goal_literals from the certificate index.
+
+            Only instances that are new or whose file changed are processed with pymimir, one instance at a time.
+            Isomorphic states across instances are identified by their certificate keys and, like in a single global faithful abstraction,
+            represented by the state of the instance with the fewest abstract states.
+        """
+        certificate_index = CertificateIndex(self._certificate_index_path)
+        options_keys = { value: compute_state_data_key("certificate-index", self._domain_file_path, [], { "max_num_states": self._max_num_states, "mark_true_goal_atoms": value, "format_version": CERTIFICATE_INDEX_FORMAT_VERSION }) for value in mark_true_goal_literals_values }
+
+        ### 1. Index new and changed instances.
+        indexed_instances: Dict[bool, List[Optional[IndexedInstance]]] = { value: [] for value in mark_true_goal_literals_values }
+        num_indexed_instances = 0
+        for problem_file_path in self._problem_file_paths:
+            self._stop_condition.check()
+            content_hash = hashlib.sha256(problem_file_path.read_bytes()).hexdigest()
+            missing_options_keys = { value: options_key for value, options_key in options_keys.items() if certificate_index.get_instance(str(problem_file_path), options_key, content_hash) is None }
+            if missing_options_keys:
+                self._index_instance(certificate_index, problem_file_path, content_hash, missing_options_keys)
+                num_indexed_instances += 1
+            for value, options_key in options_keys.items():
+                indexed_instances[value].append(certificate_index.get_instance(str(problem_file_path), options_key, content_hash))
+        self._logger.info(f"[Certificate index] Indexed {num_indexed_instances} new or changed of {len(self._problem_file_paths)} instances in {self._certificate_index_path}")
+        self._logger.info(f"[Certificate index] Peak memory usage: {int(peak_memory_usage())} MiB.")
+
+        ### 2. Select one representative per certificate key and load only the selected states.
+        state_data_by_value: Dict[bool, Optional[StateData]] = dict()
+        for value, options_key in options_keys.items():
+            num_states = sum(indexed_instance.num_concrete_states for indexed_instance in indexed_instances[value])
+            selection: Dict[bytes, Tuple[Tuple[int, int, int], int]] = dict()
+            for file_index, indexed_instance in enumerate(indexed_instances[value]):
+                if not indexed_instance.included:
+                    continue
+                rank = (indexed_instance.num_abstract_states, indexed_instance.num_concrete_states, file_index)
+                for state_id, certificate_key in certificate_index.get_certificate_keys(str(self._problem_file_paths[file_index]), options_key):
+                    selected = selection.get(certificate_key)
+                    if selected is None or rank < selected[0]:
+                        selection[certificate_key] = (rank, state_id)
+
+            selected_state_ids: Dict[int, List[int]] = defaultdict(list)
+            for (_, _, file_index), state_id in selection.values():
+                selected_state_ids[file_index].append(state_id)
+            builder = StateDataBuilder(value)
+            selected_rows: Dict[bytes, Tuple[Tuple[int, int, int], int]] = dict()
+            instances: Dict[int, Tuple[Tuple[int, int, int], InstanceInformation]] = dict()
+            for file_index, state_ids in sorted(selected_state_ids.items()):
+                indexed_instance = indexed_instances[value][file_index]
+                rank = (indexed_instance.num_abstract_states, indexed_instance.num_concrete_states, file_index)
+                instances[file_index] = (rank, InstanceInformation(indexed_instance.problem_file_path, indexed_instance.goal, indexed_instance.static_atoms))
+                atom_ids = [builder.get_atom_id(atom_string) for atom_string in indexed_instance.atoms]
+                for state in certificate_index.get_states(str(self._problem_file_paths[file_index]), options_key, state_ids):
+                    # The instance id is the file index until all instances are known.
+                    selected_rows[state.certificate_key] = (rank, builder.get_num_states())
+                    builder.add_row(file_index, state.state_id, state.v_star, state.canonical_initial_coloring, state.graph, state.state_index,
+                                    [atom_ids[atom] for atom in state.fluent_atoms], [atom_ids[atom] for atom in state.derived_atoms])
+            state_data_by_value[value] = self._build_selected_state_data(builder, selected_rows, instances, num_states)
+
+        certificate_index.close()
+        return state_data_by_value
+
+    def _generate_data(self, mark_true_goal_literals_values: List[bool]) -> Dict[bool, Optional[StateData]]:
+        """ Load the state data for each value of mark_true_goal_literals from the data cache or create it with pymimir.
+
+            The state spaces are created at most once and shared by all global faithful abstractions.
+            With pruning, the marking of goal atoms changes which states are isomorphic, hence there is one pruned search per value.
+        """
+        state_data_by_value: Dict[bool, Optional[StateData]] = dict()
+        keys: Dict[bool, str] = dict()
+        missing_values: List[bool] = []
+        for mark_true_goal_literals in mark_true_goal_literals_values:
+            if self._data_cache_directory is not None:
+                ### Batches and the certificate index can select other representatives of isomorphic states, hence they have keys of their own.
+                key = compute_state_data_key("pairwise-wl", self._domain_file_path, self._problem_file_paths, {
+                    "max_num_states": self._max_num_states,
+                    "mark_true_goal_atoms": mark_true_goal_literals,
+                    "enable_pruning": self._enable_pruning,
+                    "instance_batch_memory": self._instance_batch_memory,
+                    "certificate_index": self._certificate_index_path is not None })
+                keys[mark_true_goal_literals] = key
+                state_data = load_state_data(self._data_cache_directory, key)
+                if state_data is not None:
+                    self._logger.info(f"[Data cache] Loaded state data {key}.")
+                    state_data_by_value[mark_true_goal_literals] = state_data
+                    continue
+            missing_values.append(mark_true_goal_literals)
+
+        if not missing_values:
+            return state_data_by_value
+        if self._enable_pruning:
+            created_state_data = { value: self._create_pruned_state_data(value) for value in missing_values }
+        elif self._certificate_index_path is not None:
+            created_state_data = self._create_state_data_from_index(missing_values)
+        elif self._instance_batch_memory is not None:
+            created_state_data = self._create_state_data_in_batches(missing_values)
+        else:
+            state_spaces, num_states = self._create_state_spaces()
+            created_state_data = { value: self._create_state_data(state_spaces, num_states, value) for value in missing_values }
+
+        for mark_true_goal_literals, state_data in created_state_data.items():
+            if state_data is not None and mark_true_goal_literals in keys:
+                save_state_data(self._data_cache_directory, keys[mark_true_goal_literals], state_data)
+                self._logger.info(f"[Data cache] Stored state data {keys[mark_true_goal_literals]}.")
+            state_data_by_value[mark_true_goal_literals] = state_data
+        return state_data_by_value
+
+    def _group_by_canonical_initial_coloring(self, state_data: StateData) -> Dict[Tuple[int], List[int]]:
+        """ Group the states by canonical initial coloring.
+
+            Assumption: if two object graphs have same canonical initial coloring
+            then they also have same number of vertices and edges.
+        """
+        grouped_states: Dict[Tuple[int], List[int]] = defaultdict(list)
+        for state in range(state_data.get_num_states()):
+            grouped_states[state_data.get_canonical_initial_coloring(state)].append(state)
+        self._logger.info(f"[Generate data] Total number of gfa groups: {len(grouped_states)}")
+        return grouped_states
+
+    def _get_wl_graph(self, state_data: StateData, state: int, instrumentation: Instrumentation) -> kwl.EdgeColoredGraph:
+        """ Return the pykwl graph of the representative state, converting it only on a cache miss.
+        """
+        def create():
+            ### Unfortunately, the WL code is not integrated into pymimir.
+            # Hence, we have to translate the graph.
+            # @Blai, interested in integrating coloring related code into pymimir?
+            with instrumentation.measure("convert_graphs"):
+                graph_arrays = state_data.get_graph_arrays(state)
+                return to_uvc_graph_from_arrays(graph_arrays), estimate_uvc_graph_nbytes(graph_arrays.get_num_vertices(), graph_arrays.get_num_edges())
 
-        color_functions: List[ProblemColorFunction] = []
-        for fa in fas:
-            color_functions.append(ProblemColorFunction(fa.get_problem()))
-
-        for partition_id, gfa_states_group in enumerate(grouped_gfa_states.values()):
-
-            partition_filename = f"partition_{partition_id}.1qm"
-
-            ### Dump quotient matrices to a file with format:
-            # repr(quotient_matrix) instance_id state_id
-            with open(partition_filename, "w") as file:
-                for state_information in gfa_states_group:
-                    gfa_state: GlobalFaithfulAbstractState = state_information.gfa_state
-                    v_star: int = state_information.v_star
-                    # fa_index can also be seen as gfa_index
-                    fa_index = gfa_state.get_faithful_abstraction_index()
-                    fa_state_index = gfa_state.get_faithful_abstract_state_index()
-                    fa = fas[fa_index]
-                    problem = fa.get_problem()
-                    factories = fa.get_pddl_factories()
-                    fa_state = fa.get_states()[fa_state_index]
-                    representative_state = fa_state.get_representative_state()
-                    color_function = color_functions[fa_index]
-                    object_graph = create_object_graph(color_function, factories, problem, representative_state, self._mark_true_goal_literals)
-
-                    ### How to print the representative concrete state
-                    # print(representative_state.to_string(problem, factories))
-
-                    ### How to print object graph to dot
-                    # print(object_graph)
-
-                    ### Unfortunately, the WL code is not integrated into pymimir.
-                    # Hence, we have to translate the graph.
-                    # @Blai, interested in integrating coloring related code into pymimir?
-                    wl_graph = to_uvc_graph(object_graph)
+        return self._graph_cache.get(state, create)
 
-                    wl.calculate(wl_graph, True)
+    def _group_by_coloring(self, wl: kwl.WeisfeilerLeman, state_data: StateData, states: List[Tuple[int, int, int]], instrumentation: Instrumentation) -> List[List[Tuple[int, int, int]]]:
+        """ Return the classes of states with identical final coloring that contain more than one state.
 
-                    quotient_matrix = wl.get_quotient_matrix_string()
+            The coloring of each state is computed exactly once.
+        """
+        classes = defaultdict(list)
+        for fa_index, state, v_star in states:
+            wl_graph = self._get_wl_graph(state_data, state, instrumentation)
+            classes[compute_coloring_signature(wl, wl_graph)].append((fa_index, state, v_star))
+        return [conflict_class for conflict_class in classes.values() if len(conflict_class) > 1]
 
-                    file.write(f"{quotient_matrix} {fa_index} {gfa_state.get_index()} {v_star}\n")
+    def _group_by_2fwl_coloring(self, state_data: StateData, wl1_conflict_class: List[Tuple[int, int, int]], instrumentation: Instrumentation) -> List[List[Tuple[int, int, int]]]:
+        """ Return the 2-FWL conflict classes of a 1-WL conflict class.
 
-            ### Use sort command as follows to sort by first column
-            # sort -k 1,1 data.txt
+            States of different individualization classes are distinguished by 2-FWL, hence only the others are colored.
+            Isomorphic states are not checked for, since the state data holds one representative per class of isomorphic states.
+        """
+        groups = [list(range(len(wl1_conflict_class)))]
+        graphs = [state_data.get_graph_arrays(state) for _, state, _ in wl1_conflict_class]
+        if self._individualization_budget > 0 and get_num_individualized_vertices(graphs) > self._individualization_budget:
+            instrumentation.count("individualization_over_budget", 1)
+        elif self._individualization_budget > 0:
+            with instrumentation.measure("individualization"):
+                class_ids = compute_individualization_classes(graphs, self._configuration.ignore_counting).tolist()
+            groups = [group for group in _group_indices(class_ids) if len(group) > 1]
+            instrumentation.count("2fwl_settled_by_individualization", len(wl1_conflict_class) - sum(len(group) for group in groups))
+
+        # Colors are only comparable within the same WL instance, hence one instance per 1-WL conflict class.
+        fwl2 = kwl.WeisfeilerLeman(2, self._configuration.ignore_counting)
+        conflict_classes = []
+        for group in groups:
+            with instrumentation.measure("2fwl"):
+                conflict_classes.extend(self._group_by_coloring(fwl2, state_data, [wl1_conflict_class[index] for index in group], instrumentation))
+            instrumentation.count("2fwl_colorings", len(group))
+        return conflict_classes
+
+    def _group_by_batched_1wl_coloring(self, state_data: StateData, conflict_groups: List[List[Tuple[int, int, int]]], instrumentation: Instrumentation) -> List[List[List[Tuple[int, int, int]]]]:
+        """ Return the 1-WL conflict classes of each conflict group.
+
+            The graphs of all conflict groups are refined together as one disjoint union,
+            hence colors are comparable across the groups and one refinement replaces a coloring per state.
+        """
+        graphs = [state_data.get_graph_arrays(state) for conflict_group in conflict_groups for _, state, _ in conflict_group]
+        class_ids, num_iterations = compute_coloring_classes(graphs, self._configuration.ignore_counting)
+        instrumentation.count("1wl_iterations", num_iterations)
+        class_ids = class_ids.tolist()
+        wl1_conflict_classes_by_group = []
+        position = 0
+        for conflict_group in conflict_groups:
+            classes = defaultdict(list)
+            for element in conflict_group:
+                classes[class_ids[position]].append(element)
+                position += 1
+            wl1_conflict_classes_by_group.append([conflict_class for conflict_class in classes.values() if len(conflict_class) > 1])
+        return wl1_conflict_classes_by_group
+
+    def _create_state_record(self, state_data: StateData, fa_index: int, state: int, v_star: int) -> Dict[str, Any]:
+        instance = state_data.instances[fa_index]
+        return {
+            "instance": instance.problem_file_path,
+            "cost": v_star,
+            "state": state_data.get_state_string(state),
+            "goal": instance.goal}
+
+    def _report_conflicts(self, k_index: int, wl_name: str, state_data: StateData, conflict_class: List[Tuple[int, int, int]], result: PartitionResult):
+        """ Count the pairs of states in a class of states that WL cannot distinguish and write them to the conflict sink.
+
+            In count-only mode, only a bounded sample of pairs is written.
+        """
+        conflict_counts = count_conflicts([v_star for _, _, v_star in conflict_class], [fa_index for fa_index, _, _ in conflict_class])
+        result.add_conflict_counts(k_index, conflict_counts)
+        self._logger.info(f"[{wl_name}] Conflict class: [size = {len(conflict_class)}, #C = {conflict_counts.total}, #V = {conflict_counts.value}]")
+
+        if self._count_only:
+            pairs = sample_conflict_pairs(conflict_class, lambda element: element[2], self._num_example_pairs)
+        else:
+            pairs = combinations(conflict_class, 2)
+
+        for (fa_index_1, state_1, v_star_1), (fa_index_2, state_2, v_star_2) in pairs:
+            ### States are only serialized if the sink has not reached its limit.
+            create_record = lambda: {
+                "configuration": self._configuration.get_name(),
+                "wl": wl_name,
+                "value_conflict": v_star_1 != v_star_2,
+                "state_1": self._create_state_record(state_data, fa_index_1, state_1, v_star_1),
+                "state_2": self._create_state_record(state_data, fa_index_2, state_2, v_star_2)}
+            if not self._conflict_sink.write(create_record):
+                break
+
+    def _validate_partition(self, state_data: StateData, states: List[int]) -> Tuple[PartitionResult, Dict[str, Any]]:
+        """ Count the 1-WL and 2-FWL conflicts among states with the same canonical initial coloring.
+
+            Return the counters together with a snapshot of the instrumentation of the partition.
+        """
+        result = PartitionResult()
+        instrumentation = Instrumentation(self._memory_sampler, "partition")
+        instrumentation.count("states", len(states))
+        num_graph_cache_hits = self._graph_cache.num_hits
+        num_graph_cache_misses = self._graph_cache.num_misses
+
+        ### States that an invariant of 1-WL separates from all other states cannot be in a conflict, hence they skip canonical color refinement.
+        buckets = [list(range(len(states)))] if len(states) > 1 else []
+        if len(states) > 1 and self._invariant_cascade:
+            with instrumentation.measure("invariant_cascade"):
+                buckets, num_separated_states = split_by_invariants([state_data.get_graph_arrays(state) for state in states], self._invariant_cascade, self._configuration.ignore_counting)
+            for invariant, num_separated_states_i in num_separated_states.items():
+                instrumentation.count(f"separated_by_{invariant.replace('-', '_')}", num_separated_states_i)
 
-            ### Call the sort command using subprocess
-            sorted_partition_filename = f"partition_{partition_id}.1qm"
-            try:
-                subprocess.run(['sort', '-k1,1', '-o', sorted_partition_filename, partition_filename], check=True)
-            except subprocess.CalledProcessError as e:
-                print(f"Error during sorting: {e}")
-
-            ### Open the file for reading
-            conflict_groups = []
-            with open(sorted_partition_filename, "r") as file:
-                prev_quotient_matrix_string = None
-                prev_instance_id = None
-                prev_state_id = None
-                prev_v_star = None
-                conflict_group = []
-                for line in file:
-                    quotient_matrix_string, instance_id, state_id, v_star = line.split()
-                    instance_id = int(instance_id)
-                    state_id = int(state_id)
-                    v_star = int(v_star)
-
-                    if prev_quotient_matrix_string is not None and prev_quotient_matrix_string == quotient_matrix_string:
-                        ### Collect conflicts of a group
-                        if not conflict_group:
-                            conflict_group.append((prev_instance_id, prev_state_id, prev_v_star))
-                        conflict_group.append((instance_id, state_id, v_star))
-                    else:
-                        if conflict_group:
-                            ### No more conflicts for the same group
-                            conflict_groups.append(conflict_group)
-                            conflict_group = []
-
-                    prev_quotient_matrix_string = quotient_matrix_string
-                    prev_instance_id = instance_id
-                    prev_state_id = state_id
-                    prev_v_star = v_star
-
-            for conflict_group in conflict_groups:
-                for (fa_index_1, fa_state_index_1, v_star_1), (fa_index_2, fa_state_index_2, v_star_2) in combinations(conflict_group, 2):
-                    ### Use canonical color refinement as approximation and correct false positives
-                    wl1 = kwl.WeisfeilerLeman(1, self._ignore_counting)
-
-                    fa_1: FaithfulAbstraction = fas[fa_index_1]
-                    problem_1 = fa_1.get_problem()
-                    factories_1 = fa_1.get_pddl_factories()
-                    problem_filepath_1 = fa_1.get_problem().get_filepath()
-                    fa_state_1: FaithfulAbstractState = fa_1.get_states()[fa_state_index_1]
-                    representative_state_1 = fa_state_1.get_representative_state()
-                    color_function_1 = color_functions[fa_index_1]
-                    object_graph_1 = create_object_graph(color_function_1, factories_1, problem_1, representative_state_1, self._mark_true_goal_literals)
-
-                    fa_2: FaithfulAbstraction = fas[fa_index_2]
-                    problem_2 = fa_2.get_problem()
-                    factories_2 = fa_2.get_pddl_factories()
-                    problem_filepath_2 = fa_1.get_problem().get_filepath()
-                    fa_state_2: FaithfulAbstractState = fa_2.get_states()[fa_state_index_2]
-                    representative_state_2 = fa_state_2.get_representative_state()
-                    color_function_2 = color_functions[fa_index_2]
-                    object_graph_2 = create_object_graph(color_function_2, factories_2, problem_2, representative_state_2, self._mark_true_goal_literals)
-
-
-                    wl_graph_1 = to_uvc_graph(object_graph_1)
-                    wl_graph_2 = to_uvc_graph(object_graph_2)
-
-                    coloring_1 = wl1.compute_coloring(wl_graph_1)
-                    coloring_2 = wl1.compute_coloring(wl_graph_2)
-
-                    if coloring_1 != coloring_2:
-                        continue
-
-                    # Report 1-WL conflict
-                    total_conflicts[0] += 1
-                    if fa_index_1 == fa_index_2:
-                        total_conflicts_same_instance[0] += 1
-                    if v_star_1 != v_star_2:
-                        value_conflicts[0] += 1
-                        if fa_index_1 == fa_index_2:
-                            value_conflicts_same_instance[0] += 1
-                        self._logger.info(f"[1-WL] Value conflict!")
-                    else:
-                        self._logger.info(f"[1-WL] Conflict!")
-
-                    self._logger.info(f" > Instance 1: {problem_filepath_1}")
-                    self._logger.info(f" > Instance 2: {problem_filepath_2}")
-                    self._logger.info(f" > Cost: {v_star_1}; State 1: {representative_state_1.to_string(problem_1, factories_1)}")
-                    self._logger.info(f" > Cost: {v_star_2}; State 2: {representative_state_2.to_string(problem_2, factories_2)}")
-                    self._logger.info(f"Goal 1: fluent={[str(literal) for literal in problem_1.get_fluent_goal_condition()]}, derived={[str(literal) for literal in problem_1.get_derived_goal_condition()]}, static={[str(literal) for literal in problem_1.get_static_goal_condition()]}")
-                    self._logger.info(f"Goal 2: fluent={[str(literal) for literal in problem_2.get_fluent_goal_condition()]}, derived={[str(literal) for literal in problem_2.get_derived_goal_condition()]}, static={[str(literal) for literal in problem_2.get_static_goal_condition()]}")
-
-                    # Check 2-FWL conflict
-                    fwl2 = kwl.WeisfeilerLeman(2, self._ignore_counting)
-
-                    fwl2_coloring_1 = fwl2.compute_coloring(wl_graph_1)
-                    fwl2_coloring_2 = fwl2.compute_coloring(wl_graph_2)
-
-                    if fwl2_coloring_1 == fwl2_coloring_2:
-                        if fa_index_1 == fa_index_2:
-                            total_conflicts_same_instance[1] += 1
-                        if v_star_1 != v_star_2:
-                            value_conflicts[1] += 1
-                            if fa_index_1 == fa_index_2:
-                                value_conflicts_same_instance[1] += 1
-                            self._logger.info(f"[2-FWL] Value conflict!")
-                        else:
-                            self._logger.info(f"[2-FWL] Conflict!")
+        wl = kwl.CanonicalColorRefinement(False)
 
-                        self._logger.info(f" > Instance 1: {problem_filepath_1}")
-                        self._logger.info(f" > Instance 2: {problem_filepath_2}")
-                        self._logger.info(f" > Cost: {v_star_1}; State 1: {representative_state_1.to_string(problem_1, factories_1)}")
-                        self._logger.info(f" > Cost: {v_star_2}; State 2: {representative_state_2.to_string(problem_2, factories_2)}")
-                        self._logger.info(f"Goal 1: fluent={[str(literal) for literal in problem_1.get_fluent_goal_condition()]}, derived={[str(literal) for literal in problem_1.get_derived_goal_condition()]}, static={[str(literal) for literal in problem_1.get_static_goal_condition()]}")
-                        self._logger.info(f"Goal 2: fluent={[str(literal) for literal in problem_2.get_fluent_goal_condition()]}, derived={[str(literal) for literal in problem_2.get_derived_goal_condition()]}, static={[str(literal) for literal in problem_2.get_static_goal_condition()]}")
+        ### Group states by bucket and quotient matrix. Records are only spilled to disk if the group exceeds the memory budget.
+        with QuotientMatrixGrouping(self._grouping_memory_budget) as grouping:
+            for bucket_index, state in ((bucket_index, states[index]) for bucket_index, bucket in enumerate(buckets) for index in bucket):
+                self._stop_condition.check()
+                # fa_index can also be seen as gfa_index
+                fa_index = state_data.instance_ids[state].item()
+                v_star = int(state_data.v_stars[state])
 
+                ### How to print the representative concrete state
+                # print(state_data.get_state_string(state))
 
-        return total_conflicts, value_conflicts, total_conflicts_same_instance, value_conflicts_same_instance
+                wl_graph = self._get_wl_graph(state_data, state, instrumentation)
 
+                with instrumentation.measure("canonical_color_refinement"):
+                    wl.calculate(wl_graph, True)
+
+                with instrumentation.measure("group_quotient_matrices"):
+                    grouping.add(f"{bucket_index}:{wl.get_quotient_matrix_string()}", fa_index, state, v_star)
+
+            with instrumentation.measure("group_quotient_matrices"):
+                conflict_groups = grouping.get_conflict_groups()
+            result.num_spilled_records = grouping.num_spilled_records
+
+        instrumentation.count("conflict_groups", len(conflict_groups))
+        if self._wl1_backend == "numpy" and conflict_groups:
+            with instrumentation.measure("1wl"):
+                wl1_conflict_classes_by_group = self._group_by_batched_1wl_coloring(state_data, conflict_groups, instrumentation)
+        for group_index, conflict_group in enumerate(conflict_groups):
+            self._stop_condition.check()
+            ### Use canonical color refinement as approximation and correct false positives.
+            if self._wl1_backend == "numpy":
+                wl1_conflict_classes = wl1_conflict_classes_by_group[group_index]
+            else:
+                # Colors are only comparable within the same WL instance, hence one instance per group.
+                wl1 = kwl.WeisfeilerLeman(1, self._configuration.ignore_counting)
+                with instrumentation.measure("1wl"):
+                    wl1_conflict_classes = self._group_by_coloring(wl1, state_data, conflict_group, instrumentation)
+            instrumentation.count("1wl_colorings", len(conflict_group))
+            for wl1_conflict_class in wl1_conflict_classes:
+                # Report 1-WL conflict
+                self._report_conflicts(0, "1-WL", state_data, wl1_conflict_class, result)
+
+                # Check 2-FWL conflict
+                fwl2_conflict_classes = self._group_by_2fwl_coloring(state_data, wl1_conflict_class, instrumentation)
+                for fwl2_conflict_class in fwl2_conflict_classes:
+                    self._report_conflicts(1, "2-FWL", state_data, fwl2_conflict_class, result)
+
+        ### States of different partitions are never compared, so the cached graphs can go.
+        self._graph_cache.clear()
+        result.num_graph_cache_hits = self._graph_cache.num_hits - num_graph_cache_hits
+        result.num_graph_cache_misses = self._graph_cache.num_misses - num_graph_cache_misses
+
+        return result, instrumentation.get_snapshot()
+
+    def _save_checkpoint(self, force: bool = False):
+        if force or self._checkpoint.is_save_due():
+            self._checkpoint.save(self._conflict_sink.sync())
+
+    def _validate_wl_correctness(self, state_data: StateData, grouped_states: Dict[Tuple[int], List[int]], progress: ConfigurationProgress, instrumentation: Instrumentation) -> PartitionResult:
+        """ Validate the partitions that are not completed yet and record each completed partition in the progress.
+
+            On a stop request, partitions that are not completed are discarded and the result covers the completed ones.
+        """
+        partitions = list(grouped_states.values())
+        result = PartitionResult(**progress.result)
+        remaining_partition_ids = [partition_id for partition_id in range(len(partitions)) if partition_id not in progress.completed_partitions]
+
+        def complete(partition_id: int, partition_result_and_snapshot: Tuple[PartitionResult, Dict[str, Any]]):
+            partition_result, snapshot = partition_result_and_snapshot
+            result.merge(partition_result)
+            instrumentation.merge(snapshot)
+            progress.completed_partitions.add(partition_id)
+            progress.result = asdict(result)
+            progress.num_conflict_records = self._conflict_sink.get_num_records()
+            self._save_checkpoint()
+
+        try:
+            if self._num_jobs <= 1:
+                for partition_id in remaining_partition_ids:
+                    complete(partition_id, self._validate_partition(state_data, partitions[partition_id]))
+            else:
+                ### Partitions are independent. Workers are forked such that they share the state data with the parent.
+                # Large partitions are scheduled first to avoid a long tail, and the counters are sums, so the merge order does not matter.
+                schedule = sorted(remaining_partition_ids, key=lambda partition_id: (-len(partitions[partition_id]), partition_id))
+                validate_partition = lambda partition_id: self._validate_partition(state_data, partitions[partition_id])
+                for partition_id, partition_result in imap_forked(validate_partition, schedule, self._num_jobs, self._logger, self._stop_condition.is_requested):
+                    complete(partition_id, partition_result)
+        except StopRequested as stop_request:
+            # Workers that receive a signal themselves report it through their result.
+            self._stop_condition.request(str(stop_request))
+        if self._stop_condition.is_requested():
+            self._logger.info(f"[Stop] Stopped on {self._stop_condition.reason} after {len(progress.completed_partitions)} of {len(partitions)} partitions.")
+
+        self._logger.info(f"[WL] Graph cache: [hits = {result.num_graph_cache_hits}, misses = {result.num_graph_cache_misses}]")
+        self._logger.info(f"[WL] Quotient matrix records spilled to disk: {result.num_spilled_records}")
+
+        return result
+
+
+    def _evaluate_configuration(self, state_data: StateData, grouped_states: Dict[Tuple[int], List[int]]) -> Dict[str, Any]:
+        """ Validate the current configuration on the state data and return its section of the results.
+        """
+        configuration = self._configuration
+        instrumentation = Instrumentation(self._memory_sampler, configuration.get_name())
+        self._configuration_instrumentations.append(instrumentation)
+        self._logger.info(f"[Configuration] Evaluating {configuration.get_name()}: [ignore_counting = {configuration.ignore_counting}, mark_true_goal_atoms = {configuration.mark_true_goal_atoms}]")
+
+        progress = self._checkpoint.get_progress(configuration.get_name(), len(grouped_states))
+        num_resumed_partitions = len(progress.completed_partitions)
+        if num_resumed_partitions > 0:
+            self._logger.info(f"[Checkpoint] Skipping {num_resumed_partitions} of {len(grouped_states)} partitions that are already validated.")
+
+        self._logger.info("[WL] Run validation...")
+        self._conflict_sink.reset_num_records(progress.num_conflict_records)
+        with instrumentation.measure("validate"):
+            result = self._validate_wl_correctness(state_data, grouped_states, progress, instrumentation)
+        self._save_checkpoint(force=True)
+        self._logger.info(f"[WL] Conflict records written to {self._conflicts_file_path}: {self._conflict_sink.get_num_records()}")
+
+        self._logger.info(f"[Results] Configuration: [enable_pruning = {self._enable_pruning}, max_num_states = {self._max_num_states}, ignore_counting = {configuration.ignore_counting}, mark_true_goal_atoms = {configuration.mark_true_goal_atoms}]")
+        self._logger.info(f"[Results] Table row: [# = {len(self._problem_file_paths)}, #P = {state_data.get_num_states()}, #S = {state_data.num_total_states}, #C = {result.total_conflicts}, #V = {result.value_conflicts}, #C/same = {result.total_conflicts_same_instance}, #V/same = {result.value_conflicts_same_instance}]")
+        num_processed_partitions = len(progress.completed_partitions)
+        if num_processed_partitions < len(grouped_states):
+            self._logger.info(f"[Results] Partial results of {num_processed_partitions} of {len(grouped_states)} partitions.")
+
+        return {
+            "name": configuration.get_name(),
+            "configuration": configuration.to_dict(),
+            "completed": num_processed_partitions == len(grouped_states),
+            "num_final_states": state_data.get_num_states(),
+            "num_total_states": state_data.num_total_states,
+            "num_initial_partitions": len(grouped_states),
+            "num_resumed_partitions": num_resumed_partitions,
+            "num_processed_partitions": num_processed_partitions,
+            "fraction_processed_partitions": num_processed_partitions / len(grouped_states) if grouped_states else 1.0,
+            "total_conflicts": result.total_conflicts,
+            "value_conflicts": result.value_conflicts,
+            "total_conflicts_same_instance": result.total_conflicts_same_instance,
+            "value_conflicts_same_instance": result.value_conflicts_same_instance,
+            "num_conflict_records": self._conflict_sink.get_num_records(),
+            "num_graph_cache_hits": result.num_graph_cache_hits,
+            "num_graph_cache_misses": result.num_graph_cache_misses,
+            "num_spilled_records": result.num_spilled_records,
+            **instrumentation.to_dict() }
+
+    def _load_checkpoint(self, state_data_by_value: Dict[bool, StateData]) -> Checkpoint:
+        """ Load the checkpoint of an earlier run on the same state data with the same options, or start a new one.
+        """
+        if self._checkpoint_file_path is None:
+            return Checkpoint(None, "", self._checkpoint_interval)
+        key = hashlib.sha256(json.dumps({
+            "state_data": { str(value): compute_state_data_digest(state_data) for value, state_data in state_data_by_value.items() },
+            "count_only": self._count_only,
+            "num_example_pairs": self._num_example_pairs,
+            "conflicts_file": str(self._conflicts_file_path),
+            "max_num_conflict_records": self._max_num_conflict_records }, sort_keys=True).encode()).hexdigest()
+        checkpoint = Checkpoint.load(self._checkpoint_file_path, key, self._checkpoint_interval)
+        if checkpoint.is_resumed():
+            self._logger.info(f"[Checkpoint] Resuming from {self._checkpoint_file_path}.")
+        else:
+            self._logger.info(f"[Checkpoint] Writing progress to {self._checkpoint_file_path}.")
+        return checkpoint
 
     def run(self):
         """ Main loop for computing k-WL and Aut(S(P)) for state space S(P).
         """
-        self._logger.info(f"[Configuration] [enable_pruning = {self._enable_pruning}, max_num_states = {self._max_num_states}, ignore_counting = {self._ignore_counting}, mark_true_goal_atoms = {self._mark_true_goal_literals}]")
-        self._logger.info("[Configuration] Domain file: {self._domain_file_path}")
+        self._logger.info(f"[Configuration] [enable_pruning = {self._enable_pruning}, max_num_states = {self._max_num_states}]")
+        self._logger.info(f"[Configuration] Configurations: {', '.join(configuration.get_name() for configuration in self._configurations)}")
+        self._logger.info(f"[Configuration] Domain file: {self._domain_file_path}")
         for i, problem_file_path in enumerate(self._problem_file_paths):
             self._logger.info(f"[Configuration] Problem {i} file: {problem_file_path}")
 
+        configurations_by_value = group_by_mark_true_goal_atoms(self._configurations)
+        self._stop_condition.install_signal_handlers()
+
         self._logger.info("[Pymimir] Generating pairwise non isomorphic states.")
-        gfas, grouped_gfa_states, num_states, num_gfa_states = self._generate_data()
-        self._logger.info(f"[Pymimir] Peak memory usage: {int(memory_usage())} MiB.")
-        if not gfas:
+        state_data_by_value: Dict[bool, Optional[StateData]] = dict()
+        with self._instrumentation.measure("generate_data"):
+            try:
+                state_data_by_value = self._generate_data(list(configurations_by_value.keys()))
+            except StopRequested:
+                self._logger.info(f"[Stop] Stopped on {self._stop_condition.reason} while generating data.")
+        self._logger.info(f"[Pymimir] Peak memory usage: {int(peak_memory_usage())} MiB.")
+        if any(state_data is None for state_data in state_data_by_value.values()):
             self._logger.info(f"[Pymimir] Got empty set of gfas. Aborting.")
             return
 
         # Dominik (13-07-2024): Commented out the code to see memory consumption of just the data generation
-        self._logger.info("[WL] Run validation...")
-        total_conflicts, value_conflicts, total_conflicts_same_instance, value_conflicts_same_instance = self._validate_wl_correctness(gfas, grouped_gfa_states)
-
-        self._logger.info("[Results] Ran to completion.")
+        sections: Dict[Configuration, Dict[str, Any]] = dict()
+        if state_data_by_value:
+            self._checkpoint = self._load_checkpoint(state_data_by_value)
+            self._conflict_sink = ConflictSink(self._conflicts_file_path, self._max_num_conflict_records, self._checkpoint.conflicts_file_size)
+            for mark_true_goal_literals, configurations in configurations_by_value.items():
+                if self._stop_condition.is_requested():
+                    break
+                state_data = state_data_by_value[mark_true_goal_literals]
+                grouped_states = self._group_by_canonical_initial_coloring(state_data)
+                for configuration in configurations:
+                    if self._stop_condition.is_requested():
+                        break
+                    self._configuration = configuration
+                    sections[configuration] = self._evaluate_configuration(state_data, grouped_states)
+            self._configuration = None
+            self._conflict_sink.close()
+
+        ### Configurations that were not started because of a stop request only report that they processed nothing.
+        for configuration in self._configurations:
+            if configuration not in sections:
+                sections[configuration] = {
+                    "name": configuration.get_name(),
+                    "configuration": configuration.to_dict(),
+                    "completed": False,
+                    "num_processed_partitions": 0,
+                    "fraction_processed_partitions": 0.0 }
+        completed = all(section["completed"] for section in sections.values())
+
+        if completed:
+            self._logger.info("[Results] Ran to completion.")
+        else:
+            self._logger.info(f"[Results] Stopped early on {self._stop_condition.reason}. Results are partial.")
         self._logger.info(f"[Results] Domain: {self._domain_file_path}")
-        self._logger.info(f"[Results] Configuration: [enable_pruning = {self._enable_pruning}, max_num_states = {self._max_num_states}, ignore_counting = {self._ignore_counting}, mark_true_goal_atoms = {self._mark_true_goal_literals}]")
-        self._logger.info(f"[Results] Table row: [# = {len(self._problem_file_paths)}, #P = {num_gfa_states}, #S = {num_states}, #C = {total_conflicts}, #V = {value_conflicts}, #C/same = {total_conflicts_same_instance}, #V/same = {value_conflicts_same_instance}]")
-        self._logger.info(f"[Results] Peak memory usage: {int(memory_usage())} MiB.")
+        self._logger.info(f"[Results] Peak memory usage: {int(peak_memory_usage())} MiB.")
+
+        write_results(self._results_file_path, {
+            "driver": "pairwise-wl",
+            "completed": completed,
+            "stop_reason": None if completed else self._stop_condition.reason,
+            "fraction_processed_partitions": sum(section["fraction_processed_partitions"] for section in sections.values()) / len(sections),
+            "configuration": {
+                "enable_pruning": self._enable_pruning,
+                "max_num_states": self._max_num_states },
+            "domain_file": str(self._domain_file_path),
+            "problem_files": [str(problem_file_path) for problem_file_path in self._problem_file_paths],
+            "num_instances": len(self._problem_file_paths),
+            "configurations": [sections[configuration] for configuration in self._configurations],
+            **self._instrumentation.to_dict(),
+            "peak_memory_usage": peak_memory_usage() })
+        self._logger.info(f"[Results] Results written to {self._results_file_path}")
+        if self._trace_file_path is not None:
+            write_chrome_trace(self._trace_file_path, [self._instrumentation] + self._configuration_instrumentations, self._memory_sampler)
+            self._logger.info(f"[Results] Trace written to {self._trace_file_path}")
@@ -0,0 +1,70 @@
+import logging
+import multiprocessing
+import signal
+
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+
+class _CollectingHandler(logging.Handler):
+    """ Buffers the messages of a worker process such that the parent can print them contiguously.
+    """
+    def __init__(self):
+        super().__init__()
+        self.messages: List[str] = []
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(record.getMessage())
+
+
+# State shared with forked worker processes. pymimir and pykwl objects cannot be pickled,
+# hence workers inherit the function together with all data it refers to from the parent.
+_worker_function: Callable[[Any], Any] = None
+_worker_logger: logging.Logger = None
+_worker_handler: _CollectingHandler = None
+
+# Seconds between two polls of should_stop while waiting for results.
+_STOP_POLL_INTERVAL = 1.0
+
+
+def _initialize_worker():
+    global _worker_handler
+    # Pool.terminate stops the workers with SIGTERM, hence a handler inherited from the parent must not outlive it.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    for handler in list(_worker_logger.handlers):
+        _worker_logger.removeHandler(handler)
+    _worker_handler = _CollectingHandler()
+    _worker_logger.addHandler(_worker_handler)
+
+
+def _run_task(task: Any) -> Tuple[Any, Any, List[str]]:
+    _worker_handler.messages = []
+    result = _worker_function(task)
+    return task, result, _worker_handler.messages
+
+
+def imap_forked(function: Callable[[Any], Any], tasks: List[Any], num_jobs: int, logger: logging.Logger, should_stop: Optional[Callable[[], bool]] = None) -> Iterator[Tuple[Any, Any]]:
+    """ Apply the function to each task in a pool of forked worker processes.
+
+        Yields (task, result) pairs in order of completion. Only tasks and results are pickled.
+        Messages that a task logs to the logger are logged again by the parent, contiguously per task.
+        If should_stop returns True, no further results are yielded and the workers are terminated.
+    """
+    global _worker_function, _worker_logger
+    _worker_function = function
+    _worker_logger = logger
+    try:
+        with multiprocessing.get_context("fork").Pool(num_jobs, initializer=_initialize_worker) as pool:
+            results = pool.imap_unordered(_run_task, tasks)
+            while should_stop is None or not should_stop():
+                try:
+                    task, result, messages = results.next(timeout=_STOP_POLL_INTERVAL if should_stop is not None else None)
+                except multiprocessing.TimeoutError:
+                    continue
+                except StopIteration:
+                    break
+                for message in messages:
+                    logger.info(message)
+                yield task, result
+    finally:
+        _worker_function = None
+        _worker_logger = None
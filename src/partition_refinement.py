@@ -0,0 +1,333 @@
+import numpy as np
+
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+from .pykwl_utils import GraphArrays
+from .color_refinement import create_disjoint_union, compute_coloring_classes, is_stable_coloring
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """ The splitmix64 finalizer, used as a random weight per color in the hashes of neighborhoods and of the color histograms of the graphs. """
+    values = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def _gather_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """ Return the concatenation of the ranges [starts[i], starts[i] + lengths[i]). """
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(int(lengths.sum()), dtype=np.int64)
+
+
+def _get_run_starts(values: np.ndarray) -> np.ndarray:
+    """ Return the indices at which the runs of equal values of a sorted array start. """
+    is_start = np.ones(len(values), dtype=bool)
+    is_start[1:] = values[1:] != values[:-1]
+    return np.flatnonzero(is_start)
+
+
+class _PairCounts:
+    """ Number of items per pair of an owner and a class.
+
+        Each item refers to the counter of its pair, hence moving items to new classes needs no search.
+        Counters of pairs that lost all items are never reused.
+    """
+    def __init__(self, owners: np.ndarray, colors: np.ndarray, stride: int):
+        self._stride = stride
+        keys, self._item_counters, counts = np.unique(owners * stride + colors, return_inverse=True, return_counts=True)
+        self._item_counters = self._item_counters.reshape(-1)
+        self._keys = keys
+        self._counts = counts
+        self._num_counters = len(keys)
+
+    def get_keys(self) -> np.ndarray:
+        return self._keys[:self._num_counters][self._counts[:self._num_counters] > 0]
+
+    def move(self, items: np.ndarray, owners: np.ndarray, new_colors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ Move the items to the classes new_colors, which must have no items of the owners yet.
+
+            Return the sorted keys of the pairs that lost all of their items and of the pairs that were created.
+        """
+        former_counters, num_removed = np.unique(self._item_counters[items], return_counts=True)
+        self._counts[former_counters] -= num_removed
+        emptied_keys = np.sort(self._keys[former_counters[self._counts[former_counters] == 0]])
+        created_keys, inverse, counts = np.unique(owners * self._stride + new_colors, return_inverse=True, return_counts=True)
+        if self._num_counters + len(created_keys) > len(self._keys):
+            capacity = max(2 * len(self._keys), self._num_counters + len(created_keys))
+            self._keys = np.resize(self._keys, capacity)
+            self._counts = np.resize(self._counts, capacity)
+        self._keys[self._num_counters:self._num_counters + len(created_keys)] = created_keys
+        self._counts[self._num_counters:self._num_counters + len(created_keys)] = counts
+        self._item_counters[items] = self._num_counters + inverse.reshape(-1)
+        self._num_counters += len(created_keys)
+        return emptied_keys, created_keys
+
+
+@dataclass
+class RefinementResult:
+    """ 1-WL conflict classes of a partition, as indices of graphs, and the work that was needed to find them.
+
+        max_num_iterations is the largest iteration at which a graph was either stable or distinguished from all other graphs.
+    """
+    conflict_classes: List[List[int]]
+    max_num_iterations: int
+    num_rounds: int
+    num_moved_vertices: int
+    num_touched_vertices: int
+
+
+class SmallerHalfRefinement:
+    """ 1-WL on a disjoint union of graphs by partition refinement that only processes the smaller parts of split classes.
+
+        Each round computes the next 1-WL coloring. The vertices of a class are contiguous in a permutation of the vertices.
+        When a class splits, its largest part keeps the class id and only the vertices of the other parts move to new classes.
+        Each vertex has a hash of the multiset, or without counting the set, of the colors of its neighbors.
+        Only the hashes of the neighbors of moved vertices, the touched vertices, change, and only they can split in the next round.
+        A vertex moves O(log n) times, hence the total work is O((n + m) log n).
+        Without counting, the number of neighbors of each vertex per class is kept to detect when a color leaves a neighborhood.
+
+        Hashes are sums of random 64 bit weights per color, which can only merge classes that 1-WL distinguishes.
+        The coloring of each conflict class is verified to be stable, hence the conflict classes are exact.
+    """
+    def __init__(self, graphs: List[GraphArrays], ignore_counting: bool, seed: int = 0):
+        self._graphs = graphs
+        self._ignore_counting = ignore_counting
+        self._union = create_disjoint_union(graphs)
+        self._degrees = np.diff(self._union.indptr)
+        self._graph_ids = np.repeat(np.arange(self._union.get_num_graphs(), dtype=np.int64), np.diff(self._union.graph_offsets))
+
+        num_vertices = self._union.get_num_vertices()
+        _, colors = np.unique(self._union.vertex_colors, return_inverse=True)
+        self._colors = colors.reshape(-1).astype(np.int64)
+        self._num_classes = int(self._colors.max()) + 1 if num_vertices > 0 else 0
+        ### There are at most as many classes as vertices, hence the class arrays never grow.
+        self._perm = np.argsort(self._colors, kind="stable")
+        self._positions = np.empty(num_vertices, dtype=np.int64)
+        self._positions[self._perm] = np.arange(num_vertices, dtype=np.int64)
+        self._class_sizes = np.zeros(num_vertices, dtype=np.int64)
+        self._class_sizes[:self._num_classes] = np.bincount(self._colors, minlength=self._num_classes)
+        self._class_starts = np.zeros(num_vertices, dtype=np.int64)
+        self._class_starts[:self._num_classes] = np.cumsum(self._class_sizes[:self._num_classes]) - self._class_sizes[:self._num_classes]
+        self._is_touched = np.zeros(num_vertices, dtype=bool)
+
+        ### The weight of a color is a hash of the color with a random salt, since a table of weights would have to grow with the classes.
+        self._salt = np.random.default_rng(seed).integers(0, np.iinfo(np.int64).max, dtype=np.int64)
+        self._neighbor_hashes = np.zeros(num_vertices, dtype=np.uint64)
+        sources, targets = self._union.get_sources(), self._union.indices
+        if ignore_counting:
+            stride = max(1, num_vertices)
+            ### The items are the adjacencies (u, v) with owner u and the class of v.
+            self._neighbor_counts = _PairCounts(sources, self._colors[targets], stride)
+            neighbor_keys = self._neighbor_counts.get_keys()
+            np.add.at(self._neighbor_hashes, neighbor_keys // stride, self._get_weights(neighbor_keys % stride))
+            ### The index of the adjacency (v, u) for each adjacency (u, v). Equal pairs are matched in order, hence multiple edges are fine.
+            self._reverse_adjacencies = np.empty(len(sources), dtype=np.int64)
+            self._reverse_adjacencies[np.argsort(targets * stride + sources, kind="stable")] = np.argsort(sources * stride + targets, kind="stable")
+        else:
+            np.add.at(self._neighbor_hashes, sources, self._get_weights(self._colors[targets]))
+
+    def _get_weights(self, colors: np.ndarray) -> np.ndarray:
+        return _mix(colors ^ self._salt)
+
+    def _add_to_neighbor_hashes(self, vertices: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """ Add the weights to the hashes of the vertices, which must be sorted, and return the distinct vertices.
+        """
+        if len(vertices) == 0:
+            return vertices
+        first_entries = _get_run_starts(vertices)
+        self._neighbor_hashes[vertices[first_entries]] += np.add.reduceat(weights, first_entries)
+        return vertices[first_entries]
+
+    def _update_neighbor_hashes(self, moved: np.ndarray, former_colors: np.ndarray) -> np.ndarray:
+        """ Update the hashes of the neighbors of the moved vertices and return these touched vertices in ascending order.
+        """
+        union, degrees = self._union, self._degrees
+        ### The graphs are undirected, hence the neighbors of a moved vertex are the vertices that have it as a neighbor.
+        adjacencies = _gather_ranges(union.indptr[moved], degrees[moved])
+        sources = union.indices[adjacencies]
+        added_colors = np.repeat(self._colors[moved], degrees[moved])
+        if self._ignore_counting:
+            ### A color leaves the set of a neighbor when the neighbor has no more adjacent vertices of that class.
+            stride = max(1, union.get_num_vertices())
+            emptied_keys, created_keys = self._neighbor_counts.move(self._reverse_adjacencies[adjacencies], sources, added_colors)
+            self._add_to_neighbor_hashes(emptied_keys // stride, np.uint64(0) - self._get_weights(emptied_keys % stride))
+            return self._add_to_neighbor_hashes(created_keys // stride, self._get_weights(created_keys % stride))
+        removed_colors = np.repeat(former_colors, degrees[moved])
+        order = np.argsort(sources)
+        return self._add_to_neighbor_hashes(sources[order], self._get_weights(added_colors[order]) - self._get_weights(removed_colors[order]))
+
+    def _split(self, touched: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ Split the classes of the touched vertices by their hashes and return the moved vertices and their former colors.
+
+            The untouched vertices of a class form one more part. It is never equal to a part of touched vertices,
+            since touched vertices have a neighbor in a new class and untouched vertices have none.
+        """
+        colors, class_sizes, class_starts = self._colors, self._class_sizes, self._class_starts
+        if len(touched) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        color_bits = max(1, (self._num_classes - 1).bit_length())
+        keys = (colors[touched].astype(np.uint64) << np.uint64(64 - color_bits)) | (self._neighbor_hashes[touched] >> np.uint64(color_bits))
+        ### Sorting by the keys orders the touched vertices by group, and the groups by color.
+        order = np.argsort(keys)
+        touched, keys = touched[order], keys[order]
+        first_touched = _get_run_starts(keys)
+        group_sizes = np.diff(np.append(first_touched, len(keys)))
+        group_of_touched = np.repeat(np.arange(len(group_sizes), dtype=np.int64), group_sizes)
+        group_colors = (keys[first_touched] >> np.uint64(64 - color_bits)).astype(np.int64)
+        first_groups = _get_run_starts(group_colors)
+        split_colors = group_colors[first_groups]
+        num_groups = np.diff(np.append(first_groups, len(group_colors)))
+        num_untouched = class_sizes[split_colors] - np.add.reduceat(group_sizes, first_groups)
+        is_split = (num_untouched > 0) | (num_groups > 1)
+        if not np.any(is_split):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        ### Only keep the groups of classes that split. Groups are ordered by color, since the color is in the high bits of the key.
+        is_split_group = np.repeat(is_split, num_groups)
+        split_group_index = np.cumsum(is_split_group) - 1
+        split_colors, num_groups, num_untouched = split_colors[is_split], num_groups[is_split], num_untouched[is_split]
+        group_sizes = group_sizes[is_split_group]
+        first_groups = np.cumsum(num_groups) - num_groups
+        group_class_index = np.repeat(np.arange(len(split_colors), dtype=np.int64), num_groups)
+        split_class_starts = class_starts[split_colors]
+
+        ### The largest part keeps the id of the class. Ties are broken in favor of the untouched part, which then never moves.
+        max_group_sizes = np.maximum.reduceat(group_sizes, first_groups)
+        keeps_untouched = num_untouched >= max_group_sizes
+        largest_groups = np.flatnonzero(group_sizes == max_group_sizes[group_class_index])
+        first_largest = _get_run_starts(group_class_index[largest_groups])
+        is_keeper_group = np.zeros(len(group_sizes), dtype=bool)
+        is_keeper_group[largest_groups[first_largest][~keeps_untouched]] = True
+
+        ### The untouched part comes first in the range of the class, followed by the groups of touched vertices.
+        touched_starts = split_class_starts + num_untouched
+        group_offsets = np.cumsum(group_sizes) - group_sizes
+        group_starts = np.repeat(touched_starts, num_groups) + group_offsets - np.repeat(group_offsets[first_groups], num_groups)
+
+        is_split_vertex = is_split_group[group_of_touched]
+        split_touched = touched[is_split_vertex]
+        split_touched_groups = split_group_index[group_of_touched[is_split_vertex]]
+        targets = np.repeat(group_starts, group_sizes) + np.arange(len(split_touched), dtype=np.int64) - np.repeat(group_offsets, group_sizes)
+
+        ### Swap the touched vertices that are in the range of the untouched part with the untouched vertices in the range of the touched ones.
+        # Both lists are ordered by class and have the same length per class.
+        current_positions = self._positions[split_touched]
+        vacated_positions = current_positions[current_positions < touched_starts[group_class_index[split_touched_groups]]]
+        self._is_touched[split_touched] = True
+        displaced_positions = targets[~self._is_touched[self._perm[targets]]]
+        self._is_touched[split_touched] = False
+        displaced = self._perm[displaced_positions]
+        self._perm[targets] = split_touched
+        self._perm[vacated_positions] = displaced
+        self._positions[split_touched] = targets
+        self._positions[displaced] = vacated_positions
+
+        ### Assign new ids to all parts except the largest one.
+        moves_untouched = (num_untouched > 0) & ~keeps_untouched
+        new_group_ids = self._num_classes + np.cumsum(~is_keeper_group) - 1
+        self._num_classes += int(np.count_nonzero(~is_keeper_group))
+        new_untouched_ids = self._num_classes + np.cumsum(moves_untouched) - 1
+        self._num_classes += int(np.count_nonzero(moves_untouched))
+
+        class_sizes[split_colors] = num_untouched
+        keeper_groups = np.flatnonzero(is_keeper_group)
+        class_starts[split_colors[group_class_index[keeper_groups]]] = group_starts[keeper_groups]
+        class_sizes[split_colors[group_class_index[keeper_groups]]] = group_sizes[keeper_groups]
+        moved_groups = np.flatnonzero(~is_keeper_group)
+        class_starts[new_group_ids[moved_groups]] = group_starts[moved_groups]
+        class_sizes[new_group_ids[moved_groups]] = group_sizes[moved_groups]
+        moved_untouched_classes = np.flatnonzero(moves_untouched)
+        class_starts[new_untouched_ids[moved_untouched_classes]] = split_class_starts[moved_untouched_classes]
+        class_sizes[new_untouched_ids[moved_untouched_classes]] = num_untouched[moved_untouched_classes]
+
+        is_moved_touched = ~is_keeper_group[split_touched_groups]
+        moved_touched = split_touched[is_moved_touched]
+        moved_untouched = self._perm[_gather_ranges(split_class_starts[moved_untouched_classes], num_untouched[moved_untouched_classes])]
+        moved = np.concatenate([moved_touched, moved_untouched])
+        former_colors = colors[moved]
+        colors[moved_touched] = new_group_ids[split_touched_groups[is_moved_touched]]
+        colors[moved_untouched] = np.repeat(new_untouched_ids[moved_untouched_classes], num_untouched[moved_untouched_classes])
+        return moved, former_colors
+
+    def run(self, check_stop: Callable[[], None] = lambda: None) -> RefinementResult:
+        """ Refine until each graph is stable or distinguished from all other graphs, like the depth first search over pykwl colorings.
+
+            A graph is stable in iteration i if its coloring in iteration i has as many colors as in iteration i - 1.
+            A graph that is alone in the union is only considered distinguished from iteration 2 on, like in the search.
+        """
+        union = self._union
+        num_vertices, num_graphs = union.get_num_vertices(), union.get_num_graphs()
+        graph_offsets = union.graph_offsets.tolist()
+
+        ### Number of vertices per graph and class. Classes only split, hence the partition of a graph changed iff its number of classes increased.
+        stride = max(1, num_vertices)
+        vertex_counts = _PairCounts(self._graph_ids, self._colors, stride)
+        ### The hash of the histogram of a graph is the sum of the weights of the colors of its vertices.
+        histogram_hashes = np.zeros(num_graphs, dtype=np.uint64)
+        np.add.at(histogram_hashes, self._graph_ids, _mix(self._colors))
+
+        is_alive = np.ones(num_graphs, dtype=bool)
+        stable_classes: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+        max_num_iterations = 0
+        num_rounds = 0
+        num_moved_vertices = 0
+        num_touched_vertices = 0
+        ### In the first round, all vertices can split.
+        touched = np.arange(num_vertices, dtype=np.int64)
+        while np.any(is_alive):
+            check_stop()
+            num_rounds += 1
+            moved, former_colors = self._split(touched)
+            num_touched_vertices += len(touched)
+            num_moved_vertices += len(moved)
+
+            moved_graph_ids = self._graph_ids[moved]
+            moved_colors = self._colors[moved]
+            np.add.at(histogram_hashes, moved_graph_ids, _mix(moved_colors) - _mix(former_colors))
+            emptied_keys, created_keys = vertex_counts.move(moved, moved_graph_ids, moved_colors)
+            is_changed = np.bincount(created_keys // stride, minlength=num_graphs) > np.bincount(emptied_keys // stride, minlength=num_graphs)
+
+            stable_graphs = np.flatnonzero(is_alive & ~is_changed)
+            for graph_id in stable_graphs.tolist():
+                begin, end = graph_offsets[graph_id], graph_offsets[graph_id + 1]
+                stable_classes[(num_rounds, np.sort(self._colors[begin:end]).tobytes())].append(graph_id)
+            is_alive[stable_graphs] = False
+            distinguished_graphs = np.zeros(0, dtype=np.int64)
+            if num_graphs > 1 or num_rounds >= 2:
+                alive_graphs = np.flatnonzero(is_alive)
+                _, inverse, num_equal = np.unique(histogram_hashes[alive_graphs], return_inverse=True, return_counts=True)
+                distinguished_graphs = alive_graphs[num_equal[inverse.reshape(-1)] == 1]
+                is_alive[distinguished_graphs] = False
+            if len(stable_graphs) > 0 or len(distinguished_graphs) > 0:
+                max_num_iterations = num_rounds
+            if np.any(is_alive):
+                touched = self._update_neighbor_hashes(moved, former_colors)
+
+        conflict_classes = []
+        for graph_ids in stable_classes.values():
+            if len(graph_ids) > 1:
+                conflict_classes.extend(self._verify_conflict_class(graph_ids))
+        return RefinementResult(conflict_classes, max_num_iterations, num_rounds, num_moved_vertices, num_touched_vertices)
+
+    def _verify_conflict_class(self, graph_ids: List[int]) -> List[List[int]]:
+        """ Return the conflict class if its coloring is stable. Otherwise, a collision of the hashes merged classes
+            and the graphs are grouped again by an exact refinement.
+        """
+        union = self._union
+        vertices = _gather_ranges(union.graph_offsets[graph_ids], np.diff(union.graph_offsets)[graph_ids])
+        ### The sources are indices into the vertices of the conflict class, such that only its vertices are counted per color.
+        sources = np.repeat(np.arange(len(vertices), dtype=np.int64), self._degrees[vertices])
+        neighbor_colors = self._colors[union.indices[_gather_ranges(union.indptr[vertices], self._degrees[vertices])]]
+        if self._ignore_counting:
+            keys = np.unique(sources * self._num_classes + neighbor_colors)
+            sources, neighbor_colors = keys // self._num_classes, keys % self._num_classes
+        if is_stable_coloring(sources, neighbor_colors, self._colors[vertices], self._num_classes):
+            return [graph_ids]
+        class_ids, _ = compute_coloring_classes([self._graphs[graph_id] for graph_id in graph_ids], self._ignore_counting)
+        classes = defaultdict(list)
+        for graph_id, class_id in zip(graph_ids, class_ids.tolist()):
+            classes[class_id].append(graph_id)
+        return [conflict_class for conflict_class in classes.values() if len(conflict_class) > 1]
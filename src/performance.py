@@ -1,4 +1,5 @@
 import os
+import resource
 
 
 def memory_usage():
@@ -7,3 +8,11 @@ def memory_usage():
     process = psutil.Process(os.getpid())
     mem = process.memory_info().rss / float(1024*1024)
     return mem
+
+
+def peak_memory_usage():
+    """ Return the peak memory usage in MB of this process and its largest terminated child process """
+    # On Linux, ru_maxrss is reported in KiB.
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1024.0
+
@@ -0,0 +1,170 @@
+import hashlib
+import sys
+
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from pymimir import PDDLParser, PDDLFactories, Problem, State, StateRepository, GroundedApplicableActionGenerator, ProblemColorFunction, StaticVertexColoredDigraph, create_object_graph, compute_sorted_vertex_colors
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .pykwl_utils import GraphArrays, to_graph_arrays
+
+import numpy as np
+import pynauty
+
+
+# Goal distance of dead ends, the same value as in pymimir.
+DEAD_END_GOAL_DISTANCE = sys.float_info.max
+
+
+@dataclass
+class PrunedStateSpace:
+    """ One representative state per class of isomorphic reachable states, found by a breadth-first search that only expands representatives.
+
+        The parser, the applicable action generator, and the state repository own the memory of the states, hence they are kept alive.
+    """
+    parser: PDDLParser
+    applicable_action_generator: GroundedApplicableActionGenerator
+    state_repository: StateRepository
+    color_function: ProblemColorFunction
+    representatives: List[State]
+    certificates: List[Tuple[int, int, bytes, Tuple[int]]]
+    goal_distances: List[float]
+    num_generated_states: int
+
+    def get_problem(self) -> Problem:
+        return self.parser.get_problem()
+
+    def get_pddl_factories(self) -> PDDLFactories:
+        return self.parser.get_pddl_factories()
+
+    def get_num_states(self) -> int:
+        return len(self.representatives)
+
+
+def compute_certificate(color_function: ProblemColorFunction, factories: PDDLFactories, problem: Problem, state: State, mark_true_goal_literals: bool) -> Tuple[int, int, bytes, Tuple[int]]:
+    """ Certificate of the object graph of the state: two states are isomorphic iff their certificates are equal.
+
+        It consists of the same parts as the certificate of pymimir's faithful abstractions.
+        The nauty certificate is computed with pynauty because the pymimir bindings return it as str, which fails for non utf-8 bytes.
+    """
+    object_graph = create_object_graph(color_function, factories, problem, state, mark_true_goal_literals=mark_true_goal_literals)
+    return compute_graph_certificate(object_graph, to_graph_arrays(object_graph))
+
+
+def create_nauty_graph(graph_arrays: GraphArrays) -> pynauty.Graph:
+    num_vertices = graph_arrays.get_num_vertices()
+    adjacency = { vertex: graph_arrays.indices[graph_arrays.indptr[vertex]:graph_arrays.indptr[vertex + 1]].tolist() for vertex in range(num_vertices) }
+    # Color classes in ascending order of the colors such that the partition is canonical.
+    color_classes = [set() for _ in range(int(graph_arrays.vertex_colors.max()) + 1)] if num_vertices > 0 else []
+    for vertex, color in enumerate(graph_arrays.vertex_colors.tolist()):
+        color_classes[color].add(vertex)
+    return pynauty.Graph(num_vertices, directed=False, adjacency_dict=adjacency, vertex_coloring=color_classes)
+
+
+def compute_graph_certificate(object_graph: StaticVertexColoredDigraph, graph_arrays: GraphArrays) -> Tuple[int, int, bytes, Tuple[int]]:
+    """ Certificate of an object graph whose array representation is already known.
+    """
+    return (graph_arrays.get_num_vertices(),
+            graph_arrays.get_num_edges(),
+            pynauty.certificate(create_nauty_graph(graph_arrays)),
+            tuple(compute_sorted_vertex_colors(object_graph)))
+
+
+def compute_certificate_key(color_function: ProblemColorFunction, factories: PDDLFactories, problem: Problem, state: State, mark_true_goal_literals: bool) -> bytes:
+    """ Compact digest of the certificate of the state, e.g., to identify isomorphic states across instances.
+    """
+    return get_certificate_key(compute_certificate(color_function, factories, problem, state, mark_true_goal_literals))
+
+
+def get_certificate_key(certificate: Tuple[int, int, bytes, Tuple[int]]) -> bytes:
+    num_vertices, num_edges, nauty_certificate, sorted_vertex_colors = certificate
+    digest = hashlib.blake2b(digest_size=32)
+    digest.update(np.array([num_vertices, num_edges, len(nauty_certificate), *sorted_vertex_colors], dtype=np.int64).tobytes())
+    digest.update(nauty_certificate)
+    return digest.digest()
+
+
+def create_pruned_state_space(domain_file_path: Path, problem_file_path: Path, max_num_states: int, mark_true_goal_literals: bool) -> Optional[PrunedStateSpace]:
+    """ Run a breadth-first search that keeps a single representative for each class of isomorphic states.
+
+        Successors of non-representative states are never generated because isomorphic states have isomorphic successors.
+        Returns None if there are more than max_num_states classes or if the initial state is unsolvable.
+        Goal distances are unit cost and DEAD_END_GOAL_DISTANCE for dead ends.
+    """
+    parser = PDDLParser(str(domain_file_path), str(problem_file_path))
+    problem = parser.get_problem()
+    factories = parser.get_pddl_factories()
+    applicable_action_generator = GroundedApplicableActionGenerator(problem, factories)
+    state_repository = StateRepository(applicable_action_generator)
+    color_function = ProblemColorFunction(problem)
+
+    static_initial_atoms = { literal.get_atom().get_identifier() for literal in problem.get_static_initial_literals() if not literal.is_negated() }
+    if any(literal.is_negated() == (literal.get_atom().get_identifier() in static_initial_atoms) for literal in problem.get_static_goal_condition()):
+        return None
+    fluent_goal = problem.get_fluent_goal_condition()
+    derived_goal = problem.get_derived_goal_condition()
+
+    representatives: List[State] = []
+    certificates: List[Tuple[int, int, bytes, Tuple[int]]] = []
+    class_by_certificate: Dict[Tuple[int, int, bytes, Tuple[int]], int] = dict()
+    # Concrete states are generated again and again, hence the class is remembered per state index.
+    class_by_state_index: Dict[int, int] = dict()
+    backward_edges: List[List[int]] = []
+    goal_classes: List[int] = []
+
+    def get_or_create_class(state: State) -> Tuple[int, bool]:
+        state_class = class_by_state_index.get(state.get_index())
+        if state_class is not None:
+            return state_class, False
+        certificate = compute_certificate(color_function, factories, problem, state, mark_true_goal_literals)
+        state_class = class_by_certificate.get(certificate)
+        is_new = state_class is None
+        if is_new:
+            state_class = len(representatives)
+            class_by_certificate[certificate] = state_class
+            representatives.append(state)
+            certificates.append(certificate)
+            backward_edges.append([])
+        class_by_state_index[state.get_index()] = state_class
+        return state_class, is_new
+
+    initial_class, _ = get_or_create_class(state_repository.get_or_create_initial_state())
+    queue: Deque[int] = deque([initial_class])
+    while queue:
+        state_class = queue.popleft()
+        state = representatives[state_class]
+        if state.literals_hold(fluent_goal) and state.literals_hold(derived_goal):
+            goal_classes.append(state_class)
+        for action in applicable_action_generator.compute_applicable_actions(state):
+            successor_class, is_new = get_or_create_class(state_repository.get_or_create_successor_state(state, action))
+            if is_new:
+                if len(representatives) > max_num_states:
+                    return None
+                queue.append(successor_class)
+            backward_edges[successor_class].append(state_class)
+
+    ### Goal distances by a backward breadth-first search from all goal classes.
+    goal_distances = [DEAD_END_GOAL_DISTANCE] * len(representatives)
+    for goal_class in goal_classes:
+        goal_distances[goal_class] = 0.0
+    queue = deque(goal_classes)
+    while queue:
+        state_class = queue.popleft()
+        for predecessor_class in backward_edges[state_class]:
+            if goal_distances[predecessor_class] == DEAD_END_GOAL_DISTANCE:
+                goal_distances[predecessor_class] = goal_distances[state_class] + 1.0
+                queue.append(predecessor_class)
+
+    if goal_distances[initial_class] == DEAD_END_GOAL_DISTANCE:
+        return None
+
+    return PrunedStateSpace(
+        parser,
+        applicable_action_generator,
+        state_repository,
+        color_function,
+        representatives,
+        certificates,
+        goal_distances,
+        state_repository.get_state_count())
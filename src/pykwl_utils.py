@@ -1,9 +1,77 @@
+import hashlib
+import numpy as np
 import pykwl as kwl
 
+from dataclasses import dataclass
 from pymimir import StaticVertexColoredDigraph, compute_vertex_colors
 
 
+@dataclass
+class GraphArrays:
+    """ Array representation of an undirected vertex colored object graph.
+
+        The vertex colors are remapped to 0, 1, ... in ascending order of the original colors
+        and the adjacency is stored in CSR format with both directions of each edge.
+    """
+    vertex_colors: np.ndarray  # int32, shape (n,)
+    indptr: np.ndarray         # int32, shape (n + 1,)
+    indices: np.ndarray        # int32, shape (2m,)
+
+    def get_num_vertices(self) -> int:
+        return len(self.vertex_colors)
+
+    def get_num_edges(self) -> int:
+        return len(self.indices) // 2
+
+    def get_sources(self) -> np.ndarray:
+        return np.repeat(np.arange(self.get_num_vertices(), dtype=np.int32), np.diff(self.indptr))
+
+    def nbytes(self) -> int:
+        return self.vertex_colors.nbytes + self.indptr.nbytes + self.indices.nbytes
+
+
+def to_graph_arrays(object_graph: StaticVertexColoredDigraph) -> GraphArrays:
+    num_vertices = object_graph.get_num_vertices()
+
+    # np.unique sorts the colors, hence the inverse is the rank of each color.
+    _, vertex_colors = np.unique(np.asarray(compute_vertex_colors(object_graph), dtype=np.int64), return_inverse=True)
+
+    # Fetching the edge list once is much cheaper than querying the adjacency of each vertex.
+    edges = object_graph.get_edges()
+    sources = np.fromiter((edge.get_source() for edge in edges), dtype=np.int32, count=len(edges))
+    targets = np.fromiter((edge.get_target() for edge in edges), dtype=np.int32, count=len(edges))
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(num_vertices + 1, dtype=np.int32)
+    np.cumsum(np.bincount(sources, minlength=num_vertices), out=indptr[1:])
+    indices = targets[order]
+
+    return GraphArrays(vertex_colors.astype(np.int32).reshape(-1), indptr, indices)
+
+
+def to_uvc_graph_from_arrays(graph_arrays: GraphArrays) -> kwl.EdgeColoredGraph:
+    wl_graph = kwl.EdgeColoredGraph(False)
+
+    # pykwl only exposes per element insertion, so we hand it plain Python ints in one sweep.
+    add_node = wl_graph.add_node
+    for label in (graph_arrays.vertex_colors + 1).tolist():  # coloring must start at 1
+        add_node(label)
+
+    # Antiparallel edges are added automatically in an undirected graph of pykwl.
+    sources = graph_arrays.get_sources()
+    targets = graph_arrays.indices
+    forward = sources < targets
+    add_edge = wl_graph.add_edge
+    for source_vertex_id, target_vertex_id in zip(sources[forward].tolist(), targets[forward].tolist()):
+        add_edge(source_vertex_id, target_vertex_id)
+    return wl_graph
+
+
 def to_uvc_graph(object_graph: StaticVertexColoredDigraph) -> kwl.EdgeColoredGraph:
+    return to_uvc_graph_from_arrays(to_graph_arrays(object_graph))
+
+
+def to_uvc_graph_elementwise(object_graph: StaticVertexColoredDigraph) -> kwl.EdgeColoredGraph:
+    """ Reference conversion that walks the object graph one element at a time. """
     wl_graph = kwl.EdgeColoredGraph(False)
 
     vertex_colors = compute_vertex_colors(object_graph)
@@ -23,3 +91,32 @@ def to_uvc_graph(object_graph: StaticVertexColoredDigraph) -> kwl.EdgeColoredGra
                 # Antiparallel edges are added automatically in an undirected graph of pykwl.
                 wl_graph.add_edge(source_vertex_id, target_vertex_index)
     return wl_graph
+
+
+# Bytes per ordered pair of nodes: pykwl's EdgeColoredGraph keeps two unordered_map<int, vector<int>> per node with an entry for every node,
+# and an entry of libstdc++ takes a 48 byte list node (next pointer, key, vector, cached hash) and an 8 byte bucket.
+UVC_GRAPH_BYTES_PER_NODE_PAIR = 2 * (48 + 8)
+# Bytes per undirected edge: both directions append an int to six per-node vectors and a label, rounded up for the slack of the vectors.
+UVC_GRAPH_BYTES_PER_EDGE = 64
+# Bytes per node: four empty vectors of 24 bytes, two unordered_map headers of 56 bytes, and the label, rounded up.
+UVC_GRAPH_BYTES_PER_NODE = 224
+
+
+def estimate_uvc_graph_nbytes(num_vertices: int, num_edges: int) -> int:
+    """ Rough estimate of the memory owned by a pykwl graph.
+
+        pykwl keeps two hash maps with an entry for every ordered pair of nodes,
+        hence the quadratic term dominates for all but the smallest graphs.
+    """
+    return UVC_GRAPH_BYTES_PER_NODE_PAIR * num_vertices * num_vertices + UVC_GRAPH_BYTES_PER_EDGE * num_edges + UVC_GRAPH_BYTES_PER_NODE * num_vertices
+
+
+def compute_coloring_signature(wl: kwl.WeisfeilerLeman, wl_graph: kwl.EdgeColoredGraph) -> bytes:
+    """ Compact hashable signature of the final k-WL coloring of a graph.
+
+        Colors are assigned by the color function of the WL instance,
+        hence signatures are only comparable if they were computed by the same instance.
+    """
+    is_stable, num_iterations, colors, counts = wl.compute_coloring(wl_graph)
+    coloring = np.array([int(is_stable), num_iterations, len(colors), *colors, *counts], dtype=np.int64)
+    return hashlib.blake2b(coloring.tobytes(), digest_size=16).digest()
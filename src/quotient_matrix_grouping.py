@@ -0,0 +1,175 @@
+import hashlib
+import shutil
+import tempfile
+
+import numpy as np
+
+from collections import defaultdict
+from itertools import chain
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+
+# Rough number of bytes that a single in-memory record costs including its share of the hash table.
+RECORD_NBYTES = 200
+
+# Fixed-width record of the spill file: 128-bit quotient matrix digest followed by the ids.
+SPILL_RECORD_DTYPE = np.dtype([
+    ("key_high", "<u8"),
+    ("key_low", "<u8"),
+    ("instance_id", "<i4"),
+    ("state_id", "<i4"),
+    ("v_star", "<i4")])
+
+INT32_MAX = np.iinfo(np.int32).max
+
+# Number of records per run that are read at once when merging the sorted runs.
+MERGE_BLOCK_SIZE = 1 << 16
+
+
+class QuotientMatrixGrouping:
+    """ Groups (instance_id, state_id, v_star) records by quotient matrix.
+
+        Quotient matrices are hashed to 128-bit keys and the records are grouped in memory.
+        Only once the estimated memory exceeds the budget, the records are sorted by key and
+        appended as a run of fixed-width binary records to a temporary spill file.
+        The sorted runs are merged through a memory map when the groups are requested.
+    """
+    def __init__(self, memory_budget: int):
+        self._memory_budget = memory_budget
+        self._groups: Dict[bytes, List[Tuple[int, int, int]]] = defaultdict(list)
+        self._num_records = 0
+        self._spill_directory = None
+        self._spill_file = None
+        self._runs: List[Tuple[int, int]] = []
+        # Values of v* that do not fit into int32, e.g., the distance of dead ends, are stored as negative codes.
+        self._large_v_star_codes: Dict[int, int] = dict()
+        self._large_v_stars: List[int] = []
+        self.num_spilled_records = 0
+
+    def add(self, quotient_matrix: str, instance_id: int, state_id: int, v_star: int):
+        key = hashlib.blake2b(quotient_matrix.encode(), digest_size=16).digest()
+        if v_star > INT32_MAX:
+            v_star = self._encode_large_v_star(v_star)
+        self._groups[key].append((instance_id, state_id, v_star))
+        self._num_records += 1
+        if self._num_records * RECORD_NBYTES > self._memory_budget:
+            self._spill()
+
+    def get_conflict_groups(self) -> List[List[Tuple[int, int, int]]]:
+        """ Return the groups that contain more than one record.
+        """
+        if self._spill_file is None:
+            conflict_groups = [group for group in self._groups.values() if len(group) > 1]
+        else:
+            self._spill()
+            self._spill_file.close()
+            records = np.memmap(self._spill_file.name, dtype=SPILL_RECORD_DTYPE, mode="r")
+            conflict_groups = []
+            for chunk in self._merge_runs(records):
+                conflict_groups.extend(_split_into_groups(chunk))
+            del records
+
+        if self._large_v_stars:
+            conflict_groups = [[(instance_id, state_id, self._decode_v_star(v_star)) for instance_id, state_id, v_star in group] for group in conflict_groups]
+        return conflict_groups
+
+    def close(self):
+        self._groups.clear()
+        self._num_records = 0
+        if self._spill_file is not None:
+            self._spill_file.close()
+            shutil.rmtree(self._spill_directory, ignore_errors=True)
+            self._spill_file = None
+            self._spill_directory = None
+            self._runs = []
+
+    def _encode_large_v_star(self, v_star: int) -> int:
+        code = self._large_v_star_codes.get(v_star)
+        if code is None:
+            self._large_v_stars.append(v_star)
+            code = -len(self._large_v_stars)
+            self._large_v_star_codes[v_star] = code
+        return code
+
+    def _decode_v_star(self, v_star: int) -> int:
+        return v_star if v_star >= 0 else self._large_v_stars[-v_star - 1]
+
+    def _spill(self):
+        """ Sort the in-memory records by key and append them as a new run to the spill file.
+        """
+        if self._spill_file is None:
+            self._spill_directory = tempfile.mkdtemp(prefix="quotient_matrices_")
+            self._spill_file = open(Path(self._spill_directory) / "records.bin", "wb")
+        if self._num_records == 0:
+            return
+
+        group_sizes = np.fromiter((len(group) for group in self._groups.values()), dtype=np.int64, count=len(self._groups))
+        keys = np.frombuffer(b"".join(self._groups.keys()), dtype=">u8").reshape(-1, 2)
+        ids = np.fromiter(chain.from_iterable(chain.from_iterable(self._groups.values())), dtype=np.int32, count=3 * self._num_records).reshape(-1, 3)
+        chunk = np.empty(self._num_records, dtype=SPILL_RECORD_DTYPE)
+        chunk["key_high"] = np.repeat(keys[:, 0], group_sizes)
+        chunk["key_low"] = np.repeat(keys[:, 1], group_sizes)
+        chunk["instance_id"] = ids[:, 0]
+        chunk["state_id"] = ids[:, 1]
+        chunk["v_star"] = ids[:, 2]
+        chunk = chunk[np.lexsort((chunk["key_low"], chunk["key_high"]))]
+
+        self._runs.append((self.num_spilled_records, self.num_spilled_records + len(chunk)))
+        chunk.tofile(self._spill_file)
+        self.num_spilled_records += self._num_records
+        self._groups.clear()
+        self._num_records = 0
+
+    def _merge_runs(self, records: np.ndarray) -> Iterator[np.ndarray]:
+        """ Merge the sorted runs blockwise and yield sorted chunks.
+
+            Records with the same key always end up in the same chunk:
+            a chunk only contains keys below the smallest last loaded key of all runs
+            that still have records on disk.
+        """
+        buffers = [records[begin:min(begin + MERGE_BLOCK_SIZE, end)] for begin, end in self._runs]
+        cursors = [min(begin + MERGE_BLOCK_SIZE, end) for begin, end in self._runs]
+        ends = [end for _, end in self._runs]
+
+        while any(len(buffer) > 0 for buffer in buffers):
+            unfinished = [i for i in range(len(buffers)) if cursors[i] < ends[i]]
+            frontier = min((buffers[i]["key_high"][-1] for i in unfinished), default=None)
+
+            parts = []
+            for i, buffer in enumerate(buffers):
+                split = len(buffer) if frontier is None else int(np.searchsorted(buffer["key_high"], frontier, side="left"))
+                parts.append(np.array(buffer[:split]))
+                buffers[i] = buffer[split:]
+
+            # Runs that define the frontier must load their next block to make progress.
+            for i in unfinished:
+                if buffers[i]["key_high"][-1] == frontier:
+                    next_cursor = min(cursors[i] + MERGE_BLOCK_SIZE, ends[i])
+                    buffers[i] = np.concatenate((np.array(buffers[i]), records[cursors[i]:next_cursor]))
+                    cursors[i] = next_cursor
+
+            chunk = np.concatenate(parts)
+            if len(chunk) > 0:
+                yield chunk[np.lexsort((chunk["key_low"], chunk["key_high"]))]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _split_into_groups(chunk: np.ndarray) -> List[List[Tuple[int, int, int]]]:
+    """ Split records sorted by key into the groups of equal keys that contain more than one record.
+    """
+    if len(chunk) < 2:
+        return []
+    key_changes = (chunk["key_high"][1:] != chunk["key_high"][:-1]) | (chunk["key_low"][1:] != chunk["key_low"][:-1])
+    boundaries = np.concatenate(([0], np.flatnonzero(key_changes) + 1, [len(chunk)]))
+    groups = []
+    for begin, end in zip(boundaries[:-1], boundaries[1:]):
+        if end - begin > 1:
+            group = chunk[begin:end]
+            groups.append(list(zip(group["instance_id"].tolist(), group["state_id"].tolist(), group["v_star"].tolist())))
+    return groups
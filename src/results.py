@@ -0,0 +1,20 @@
+import json
+import os
+
+from pathlib import Path
+from typing import Any, Dict
+
+
+# Increment whenever the meaning of an existing key changes or a key is removed.
+RESULTS_FORMAT_VERSION = 2
+
+
+def write_results(file_path: Path, results: Dict[str, Any]):
+    """ Write the results of a run as versioned JSON.
+
+        The file is written to a temporary file first such that readers never see a partial file.
+    """
+    temporary_file_path = file_path.with_name(file_path.name + ".tmp")
+    with open(temporary_file_path, "w") as file:
+        json.dump({ "version": RESULTS_FORMAT_VERSION, **results }, file, indent=2)
+    os.replace(temporary_file_path, file_path)
@@ -0,0 +1,302 @@
+import hashlib
+import importlib.metadata
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from dataclasses import dataclass
+from pathlib import Path
+from pymimir import FaithfulAbstraction, PDDLFactories, Problem, ProblemColorFunction, State, create_object_graph
+from typing import Any, Dict, List, Optional, Tuple
+
+from .instrumentation import Instrumentation
+from .pykwl_utils import GraphArrays, to_graph_arrays
+
+
+# Increment whenever the layout or the meaning of the stored arrays changes.
+STATE_DATA_FORMAT_VERSION = 2
+
+
+@dataclass
+class InstanceInformation:
+    problem_file_path: str
+    goal: Dict[str, List[str]]  # goal literals as strings by kind: fluent, derived, static
+    static_atoms: List[str]     # static atoms of the initial state as strings, shared by all states of the instance
+
+
+def create_instance_information(problem: Problem) -> InstanceInformation:
+    return InstanceInformation(
+        str(problem.get_filepath()),
+        {
+            "fluent": [str(literal) for literal in problem.get_fluent_goal_condition()],
+            "derived": [str(literal) for literal in problem.get_derived_goal_condition()],
+            "static": [str(literal) for literal in problem.get_static_goal_condition()]},
+        [str(literal.get_atom()) for literal in problem.get_static_initial_literals()])
+
+
+class AtomTable:
+    """ Numbers atoms by their string such that each atom of an instance is formatted only once.
+    """
+    def __init__(self):
+        self._atom_ids: Dict[str, int] = dict()
+        self._atom_ids_by_index: Dict[Tuple[int, bool, int], int] = dict()
+
+    def get_atom_id(self, atom_string: str) -> int:
+        return self._atom_ids.setdefault(atom_string, len(self._atom_ids))
+
+    def get_state_atom_ids(self, instance_id: int, factories: PDDLFactories, state: State) -> Tuple[List[int], List[int]]:
+        """ Return the ids of the fluent and of the derived atoms of the state, where the instance id identifies the factories.
+        """
+        def get_atom_ids(is_derived: bool, atom_indices: List[int]) -> List[int]:
+            atom_ids = []
+            for atom_index in atom_indices:
+                key = (instance_id, is_derived, atom_index)
+                atom_id = self._atom_ids_by_index.get(key)
+                if atom_id is None:
+                    atom = factories.get_derived_ground_atom(atom_index) if is_derived else factories.get_fluent_ground_atom(atom_index)
+                    atom_id = self._atom_ids_by_index[key] = self.get_atom_id(str(atom))
+                atom_ids.append(atom_id)
+            return atom_ids
+
+        return get_atom_ids(False, state.get_fluent_atoms()), get_atom_ids(True, state.get_derived_atoms())
+
+    def get_atom_strings(self) -> List[str]:
+        return list(self._atom_ids.keys())
+
+
+@dataclass
+class StateData:
+    """ Everything the analyses need to know about the representative states, without pymimir objects.
+
+        Row i describes one representative state.
+        Ragged data is stored flat, i.e., the values of row i are values[offsets[i]:offsets[i + 1]].
+        The CSR indptr of each graph has num_vertices + 1 entries, hence it starts at vertex_offsets[i] + i.
+    """
+    instances: List[InstanceInformation]
+    num_total_states: int
+    instance_ids: np.ndarray                      # int32, shape (n,)
+    state_ids: np.ndarray                         # int32, shape (n,), index of the abstract state in its faithful abstraction or pruned state space
+    v_stars: np.ndarray                           # float64, shape (n,), goal distances as reported by pymimir
+    coloring_offsets: np.ndarray                  # int64, shape (n + 1,)
+    canonical_initial_colorings: np.ndarray       # int64
+    vertex_offsets: np.ndarray                    # int64, shape (n + 1,)
+    vertex_colors: np.ndarray                     # int32
+    indptr: np.ndarray                            # int32
+    index_offsets: np.ndarray                     # int64, shape (n + 1,)
+    indices: np.ndarray                           # int32
+    state_indices: np.ndarray                     # int64, shape (n,), index of the representative state in pymimir
+    fluent_atom_offsets: np.ndarray               # int64, shape (n + 1,)
+    fluent_atoms: np.ndarray                      # int32, atom ids
+    derived_atom_offsets: np.ndarray              # int64, shape (n + 1,)
+    derived_atoms: np.ndarray                     # int32, atom ids
+    atom_string_offsets: np.ndarray               # int64, shape (num_atoms + 1,)
+    atom_strings: np.ndarray                      # uint8, utf-8 encoded
+
+    def get_num_states(self) -> int:
+        return len(self.instance_ids)
+
+    def get_canonical_initial_coloring(self, row: int) -> tuple:
+        return tuple(self.canonical_initial_colorings[self.coloring_offsets[row]:self.coloring_offsets[row + 1]].tolist())
+
+    def get_graph_arrays(self, row: int) -> GraphArrays:
+        vertex_begin, vertex_end = self.vertex_offsets[row], self.vertex_offsets[row + 1]
+        return GraphArrays(
+            self.vertex_colors[vertex_begin:vertex_end],
+            self.indptr[vertex_begin + row:vertex_end + row + 1],
+            self.indices[self.index_offsets[row]:self.index_offsets[row + 1]])
+
+    def get_state_string(self, row: int) -> str:
+        """ Return the state like State.to_string of pymimir does.
+        """
+        def join_atoms(offsets: np.ndarray, atoms: np.ndarray) -> str:
+            return ", ".join(self.atom_strings[self.atom_string_offsets[atom]:self.atom_string_offsets[atom + 1]].tobytes().decode() for atom in atoms[offsets[row]:offsets[row + 1]])
+
+        instance = self.instances[self.instance_ids[row]]
+        return (f"State(index={self.state_indices[row]}, fluent atoms=[{join_atoms(self.fluent_atom_offsets, self.fluent_atoms)}], "
+                f"static atoms=[{', '.join(instance.static_atoms)}], derived atoms=[{join_atoms(self.derived_atom_offsets, self.derived_atoms)}])")
+
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self._get_arrays().values())
+
+    def _get_arrays(self) -> Dict[str, np.ndarray]:
+        return { name: value for name, value in vars(self).items() if isinstance(value, np.ndarray) }
+
+
+class StateDataBuilder:
+    """ Collects the data of representative abstract states row by row.
+
+        The creation of object graphs is measured as stage object_graphs of the instrumentation.
+        States are stored as atom ids of the atom table and formatted only by StateData.get_state_string.
+    """
+    def __init__(self, mark_true_goal_literals: bool, instrumentation: Optional[Instrumentation] = None):
+        self._mark_true_goal_literals = mark_true_goal_literals
+        self._instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        self._instance_ids: List[int] = []
+        self._state_ids: List[int] = []
+        self._v_stars: List[float] = []
+        self._canonical_initial_colorings: List[List[int]] = []
+        self._graphs: List[GraphArrays] = []
+        self._state_indices: List[int] = []
+        self._fluent_atoms: List[List[int]] = []
+        self._derived_atoms: List[List[int]] = []
+        self._atom_table = AtomTable()
+
+    def add_abstract_state(self, instance_id: int, fa: FaithfulAbstraction, color_function: ProblemColorFunction, fa_state_index: int, row: Optional[int] = None):
+        fa_state = fa.get_states()[fa_state_index]
+        self.add_state(
+            instance_id,
+            fa.get_problem(),
+            fa.get_pddl_factories(),
+            color_function,
+            fa_state.get_representative_state(),
+            fa_state_index,
+            fa.get_goal_distances()[fa_state.get_index()],
+            fa_state.get_certificate().get_canonical_initial_coloring(),
+            row)
+
+    def add_state(self, instance_id: int, problem: Problem, factories: PDDLFactories, color_function: ProblemColorFunction, state: State, state_id: int, v_star: float, canonical_initial_coloring: List[int], row: Optional[int] = None):
+        with self._instrumentation.measure("object_graphs"):
+            object_graph = create_object_graph(color_function, factories, problem, state, mark_true_goal_literals=self._mark_true_goal_literals)
+            ### Unfortunately, the WL code is not integrated into pymimir.
+            # Hence, we have to translate the graph.
+            graph_arrays = to_graph_arrays(object_graph)
+        self._instrumentation.count("object_graphs")
+        fluent_atoms, derived_atoms = self._atom_table.get_state_atom_ids(instance_id, factories, state)
+        self.add_row(instance_id, state_id, v_star, canonical_initial_coloring, graph_arrays, state.get_index(), fluent_atoms, derived_atoms, row)
+
+    def get_atom_id(self, atom_string: str) -> int:
+        """ Return the id of the atom for add_row.
+        """
+        return self._atom_table.get_atom_id(atom_string)
+
+    def add_row(self, instance_id: int, state_id: int, v_star: float, canonical_initial_coloring: List[int], graph: GraphArrays, state_index: int, fluent_atoms: List[int], derived_atoms: List[int], row: Optional[int] = None):
+        """ Append a row or overwrite the given row.
+        """
+        columns = (self._instance_ids, self._state_ids, self._v_stars, self._canonical_initial_colorings, self._graphs, self._state_indices, self._fluent_atoms, self._derived_atoms)
+        values = (instance_id, state_id, v_star, canonical_initial_coloring, graph, state_index, fluent_atoms, derived_atoms)
+        for column, value in zip(columns, values):
+            if row is None:
+                column.append(value)
+            else:
+                column[row] = value
+
+    def get_num_states(self) -> int:
+        return len(self._instance_ids)
+
+    def build(self, instances: List[InstanceInformation], num_total_states: int, rows: Optional[List[int]] = None) -> StateData:
+        """ Build the state data from the given rows in the given order or from all rows.
+        """
+        if rows is not None:
+            return self._select(rows).build(instances, num_total_states)
+
+        def offsets(lengths) -> np.ndarray:
+            result = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(np.fromiter(lengths, dtype=np.int64, count=len(lengths)), out=result[1:])
+            return result
+
+        def concatenate(arrays, dtype) -> np.ndarray:
+            return np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.zeros(0, dtype=dtype)
+
+        atom_strings = [atom_string.encode() for atom_string in self._atom_table.get_atom_strings()]
+        return StateData(
+            instances,
+            num_total_states,
+            np.array(self._instance_ids, dtype=np.int32),
+            np.array(self._state_ids, dtype=np.int32),
+            np.array(self._v_stars, dtype=np.float64),
+            offsets([len(coloring) for coloring in self._canonical_initial_colorings]),
+            concatenate([np.asarray(coloring, dtype=np.int64) for coloring in self._canonical_initial_colorings], np.int64),
+            offsets([graph.get_num_vertices() for graph in self._graphs]),
+            concatenate([graph.vertex_colors for graph in self._graphs], np.int32),
+            concatenate([graph.indptr for graph in self._graphs], np.int32),
+            offsets([len(graph.indices) for graph in self._graphs]),
+            concatenate([graph.indices for graph in self._graphs], np.int32),
+            np.array(self._state_indices, dtype=np.int64),
+            offsets([len(atoms) for atoms in self._fluent_atoms]),
+            concatenate([np.asarray(atoms, dtype=np.int32) for atoms in self._fluent_atoms], np.int32),
+            offsets([len(atoms) for atoms in self._derived_atoms]),
+            concatenate([np.asarray(atoms, dtype=np.int32) for atoms in self._derived_atoms], np.int32),
+            offsets([len(atom_string) for atom_string in atom_strings]),
+            np.frombuffer(b"".join(atom_strings), dtype=np.uint8))
+
+
+    def _select(self, rows: List[int]) -> "StateDataBuilder":
+        builder = StateDataBuilder(self._mark_true_goal_literals)
+        builder._instance_ids = [self._instance_ids[row] for row in rows]
+        builder._state_ids = [self._state_ids[row] for row in rows]
+        builder._v_stars = [self._v_stars[row] for row in rows]
+        builder._canonical_initial_colorings = [self._canonical_initial_colorings[row] for row in rows]
+        builder._graphs = [self._graphs[row] for row in rows]
+        builder._state_indices = [self._state_indices[row] for row in rows]
+        builder._fluent_atoms = [self._fluent_atoms[row] for row in rows]
+        builder._derived_atoms = [self._derived_atoms[row] for row in rows]
+        builder._atom_table = self._atom_table
+        return builder
+
+
+def compute_state_data_key(kind: str, domain_file_path: Path, problem_file_paths: List[Path], options: Dict[str, Any]) -> str:
+    """ Content address of the state data of a run.
+
+        The key covers the contents and paths of the input files, the options that affect the generated data,
+        and the versions of pymimir and of the format.
+    """
+    def hash_file(file_path: Path) -> str:
+        return hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+    description = {
+        "format_version": STATE_DATA_FORMAT_VERSION,
+        "pymimir_version": importlib.metadata.version("pymimir"),
+        "kind": kind,
+        "options": options,
+        "domain": [str(domain_file_path), hash_file(domain_file_path)],
+        "problems": sorted([str(problem_file_path), hash_file(problem_file_path)] for problem_file_path in problem_file_paths) }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+def compute_state_data_digest(state_data: StateData) -> str:
+    """ Digest of the contents of the state data, e.g., to check that a checkpoint refers to the same states.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([state_data.num_total_states, [vars(instance) for instance in state_data.instances]], sort_keys=True).encode())
+    for name, array in sorted(state_data._get_arrays().items()):
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def save_state_data(cache_directory: Path, key: str, state_data: StateData):
+    """ Store the state data under its key. Concurrent writers of the same key are safe.
+    """
+    cache_directory.mkdir(parents=True, exist_ok=True)
+    metadata = {
+        "format_version": STATE_DATA_FORMAT_VERSION,
+        "num_total_states": state_data.num_total_states,
+        "instances": [vars(instance) for instance in state_data.instances] }
+    file_descriptor, temporary_file_path = tempfile.mkstemp(dir=cache_directory, suffix=".tmp")
+    os.fchmod(file_descriptor, 0o644)
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            np.savez(file, metadata=np.array(json.dumps(metadata)), **state_data._get_arrays())
+        os.replace(temporary_file_path, cache_directory / f"{key}.npz")
+    except BaseException:
+        os.unlink(temporary_file_path)
+        raise
+
+
+def load_state_data(cache_directory: Path, key: str) -> Optional[StateData]:
+    """ Return the state data stored under the key or None if there is none.
+    """
+    file_path = cache_directory / f"{key}.npz"
+    if not file_path.is_file():
+        return None
+    with np.load(file_path) as data:
+        metadata = json.loads(str(data["metadata"]))
+        if metadata["format_version"] != STATE_DATA_FORMAT_VERSION:
+            return None
+        arrays = { name: data[name] for name in data.files if name != "metadata" }
+    return StateData(
+        [InstanceInformation(**instance) for instance in metadata["instances"]],
+        metadata["num_total_states"],
+        **arrays)
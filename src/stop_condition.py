@@ -0,0 +1,42 @@
+import signal
+import time
+
+from typing import Optional
+
+
+class StopRequested(Exception):
+    """ Raised by StopCondition.check after a stop was requested. The argument is the reason.
+    """
+
+
+class StopCondition:
+    """ Records whether a run should stop early: on SIGTERM, on SIGXCPU, or when the soft time limit is reached.
+
+        The signal handlers only record the request. The drivers poll it between units of work,
+        hence a stop never interrupts the update of counters. Forked worker processes inherit the handlers and the deadline.
+    """
+    def __init__(self, soft_time_limit: Optional[float] = None):
+        self._deadline = time.monotonic() + soft_time_limit if soft_time_limit is not None else None
+        self.reason: Optional[str] = None
+
+    def install_signal_handlers(self):
+        for signal_number in [signal.SIGTERM, signal.SIGXCPU]:
+            signal.signal(signal_number, self._handle_signal)
+
+    def _handle_signal(self, signal_number: int, frame):
+        self.request(signal.Signals(signal_number).name)
+
+    def request(self, reason: str):
+        if self.reason is None:
+            self.reason = reason
+
+    def is_requested(self) -> bool:
+        if self.reason is None and self._deadline is not None and time.monotonic() >= self._deadline:
+            self.reason = "soft time limit"
+        return self.reason is not None
+
+    def check(self):
+        """ Raise StopRequested if a stop was requested.
+        """
+        if self.is_requested():
+            raise StopRequested(self.reason)
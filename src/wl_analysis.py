@@ -1,19 +1,29 @@
 from collections import defaultdict, deque
 from pathlib import Path
-from pymimir import State, StateSpaceOptions, StateSpace, FaithfulAbstractionOptions, FaithfulAbstraction, ProblemColorFunction, create_object_graph
-from typing import List, Tuple, Union, Deque, Dict
+from pymimir import StateSpaceOptions, StateSpace, FaithfulAbstractionOptions, FaithfulAbstraction, ProblemColorFunction
+from typing import List, Tuple, Union, Deque, Dict, Any, Optional
 from itertools import combinations
 from dataclasses import dataclass
 
-from .performance import memory_usage
+from .performance import peak_memory_usage
 from .logger import initialize_logger, add_console_handler
-from .pykwl_utils import to_uvc_graph
+from .pykwl_utils import to_uvc_graph_from_arrays, estimate_uvc_graph_nbytes
+from .parallel import imap_forked
+from .conflict_counting import ConflictCounts, count_conflicts, sample_conflict_pairs
+from .conflict_sink import ConflictSink
+from .results import write_results
+from .state_data import StateData, StateDataBuilder, create_instance_information, compute_state_data_key, load_state_data, save_state_data
+from .configuration import Configuration, group_by_mark_true_goal_atoms
+from .pruned_search import create_pruned_state_space
+from .stop_condition import StopCondition, StopRequested
+from .instrumentation import Instrumentation, MemorySampler, write_chrome_trace
+from .partition_refinement import SmallerHalfRefinement
 
 import pykwl as kwl
 
 
 class Driver:
-    def __init__(self, domain_file_path : Path, problem_file_path : Path, verbosity: str, enable_pruning: bool, max_num_states: int, ignore_counting: bool, mark_true_goal_atoms: bool):
+    def __init__(self, domain_file_path : Path, problem_file_path : Path, verbosity: str, enable_pruning: bool, max_num_states: int, configurations: List[Configuration], *, num_jobs: int = 1, escalate: bool = False, count_only: bool = False, num_example_pairs: int = 0, conflicts_file_path: Path = Path("conflicts.jsonl"), max_num_conflict_records: int = 10_000, results_file_path: Path = Path("results.json"), data_cache_directory: Optional[Path] = None, soft_time_limit: Optional[float] = None, trace_file_path: Optional[Path] = None, memory_sampling_interval: float = 0.1, wl1_backend: str = "pykwl"):
         self._domain_file_path = domain_file_path
         self._problem_file_path = problem_file_path
         self._logger = initialize_logger("wl")
@@ -21,45 +31,177 @@ class Driver:
         self._verbosity = verbosity.upper()
         self._enable_pruning = enable_pruning
         self._max_num_states = max_num_states
-        self._ignore_counting = ignore_counting
-        self._mark_true_goal_atoms = mark_true_goal_atoms
+        # Duplicates would only be evaluated twice.
+        self._configurations = list(dict.fromkeys(configurations))
+        self._configuration: Configuration = None
+        self._num_jobs = num_jobs
+        self._escalate = escalate
+        self._count_only = count_only
+        self._num_example_pairs = num_example_pairs
+        self._conflicts_file_path = conflicts_file_path
+        self._max_num_conflict_records = max_num_conflict_records
+        self._conflict_sink: ConflictSink = None
+        self._results_file_path = results_file_path
+        self._trace_file_path = trace_file_path
+        self._memory_sampler = MemorySampler(memory_sampling_interval, trace_file_path is not None) if memory_sampling_interval > 0 else None
+        self._instrumentation = Instrumentation(self._memory_sampler)
+        self._configuration_instrumentations: List[Instrumentation] = []
+        self._data_cache_directory = data_cache_directory
+        self._stop_condition = StopCondition(soft_time_limit)
+        self._wl1_backend = wl1_backend
         add_console_handler(self._logger)
 
-    def _generate_data(self) -> Tuple[StateSpace, FaithfulAbstraction]:
+    def _create_state_space(self) -> Optional[StateSpace]:
         state_space_options = StateSpaceOptions()
         state_space_options.use_unit_cost_one = True
         state_space_options.remove_if_unsolvable = True
         state_space_options.max_num_states = self._max_num_states
-        state_space = StateSpace.create(
-            str(self._domain_file_path),
-            str(self._problem_file_path),
-            state_space_options)
+        with self._instrumentation.measure("state_spaces"):
+            state_space = StateSpace.create(
+                str(self._domain_file_path),
+                str(self._problem_file_path),
+                state_space_options)
 
         if state_space is None:
-            print("State space is none")
-            return None
+            self._logger.info("[Pymimir] State space is none.")
+        return state_space
 
+    def _create_state_data(self, state_space: StateSpace, mark_true_goal_atoms: bool) -> Optional[StateData]:
         faithful_abstraction_options = FaithfulAbstractionOptions()
-        faithful_abstraction_options.mark_true_goal_literals = self._mark_true_goal_atoms
+        faithful_abstraction_options.mark_true_goal_literals = mark_true_goal_atoms
         faithful_abstraction_options.use_unit_cost_one = True
         faithful_abstraction_options.remove_if_unsolvable = True
         faithful_abstraction_options.compute_complete_abstraction_mapping = False
-        faithful_abstraction = FaithfulAbstraction.create(
-            state_space.get_problem(),
-            state_space.get_pddl_factories(),
-            state_space.get_aag(),
-            state_space.get_ssg(),
-            faithful_abstraction_options)
+        with self._instrumentation.measure("abstractions"):
+            faithful_abstraction = FaithfulAbstraction.create(
+                state_space.get_problem(),
+                state_space.get_pddl_factories(),
+                state_space.get_aag(),
+                state_space.get_ssg(),
+                faithful_abstraction_options)
 
         if faithful_abstraction is None:
             return None
 
-        return (state_space, faithful_abstraction)
+        builder = StateDataBuilder(mark_true_goal_atoms, self._instrumentation)
+        color_function = ProblemColorFunction(state_space.get_problem())
+        for fa_state_index in range(faithful_abstraction.get_num_states()):
+            builder.add_abstract_state(0, faithful_abstraction, color_function, fa_state_index)
+
+        return builder.build([create_instance_information(state_space.get_problem())], state_space.get_num_states())
+
+    def _create_pruned_state_data(self, mark_true_goal_atoms: bool) -> Optional[StateData]:
+        """ Create the state data with a search that only expands one representative per class of isomorphic states.
+
+            The concrete state space is never enumerated, hence the total number of states is the number of generated states.
+        """
+        with self._instrumentation.measure("pruned_search"):
+            pruned_state_space = create_pruned_state_space(self._domain_file_path, self._problem_file_path, self._max_num_states, mark_true_goal_atoms)
+        if pruned_state_space is None:
+            return None
+        self._logger.info(f"[Pruned search] [#P = {pruned_state_space.get_num_states()}, generated = {pruned_state_space.num_generated_states}]")
+
+        builder = StateDataBuilder(mark_true_goal_atoms, self._instrumentation)
+        problem = pruned_state_space.get_problem()
+        factories = pruned_state_space.get_pddl_factories()
+        for state_id, (state, certificate, v_star) in enumerate(zip(pruned_state_space.representatives, pruned_state_space.certificates, pruned_state_space.goal_distances)):
+            builder.add_state(0, problem, factories, pruned_state_space.color_function, state, state_id, v_star, list(certificate[3]))
+
+        return builder.build([create_instance_information(problem)], pruned_state_space.num_generated_states)
+
+    def _generate_data(self, mark_true_goal_atoms_values: List[bool]) -> Dict[bool, Optional[StateData]]:
+        """ Load the state data for each value of mark_true_goal_atoms from the data cache or create it with pymimir.
+
+            The state space is created at most once and shared by all abstractions.
+            With pruning, the marking of goal atoms changes which states are isomorphic, hence there is one pruned search per value.
+        """
+        state_data_by_value: Dict[bool, Optional[StateData]] = dict()
+        state_space = None
+        for mark_true_goal_atoms in mark_true_goal_atoms_values:
+            key = None
+            if self._data_cache_directory is not None:
+                key = compute_state_data_key("wl", self._domain_file_path, [self._problem_file_path], { "max_num_states": self._max_num_states, "mark_true_goal_atoms": mark_true_goal_atoms, "enable_pruning": self._enable_pruning })
+                state_data = load_state_data(self._data_cache_directory, key)
+                if state_data is not None:
+                    self._logger.info(f"[Data cache] Loaded state data {key}.")
+                    state_data_by_value[mark_true_goal_atoms] = state_data
+                    continue
+
+            if self._enable_pruning:
+                state_data = self._create_pruned_state_data(mark_true_goal_atoms)
+            else:
+                if state_space is None:
+                    state_space = self._create_state_space()
+                    if state_space is None:
+                        return { value: None for value in mark_true_goal_atoms_values }
+                state_data = self._create_state_data(state_space, mark_true_goal_atoms)
+            if state_data is not None and key is not None:
+                save_state_data(self._data_cache_directory, key, state_data)
+                self._logger.info(f"[Data cache] Stored state data {key}.")
+            state_data_by_value[mark_true_goal_atoms] = state_data
+        return state_data_by_value
+
+    def _create_state_record(self, state_data: StateData, state: int, v_star: int) -> Dict[str, Any]:
+        instance = state_data.instances[state_data.instance_ids[state]]
+        return {
+            "instance": instance.problem_file_path,
+            "cost": v_star,
+            "state": state_data.get_state_string(state),
+            "goal": instance.goal}
+
+    def _report_conflict_class(self, k: int, state_data: StateData, conflict_class: List[Tuple[int, int]]) -> ConflictCounts:
+        """ Log the conflicts of a class of (state, v_star) pairs, write pairs of them to the conflicts file, and return the counts.
+        """
+        conflict_counts = count_conflicts([v_star for _, v_star in conflict_class])
+
+        if self._count_only:
+            pairs = sample_conflict_pairs(conflict_class, lambda element: element[1], self._num_example_pairs)
+        else:
+            pairs = combinations(conflict_class, 2)
+
+        self._logger.info(f"[{k}-FWL] Conflict class: [size = {len(conflict_class)}, #C = {conflict_counts.total}, #V = {conflict_counts.value}]")
 
-    def _validate_wl_correctness_iteratively(self, k: int, state_space: StateSpace, fa: FaithfulAbstraction, partition: List[Tuple[State, int, kwl.EdgeColoredGraph]]):
+        for (state_1, v_star_1), (state_2, v_star_2) in pairs:
+            ### States are only serialized if the sink has not reached its limit.
+            create_record = lambda: {
+                "configuration": self._configuration.get_name(),
+                "wl": f"{k}-FWL",
+                "value_conflict": v_star_1 != v_star_2,
+                "state_1": self._create_state_record(state_data, state_1, v_star_1),
+                "state_2": self._create_state_record(state_data, state_2, v_star_2)}
+            if not self._conflict_sink.write(create_record):
+                break
+
+        return conflict_counts
+
+    def _validate_wl_correctness_by_partition_refinement(self, state_data: StateData, partition: List[Tuple[int, int, kwl.EdgeColoredGraph]], instrumentation: Instrumentation):
+        """ 1-WL counterpart of _validate_wl_correctness_iteratively that refines all graphs of the partition at once by smaller-half partition refinement.
+
+            Returns the same conflicts and, up to how pykwl detects stable colorings, the same maximum number of iterations.
+        """
+        instrumentation.count("states", len(partition))
+
+        with instrumentation.measure("refinement"):
+            refinement = SmallerHalfRefinement([state_data.get_graph_arrays(state) for state, _, _ in partition], self._configuration.ignore_counting)
+            result = refinement.run(self._stop_condition.check)
+        instrumentation.count("refinement_rounds", result.num_rounds)
+        instrumentation.count("moved_vertices", result.num_moved_vertices)
+        instrumentation.count("touched_vertices", result.num_touched_vertices)
+
+        total_conflicts = 0
+        value_conflicts = 0
+        for conflict_class in result.conflict_classes:
+            conflict_counts = self._report_conflict_class(1, state_data, [partition[i][:2] for i in conflict_class])
+            total_conflicts += conflict_counts.total
+            value_conflicts += conflict_counts.value
+
+        return total_conflicts, value_conflicts, result.max_num_iterations
+
+    def _validate_wl_correctness_iteratively(self, k: int, state_data: StateData, partition: List[Tuple[int, int, kwl.EdgeColoredGraph]], instrumentation: Instrumentation):
         """ The idea of the iterative solution is to run a standard DFS.
             Each node gets it own instantiation of WL because the colors in such a partition are identical.
         """
+        instrumentation.count("states", len(partition))
 
         total_conflicts = 0
         value_conflicts = 0
@@ -68,22 +210,25 @@ class Driver:
         @dataclass
         class SearchNode:
             wl : kwl.WeisfeilerLeman
-            partition: List[Tuple[int, State, int, kwl.EdgeColoredGraph, kwl.GraphColoring, kwl.GraphColoring]]
+            partition: List[Tuple[int, int, kwl.EdgeColoredGraph, kwl.GraphColoring, kwl.GraphColoring]]
             num_previous_iterations: int
 
         partition_ext = []
-        wl = kwl.WeisfeilerLeman(k, self._ignore_counting)
-        for state, v_star, kwl_graph in partition:
-            current_coloring = wl.compute_initial_coloring(kwl_graph)
-            # We only care data compatibility between current and next coloring, so we can call compute_initial_coloring again.
-            next_coloring = wl.compute_initial_coloring(kwl_graph)
-            partition_ext.append((state, v_star, kwl_graph, current_coloring, next_coloring))
+        wl = kwl.WeisfeilerLeman(k, self._configuration.ignore_counting)
+        with instrumentation.measure("initial_colorings"):
+            for state, v_star, kwl_graph in partition:
+                current_coloring = wl.compute_initial_coloring(kwl_graph)
+                # We only care data compatibility between current and next coloring, so we can call compute_initial_coloring again.
+                next_coloring = wl.compute_initial_coloring(kwl_graph)
+                partition_ext.append((state, v_star, kwl_graph, current_coloring, next_coloring))
 
         queue : Deque[SearchNode] = deque()
         queue.append(SearchNode(wl, partition_ext, 0))
 
         while queue:
+            self._stop_condition.check()
             cur_node = queue.pop()
+            instrumentation.count("search_nodes")
             cur_wl = cur_node.wl
             cur_partition = cur_node.partition
             cur_num_prev_iterations = cur_node.num_previous_iterations
@@ -99,6 +244,7 @@ class Driver:
 
             colorings_by_state = dict()
 
+            num_refinement_steps = 0
             while True:
                 all_stable = True
 
@@ -114,14 +260,16 @@ class Driver:
                         continue
 
                     is_stable = cur_wl.compute_next_coloring(kwl_graph, current_coloring, next_coloring)
+                    num_refinement_steps += 1
 
                     if is_stable:
                         is_stable_state[state] = True
                     else:
                         all_stable = False
 
+                    # get_frequencies iterates over a hash map, hence identical colorings can be listed in different orders.
                     colors, counts = next_coloring.get_frequencies()
-                    coloring = (num_iterations, tuple(colors), tuple(counts))
+                    coloring = (num_iterations, tuple(sorted(zip(colors, counts))))
                     colorings.add(coloring)
                     colorings_by_state[state] = coloring
 
@@ -138,6 +286,8 @@ class Driver:
                     # All are stable
                     break
 
+            instrumentation.count("refinement_steps", num_refinement_steps)
+
             # 1.2 Compute the new partitioning
             partitioning = defaultdict(list)
             for (state, v_star, wl_graph, current_coloring, next_coloring) in cur_partition:
@@ -155,90 +305,264 @@ class Driver:
 
                     if len(sub_partition) > 1:
 
-                        for (state_1, v_star_1, _, _, _), (state_2, v_star_2, _, _, _) in combinations(sub_partition, 2):
-
-                            if v_star_1 != v_star_2:
-                                value_conflicts += 1
-                                self._logger.info(f"[{k}-FWL] Value conflict!")
-                            else:
-                                self._logger.info(f"[{k}-FWL] Conflict!")
-                            total_conflicts += 1
-
-
-                            self._logger.info(f" > Cost: {v_star_1}; State 1: {state_1.to_string(fa.get_problem(), fa.get_pddl_factories())}")
-                            self._logger.info(f" > Cost: {v_star_2}; State 2: {state_2.to_string(fa.get_problem(), fa.get_pddl_factories())}")
-                            self._logger.info(f"Goal 1: fluent={[str(literal) for literal in fa.get_problem().get_fluent_goal_condition()]}, derived={[str(literal) for literal in fa.get_problem().get_derived_goal_condition()]}, static={[str(literal) for literal in fa.get_problem().get_static_goal_condition()]}")
-                            self._logger.info(f"Goal 2: fluent={[str(literal) for literal in fa.get_problem().get_fluent_goal_condition()]}, derived={[str(literal) for literal in fa.get_problem().get_derived_goal_condition()]}, static={[str(literal) for literal in fa.get_problem().get_static_goal_condition()]}")
-
+                        conflict_counts = self._report_conflict_class(k, state_data, [(state, v_star) for state, v_star, _, _, _ in sub_partition])
+                        total_conflicts += conflict_counts.total
+                        value_conflicts += conflict_counts.value
 
                 else:
                     # Inductive case:
 
-                    queue.append(SearchNode(kwl.WeisfeilerLeman(k, self._ignore_counting), sub_partition, num_iterations))
+                    queue.append(SearchNode(kwl.WeisfeilerLeman(k, self._configuration.ignore_counting), sub_partition, num_iterations))
 
             # self._logger.info(f"Finished partition with color function size {wl.get_coloring_function_size()}")
 
         return total_conflicts, value_conflicts, max_num_iterations
 
 
-    def _validate_wl_correctness(self, k: int, state_space: StateSpace, faithful_abstraction: FaithfulAbstraction) -> Tuple[int, int, int]:
-        # Test representatives from each partition to see if two are mapped to the same class.
+    def _create_initial_partitions(self, state_data: StateData) -> Dict[str, List[Tuple[int, int, kwl.EdgeColoredGraph]]]:
+        """ Partition the representative states by canonical initial coloring.
+
+            The graphs are created once and shared by all k.
+        """
+        initial_partitionings: Dict[Tuple[int], List[Tuple[int, int, kwl.EdgeColoredGraph]]] = defaultdict(list)
+        num_graph_bytes = 0
+        for state in range(state_data.get_num_states()):
+            graph_arrays = state_data.get_graph_arrays(state)
+            kwl_graph = to_uvc_graph_from_arrays(graph_arrays)
+            num_graph_bytes += estimate_uvc_graph_nbytes(graph_arrays.get_num_vertices(), graph_arrays.get_num_edges())
+
+            initial_partitionings[state_data.get_canonical_initial_coloring(state)].append((state, state_data.v_stars[state].item(), kwl_graph))
+
+        self._logger.info(f"[Graphs] Created {state_data.get_num_states()} graphs in {len(initial_partitionings)} initial partitions.")
+        self._logger.info(f"[Graphs] Estimated memory usage of graphs: {num_graph_bytes // (1024 * 1024)} MiB.")
+        self._logger.info(f"[Graphs] Peak memory usage: {int(peak_memory_usage())} MiB.")
+
+        return { f"with canonical initial coloring {canonical_initial_coloring}": initial_partition for canonical_initial_coloring, initial_partition in initial_partitionings.items() }
+
+    def _validate_partitions(self, k: int, state_data: StateData, partitions: Dict[str, List[Tuple[int, int, kwl.EdgeColoredGraph]]], instrumentation: Instrumentation) -> Tuple[int, int, int, Dict[str, Tuple[int, int]], int]:
+        """ Validate each partition independently and return the sums of the conflicts, the maximum number of iterations,
+            the total conflicts and the maximum number of iterations of each validated partition, and the number of validated partitions.
+            The instrumentations of the partitions are merged into the given one.
 
+            On a stop request, partitions that are not completed are discarded and the results cover the completed ones.
+        """
         total_conflicts = 0
         value_conflicts = 0
         max_num_iterations = 0
+        partition_results: Dict[str, Tuple[int, int]] = dict()
+        num_processed_partitions = 0
 
-        initial_partitionings: Dict[Tuple[int], List[Tuple[int, State, kwl.EdgeColoredGraph]]] = defaultdict(list)
-        color_function = ProblemColorFunction(state_space.get_problem())
-        goal_distances = faithful_abstraction.get_goal_distances()
-        for abstract_state in faithful_abstraction.get_states():
-            certificate = abstract_state.get_certificate()
-            v_star = goal_distances[abstract_state.get_index()]
-            state = abstract_state.get_representative_state()
-            object_graph = create_object_graph(color_function, state_space.get_pddl_factories(), state_space.get_problem(), state, self._mark_true_goal_atoms)
-            kwl_graph = to_uvc_graph(object_graph)
-
-            initial_partitionings[tuple(certificate.get_canonical_initial_coloring())].append((state, v_star, kwl_graph))
+        def validate_partition(name: str) -> Tuple[int, int, int, Dict[str, Any]]:
+            self._logger.info(f"Processing partitioning {name}")
 
-        for canonical_initial_coloring, initial_partition in initial_partitionings.items():
+            ### Workers cannot add to the instrumentation of the parent, hence each partition returns a snapshot of its own.
+            partition_instrumentation = Instrumentation(self._memory_sampler, "partition")
+            with partition_instrumentation.measure("partitions"):
+                if k == 1 and self._wl1_backend == "partition-refinement":
+                    result = self._validate_wl_correctness_by_partition_refinement(state_data, partitions[name], partition_instrumentation)
+                else:
+                    result = self._validate_wl_correctness_iteratively(k, state_data, partitions[name], partition_instrumentation)
+            return (*result, partition_instrumentation.get_snapshot())
+
+        if self._num_jobs <= 1:
+            results = ((name, validate_partition(name)) for name in partitions.keys())
+        else:
+            ### Partitions share no state. Workers are forked such that they share the graphs with the parent.
+            # Large partitions are scheduled first to avoid a long tail.
+            schedule = sorted(partitions.keys(), key=lambda name: -len(partitions[name]))
+            results = imap_forked(validate_partition, schedule, self._num_jobs, self._logger, self._stop_condition.is_requested)
+
+        try:
+            for name, (total_conflicts_i, value_conflicts_i, max_num_iterations_i, snapshot_i) in results:
+                total_conflicts += total_conflicts_i
+                value_conflicts += value_conflicts_i
+                max_num_iterations = max(max_num_iterations, max_num_iterations_i)
+                partition_results[name] = (total_conflicts_i, max_num_iterations_i)
+                instrumentation.merge(snapshot_i)
+                num_processed_partitions += 1
+        except StopRequested as stop_request:
+            # Workers that receive a signal themselves report it through their result.
+            self._stop_condition.request(str(stop_request))
+        if self._stop_condition.is_requested():
+            self._logger.info(f"[Stop] Stopped on {self._stop_condition.reason} after {num_processed_partitions} of {len(partitions)} partitions.")
+
+        return total_conflicts, value_conflicts, max_num_iterations, partition_results, num_processed_partitions
+
+    def _validate_wl_correctness(self, k: int, state_data: StateData, initial_partitions: Dict[str, List[Tuple[int, int, kwl.EdgeColoredGraph]]], instrumentation: Instrumentation) -> Tuple[int, int, int, int]:
+        # Test representatives from each partition to see if two are mapped to the same class.
 
-            self._logger.info(f"Processing partitioning with canonical initial coloring {canonical_initial_coloring}")
+        total_conflicts, value_conflicts, max_num_iterations, _, num_processed_partitions = self._validate_partitions(k, state_data, initial_partitions, instrumentation)
 
-            total_conflicts_i, value_conflicts_i, max_num_iterations_i = self._validate_wl_correctness_iteratively(k, state_space, faithful_abstraction, initial_partition)
-            total_conflicts += total_conflicts_i
-            value_conflicts += value_conflicts_i
-            max_num_iterations = max(max_num_iterations, max_num_iterations_i)
+        return total_conflicts, value_conflicts, max_num_iterations, num_processed_partitions
 
-        return total_conflicts, value_conflicts, max_num_iterations
+    def _validate_wl_correctness_escalating(self, state_data: StateData, initial_partitions: Dict[str, List[Tuple[int, int, kwl.EdgeColoredGraph]]], instrumentation: Instrumentation) -> Tuple[List[int], List[int], List[int], List[int], List[int], bool]:
+        """ Run 1-WL on the initial partitions and, if it has conflicts, 2-FWL only on the initial partitions that can change the results of 2-FWL.
 
+            2-FWL refines 1-WL round by round, hence it separates two states no later than 1-WL does.
+            An initial partition of several states without 1-WL conflicts thus has no 2-FWL conflicts and needs at most as many 2-FWL iterations as 1-WL iterations.
+            Such a partition is skipped if its 1-WL iterations do not exceed the 2-FWL iterations of the validated partitions.
+            The validated partitions are the same as in the non-escalating run, hence the results are the same.
+            Also returns the number of partitions of each stage, how many of them were validated, and whether all stages completed.
+        """
+        total_conflicts = [0, 0]
+        value_conflicts = [0, 0]
+        max_num_iterations = [0, 0]
+        num_partitions = [len(initial_partitions), 0]
+        num_processed_partitions = [0, 0]
+
+        self._logger.info(f"[1-WL] Run validation on {len(initial_partitions)} partitions...")
+        with instrumentation.measure("validate_1wl"):
+            total_conflicts[0], value_conflicts[0], max_num_iterations[0], wl1_results, num_processed_partitions[0] = self._validate_partitions(1, state_data, initial_partitions, instrumentation)
+        if total_conflicts[0] == 0 or num_processed_partitions[0] < num_partitions[0]:
+            return total_conflicts, value_conflicts, max_num_iterations, num_partitions, num_processed_partitions, num_processed_partitions[0] == num_partitions[0]
+
+        ### Partitions with 1-WL conflicts and single states are always validated. The others only if their 1-WL iterations exceed the 2-FWL iterations so far.
+        stages = [
+            [name for name, partition in initial_partitions.items() if wl1_results[name][0] > 0 or len(partition) == 1],
+            [name for name, partition in initial_partitions.items() if wl1_results[name][0] == 0 and len(partition) > 1]]
+        for stage_index, names in enumerate(stages):
+            if stage_index > 0:
+                names = [name for name in names if wl1_results[name][1] > max_num_iterations[1]]
+            if not names:
+                continue
+            num_partitions[1] += len(names)
+            if self._stop_condition.is_requested():
+                return total_conflicts, value_conflicts, max_num_iterations, num_partitions, num_processed_partitions, False
+            self._logger.info(f"[2-FWL] Run validation on {len(names)} of {len(initial_partitions)} partitions...")
+            with instrumentation.measure("validate_2wl"):
+                total_conflicts_i, value_conflicts_i, max_num_iterations_i, _, num_processed_partitions_i = self._validate_partitions(2, state_data, { name: initial_partitions[name] for name in names }, instrumentation)
+            total_conflicts[1] += total_conflicts_i
+            value_conflicts[1] += value_conflicts_i
+            max_num_iterations[1] = max(max_num_iterations[1], max_num_iterations_i)
+            num_processed_partitions[1] += num_processed_partitions_i
+
+        return total_conflicts, value_conflicts, max_num_iterations, num_partitions, num_processed_partitions, num_processed_partitions == num_partitions
+
+    def _evaluate_configuration(self, state_data: StateData, initial_partitions: Dict[str, List[Tuple[int, int, kwl.EdgeColoredGraph]]]) -> Dict[str, Any]:
+        """ Validate the current configuration on the state data and return its section of the results.
+        """
+        configuration = self._configuration
+        instrumentation = Instrumentation(self._memory_sampler, configuration.get_name())
+        self._configuration_instrumentations.append(instrumentation)
+        self._logger.info(f"[Configuration] Evaluating {configuration.get_name()}: [ignore_counting = {configuration.ignore_counting}, mark_true_goal_atoms = {configuration.mark_true_goal_atoms}]")
+
+        self._conflict_sink.reset_num_records()
+        if self._escalate:
+            total_conflicts, value_conflicts, max_num_iterations, num_partitions, num_processed_partitions, completed = self._validate_wl_correctness_escalating(state_data, initial_partitions, instrumentation)
+        else:
+            total_conflicts = [0, 0]
+            value_conflicts = [0, 0]
+            max_num_iterations = [0, 0]
+            num_partitions = [0, 0]
+            num_processed_partitions = [0, 0]
+            self._logger.info("[1-WL] Run validation...")
+            num_partitions[0] = len(initial_partitions)
+            with instrumentation.measure("validate_1wl"):
+                total_conflicts[0], value_conflicts[0], max_num_iterations[0], num_processed_partitions[0] = self._validate_wl_correctness(1, state_data, initial_partitions, instrumentation)
+            completed = num_processed_partitions[0] == num_partitions[0]
+            if total_conflicts[0] > 0 and completed:
+                num_partitions[1] = len(initial_partitions)
+                if self._stop_condition.is_requested():
+                    completed = False
+                else:
+                    self._logger.info("[2-FWL] Run validation...")
+                    with instrumentation.measure("validate_2wl"):
+                        total_conflicts[1], value_conflicts[1], max_num_iterations[1], num_processed_partitions[1] = self._validate_wl_correctness(2, state_data, initial_partitions, instrumentation)
+                    completed = num_processed_partitions[1] == num_partitions[1]
+        self._logger.info(f"[WL] Conflict records written to {self._conflicts_file_path}: {self._conflict_sink.get_num_records()}")
+
+        self._logger.info(f"[Results] Configuration: [enable_pruning = {self._enable_pruning}, max_num_states = {self._max_num_states}, ignore_counting = {configuration.ignore_counting}, mark_true_goal_atoms = {configuration.mark_true_goal_atoms}]")
+        self._logger.info(f"[Results] Table row: [#P = {state_data.get_num_states()}, #S = {state_data.num_total_states}, #I = {max_num_iterations}, #C = {total_conflicts}, #V = {value_conflicts}]")
+        ### The fraction covers the stages that were started or were about to start. After a partial 1-WL stage, it is unknown whether 2-FWL is needed.
+        if not completed:
+            self._logger.info(f"[Results] Partial results of {num_processed_partitions} of {num_partitions} partitions per WL.")
+
+        return {
+            "name": configuration.get_name(),
+            "configuration": configuration.to_dict(),
+            "completed": completed,
+            "num_final_states": state_data.get_num_states(),
+            "num_total_states": state_data.num_total_states,
+            "num_initial_partitions": len(initial_partitions),
+            "num_partitions": num_partitions,
+            "num_processed_partitions": num_processed_partitions,
+            "fraction_processed_partitions": sum(num_processed_partitions) / sum(num_partitions) if sum(num_partitions) > 0 else 1.0,
+            "max_num_iterations": max_num_iterations,
+            "total_conflicts": total_conflicts,
+            "value_conflicts": value_conflicts,
+            "num_conflict_records": self._conflict_sink.get_num_records(),
+            **instrumentation.to_dict() }
 
     def run(self):
         """ Main loop for computing k-WL and Aut(S(P)) for state space S(P).
         """
-        """ Main loop for computing k-WL and Aut(S(P)) for state space S(P).
-        """
-        self._logger.info(f"[Configuration] [enable_pruning = {self._enable_pruning}, max_num_states = {self._max_num_states}, ignore_counting = {self._ignore_counting}, mark_true_goal_atoms = {self._mark_true_goal_atoms}]")
+        self._logger.info(f"[Configuration] [enable_pruning = {self._enable_pruning}, max_num_states = {self._max_num_states}, escalate = {self._escalate}]")
+        self._logger.info(f"[Configuration] Configurations: {', '.join(configuration.get_name() for configuration in self._configurations)}")
         self._logger.info(f"[Configuration] Domain file: {self._domain_file_path}")
         self._logger.info(f"[Configuration] Problem file: {self._problem_file_path}")
 
+        configurations_by_value = group_by_mark_true_goal_atoms(self._configurations)
+        self._stop_condition.install_signal_handlers()
+
         self._logger.info("[Pymimir] Generating pairwise non isomorphic states.")
-        data = self._generate_data()
-        self._logger.info(f"[Pymimir] Peak memory usage: {int(memory_usage())} MiB.")
-        if data is None:
+        with self._instrumentation.measure("generate_data"):
+            state_data_by_value = self._generate_data(list(configurations_by_value.keys()))
+        self._logger.info(f"[Pymimir] Peak memory usage: {int(peak_memory_usage())} MiB.")
+        if any(state_data is None for state_data in state_data_by_value.values()):
             self._logger.info(f"[Pymimir] Got empty set of gfas. Aborting.")
             return
 
-        state_space, faithful_abstraction = data
-
-        total_conflicts = [0, 0]
-        value_conflicts = [0, 0]
-        max_num_iterations = [0, 0]
-        self._logger.info("[1-WL] Run validation...")
-        total_conflicts[0], value_conflicts[0], max_num_iterations[0] = self._validate_wl_correctness(1, state_space, faithful_abstraction)
-        if total_conflicts[0] > 0:
-            self._logger.info("[2-FWL] Run validation...")
-            total_conflicts[1], value_conflicts[1], max_num_iterations[1] = self._validate_wl_correctness(2, state_space, faithful_abstraction)
-
-        self._logger.info("[Results] Ran to completion.")
+        sections: Dict[Configuration, Dict[str, Any]] = dict()
+        self._conflict_sink = ConflictSink(self._conflicts_file_path, self._max_num_conflict_records)
+        for mark_true_goal_atoms, configurations in configurations_by_value.items():
+            if self._stop_condition.is_requested():
+                break
+            state_data = state_data_by_value[mark_true_goal_atoms]
+            ### The graphs only depend on the state data, hence all configurations that use the same state data share them.
+            with self._instrumentation.measure("create_graphs"):
+                initial_partitions = self._create_initial_partitions(state_data)
+            for configuration in configurations:
+                if self._stop_condition.is_requested():
+                    break
+                self._configuration = configuration
+                sections[configuration] = self._evaluate_configuration(state_data, initial_partitions)
+            del initial_partitions
+        self._configuration = None
+        self._conflict_sink.close()
+
+        ### Configurations that were not started because of a stop request only report that they processed nothing.
+        for configuration in self._configurations:
+            if configuration not in sections:
+                sections[configuration] = {
+                    "name": configuration.get_name(),
+                    "configuration": configuration.to_dict(),
+                    "completed": False,
+                    "num_processed_partitions": [0, 0],
+                    "fraction_processed_partitions": 0.0 }
+        completed = all(section["completed"] for section in sections.values())
+
+        if completed:
+            self._logger.info("[Results] Ran to completion.")
+        else:
+            self._logger.info(f"[Results] Stopped early on {self._stop_condition.reason}. Results are partial.")
         self._logger.info(f"[Results] Domain: {self._domain_file_path}")
-        self._logger.info(f"[Results] Table row: [#P = {faithful_abstraction.get_num_states()}, #S = {state_space.get_num_states()}, #I = {max_num_iterations}, #C = {total_conflicts}, #V = {value_conflicts}]")
+        self._logger.info(f"[Results] Peak memory usage: {int(peak_memory_usage())} MiB.")
+
+        write_results(self._results_file_path, {
+            "driver": "wl",
+            "completed": completed,
+            "stop_reason": None if completed else self._stop_condition.reason,
+            "fraction_processed_partitions": sum(section["fraction_processed_partitions"] for section in sections.values()) / len(sections),
+            "configuration": {
+                "enable_pruning": self._enable_pruning,
+                "max_num_states": self._max_num_states,
+                "escalate": self._escalate },
+            "domain_file": str(self._domain_file_path),
+            "problem_file": str(self._problem_file_path),
+            "configurations": [sections[configuration] for configuration in self._configurations],
+            **self._instrumentation.to_dict(),
+            "peak_memory_usage": peak_memory_usage() })
+        self._logger.info(f"[Results] Results written to {self._results_file_path}")
+        if self._trace_file_path is not None:
+            write_chrome_trace(self._trace_file_path, [self._instrumentation] + self._configuration_instrumentations, self._memory_sampler)
+            self._logger.info(f"[Results] Trace written to {self._trace_file_path}")
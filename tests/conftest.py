@@ -0,0 +1,14 @@
+import sys
+
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from graph_utils import PROBLEMS, ProblemGraphs, load_problem_graphs
+
+
+@pytest.fixture(params=PROBLEMS, ids=lambda problem: "/".join(problem))
+def problem_graphs(request) -> ProblemGraphs:
+    return load_problem_graphs(*request.param)
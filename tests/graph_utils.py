@@ -0,0 +1,89 @@
+import functools
+
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pykwl as kwl
+
+from pymimir import ProblemColorFunction, StateSpace, StateSpaceOptions, StaticVertexColoredDigraph, create_object_graph
+
+from src.pruned_search import compute_graph_certificate, get_certificate_key
+from src.pykwl_utils import GraphArrays, to_graph_arrays, to_uvc_graph_from_arrays
+
+
+DATA_PATH = Path(__file__).resolve().parent.parent / "data"
+
+### ferry/p91 and blocks_4/p423 have states that 1-WL does not distinguish but 2-FWL does.
+PROBLEMS = [("gripper", "p-2-0.pddl"), ("ferry", "p91.pddl"), ("blocks_4", "p423.pddl")]
+
+
+@dataclass
+class ProblemGraphs:
+    """ The object graphs of all states of a problem. Their colors are comparable because they share the color function.
+    """
+    state_space: StateSpace
+    object_graphs: List[StaticVertexColoredDigraph]
+    graphs: List[GraphArrays]
+    certificate_keys: List[bytes]
+
+
+@functools.lru_cache(maxsize=None)
+def load_problem_graphs(domain_name: str, problem_file_name: str) -> ProblemGraphs:
+    state_space_options = StateSpaceOptions()
+    state_space_options.max_num_states = 1000
+    state_space = StateSpace.create(str(DATA_PATH / domain_name / "domain.pddl"), str(DATA_PATH / domain_name / problem_file_name), state_space_options)
+    assert state_space is not None
+    color_function = ProblemColorFunction(state_space.get_problem())
+    object_graphs = [create_object_graph(color_function, state_space.get_pddl_factories(), state_space.get_problem(), concrete_state.get_state())
+                     for concrete_state in state_space.get_states()]
+    graphs = [to_graph_arrays(object_graph) for object_graph in object_graphs]
+    certificate_keys = [get_certificate_key(compute_graph_certificate(object_graph, graph)) for object_graph, graph in zip(object_graphs, graphs)]
+    return ProblemGraphs(state_space, object_graphs, graphs, certificate_keys)
+
+
+def compute_pykwl_classes(k: int, graphs: List[GraphArrays], ignore_counting: bool) -> List[int]:
+    """ Ground truth: the index of the final k-WL coloring of each graph by pykwl, where all graphs share one WL instance.
+    """
+    wl = kwl.WeisfeilerLeman(k, ignore_counting)
+    class_ids: Dict[Tuple, int] = dict()
+    result = []
+    for graph in graphs:
+        _, _, colors, counts = wl.compute_coloring(to_uvc_graph_from_arrays(graph))
+        result.append(class_ids.setdefault(tuple(sorted(zip(colors, counts))), len(class_ids)))
+    return result
+
+
+def to_partition(class_ids) -> List[List[int]]:
+    """ The classes as sorted lists of indices, such that partitions with different class ids can be compared.
+    """
+    classes = defaultdict(list)
+    for index, class_id in enumerate(class_ids):
+        classes[class_id].append(index)
+    return sorted(classes.values())
+
+
+def create_graph(num_vertices: int, edges: List[Tuple[int, int]], vertex_colors: Optional[List[int]] = None) -> GraphArrays:
+    """ Undirected graph from a list of edges, with all vertices of color 0 unless colors are given.
+    """
+    adjacency = [[] for _ in range(num_vertices)]
+    for source, target in edges:
+        adjacency[source].append(target)
+        adjacency[target].append(source)
+    indptr = np.zeros(num_vertices + 1, dtype=np.int32)
+    np.cumsum([len(neighbors) for neighbors in adjacency], out=indptr[1:])
+    return GraphArrays(
+        np.array(vertex_colors if vertex_colors is not None else [0] * num_vertices, dtype=np.int32),
+        indptr,
+        np.array([target for neighbors in adjacency for target in sorted(neighbors)], dtype=np.int32))
+
+
+def create_cycles(cycle_lengths: List[int]) -> GraphArrays:
+    edges = []
+    offset = 0
+    for cycle_length in cycle_lengths:
+        edges.extend((offset + i, offset + (i + 1) % cycle_length) for i in range(cycle_length))
+        offset += cycle_length
+    return create_graph(offset, edges)
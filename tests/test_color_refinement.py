@@ -0,0 +1,47 @@
+import pytest
+
+from graph_utils import compute_pykwl_classes, create_cycles, create_graph, to_partition
+
+from src.color_refinement import compute_coloring_classes, create_disjoint_union, refine_colors
+
+
+@pytest.mark.parametrize("ignore_counting", [False, True])
+def test_coloring_classes_match_pykwl(problem_graphs, ignore_counting):
+    class_ids, _ = compute_coloring_classes(problem_graphs.graphs, ignore_counting)
+    assert to_partition(class_ids.tolist()) == to_partition(compute_pykwl_classes(1, problem_graphs.graphs, ignore_counting))
+
+
+def test_isomorphic_states_share_class(problem_graphs):
+    class_ids, _ = compute_coloring_classes(problem_graphs.graphs, False)
+    class_by_certificate_key = dict()
+    for certificate_key, class_id in zip(problem_graphs.certificate_keys, class_ids.tolist()):
+        assert class_by_certificate_key.setdefault(certificate_key, class_id) == class_id
+
+
+def test_coloring_classes_of_regular_graphs():
+    ### 1-WL does not distinguish regular graphs of the same degree and size.
+    class_ids, _ = compute_coloring_classes([create_cycles([6]), create_cycles([3, 3]), create_cycles([7])], False)
+    assert class_ids[0] == class_ids[1] != class_ids[2]
+
+
+def test_coloring_classes_distinguish_vertex_colors():
+    path = [(0, 1), (1, 2)]
+    class_ids, _ = compute_coloring_classes([create_graph(3, path, [0, 1, 0]), create_graph(3, path, [1, 0, 0]), create_graph(3, path, [0, 0, 1])], False)
+    assert class_ids[0] != class_ids[1]
+    assert class_ids[1] == class_ids[2]
+
+
+def test_refine_colors_of_path():
+    ### The end points, their neighbors, and the center of a path of five vertices get three colors after two iterations.
+    union = create_disjoint_union([create_graph(5, [(0, 1), (1, 2), (2, 3), (3, 4)])])
+    colors, num_iterations = refine_colors(union, False)
+    assert colors[0] == colors[4] and colors[1] == colors[3]
+    assert len({colors[0], colors[1], colors[2]}) == 3
+    assert num_iterations == 3
+
+
+def test_coloring_classes_of_no_graphs_and_empty_graphs():
+    class_ids, _ = compute_coloring_classes([], False)
+    assert len(class_ids) == 0
+    class_ids, _ = compute_coloring_classes([create_graph(0, []), create_graph(0, []), create_graph(1, [])], False)
+    assert class_ids[0] == class_ids[1] != class_ids[2]
@@ -0,0 +1,46 @@
+import pytest
+
+from graph_utils import compute_pykwl_classes, create_cycles, create_graph, to_partition
+
+from src.graph_invariants import INVARIANTS, compute_invariants, split_by_invariants
+
+
+@pytest.mark.parametrize("ignore_counting", [False, True])
+@pytest.mark.parametrize("invariant", INVARIANTS)
+def test_invariants_are_1wl_invariants(problem_graphs, invariant, ignore_counting):
+    values = compute_invariants(problem_graphs.graphs, invariant, ignore_counting)
+    value_by_class = dict()
+    for class_id, value in zip(compute_pykwl_classes(1, problem_graphs.graphs, ignore_counting), values):
+        assert value_by_class.setdefault(class_id, value) == value
+
+
+@pytest.mark.parametrize("ignore_counting", [False, True])
+def test_split_keeps_1wl_classes_together(problem_graphs, ignore_counting):
+    graphs = problem_graphs.graphs
+    buckets, num_separated_graphs = split_by_invariants(graphs, INVARIANTS, ignore_counting)
+    assert all(len(bucket) > 1 for bucket in buckets)
+    assert sum(num_separated_graphs.values()) == len(graphs) - sum(len(bucket) for bucket in buckets)
+    bucket_by_graph = { index: bucket_index for bucket_index, bucket in enumerate(buckets) for index in bucket }
+    for conflict_class in to_partition(compute_pykwl_classes(1, graphs, ignore_counting)):
+        if len(conflict_class) > 1:
+            assert len({ bucket_by_graph.get(index) for index in conflict_class }) == 1
+            assert conflict_class[0] in bucket_by_graph
+
+
+def test_invariants_separate_graphs():
+    ### A path and a star with three edges differ in degrees, but no invariant separates a 6-cycle from two triangles.
+    path = create_graph(4, [(0, 1), (1, 2), (2, 3)])
+    star = create_graph(4, [(0, 1), (0, 2), (0, 3)])
+    assert len(set(compute_invariants([path, star], "degrees", False))) == 2
+    colored_path = create_graph(3, [(0, 1), (1, 2)], [0, 1, 0])
+    other_colored_path = create_graph(3, [(0, 1), (1, 2)], [1, 0, 0])
+    assert len(set(compute_invariants([colored_path, other_colored_path], "color-pair-edges", False))) == 2
+    assert len(set(compute_invariants([create_cycles([6]), create_cycles([3, 3])], "2-hop", False))) == 1
+    buckets, num_separated_graphs = split_by_invariants([path, star, path], ["degrees"], False)
+    assert buckets == [[0, 2]]
+    assert num_separated_graphs == { "degrees": 1 }
+
+
+def test_unknown_invariant():
+    with pytest.raises(ValueError):
+        compute_invariants([create_cycles([3])], "3-hop", False)
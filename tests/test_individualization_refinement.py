@@ -0,0 +1,59 @@
+import itertools
+
+import pytest
+
+from graph_utils import compute_pykwl_classes, create_graph, to_partition
+
+from src.color_refinement import compute_coloring_classes
+from src.individualization_refinement import compute_individualization_classes, get_num_individualized_vertices
+
+
+def create_rook_graph():
+    """ The line graph of K4,4, strongly regular with parameters (16, 6, 2, 2) like the Shrikhande graph.
+    """
+    vertices = list(itertools.product(range(4), range(4)))
+    return create_graph(16, [(4 * a[0] + a[1], 4 * b[0] + b[1]) for a, b in itertools.combinations(vertices, 2) if a[0] == b[0] or a[1] == b[1]])
+
+
+def create_shrikhande_graph():
+    vertices = list(itertools.product(range(4), range(4)))
+    differences = {(0, 1), (0, 3), (1, 0), (3, 0), (1, 1), (3, 3)}
+    return create_graph(16, [(4 * a[0] + a[1], 4 * b[0] + b[1]) for a, b in itertools.combinations(vertices, 2) if ((b[0] - a[0]) % 4, (b[1] - a[1]) % 4) in differences])
+
+
+@pytest.mark.parametrize("ignore_counting", [False, True])
+def test_classes_are_2fwl_invariants(problem_graphs, ignore_counting):
+    class_ids = compute_individualization_classes(problem_graphs.graphs, ignore_counting).tolist()
+    class_by_2fwl_class = dict()
+    for fwl2_class_id, class_id in zip(compute_pykwl_classes(2, problem_graphs.graphs, ignore_counting), class_ids):
+        assert class_by_2fwl_class.setdefault(fwl2_class_id, class_id) == class_id
+
+
+def test_classes_settle_1wl_conflicts(problem_graphs):
+    ### On the test problems, 2-FWL distinguishes all non-isomorphic states, and so does the individualization.
+    class_ids = compute_individualization_classes(problem_graphs.graphs, False)
+    assert to_partition(class_ids.tolist()) == to_partition(problem_graphs.certificate_keys)
+    ### The classes refine the 1-WL classes.
+    wl1_class_ids, _ = compute_coloring_classes(problem_graphs.graphs, False)
+    assert to_partition(class_ids.tolist()) == to_partition(list(zip(wl1_class_ids.tolist(), class_ids.tolist())))
+
+
+def test_classes_of_strongly_regular_graphs():
+    ### 2-FWL does not distinguish strongly regular graphs with the same parameters, hence neither can the individualization.
+    class_ids = compute_individualization_classes([create_rook_graph(), create_shrikhande_graph()], False)
+    assert class_ids[0] == class_ids[1]
+    assert compute_pykwl_classes(2, [create_rook_graph(), create_shrikhande_graph()], False) == [0, 0]
+
+
+def test_classes_distinguish_cycles():
+    ### 1-WL does not distinguish a 6-cycle from two triangles, but the neighbors of a vertex in a triangle are adjacent.
+    graphs = [create_graph(6, [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 0)]), create_graph(6, [(0, 1), (1, 2), (2, 0), (3, 4), (4, 5), (5, 3)])]
+    class_ids, _ = compute_coloring_classes(graphs, False)
+    assert class_ids[0] == class_ids[1]
+    class_ids = compute_individualization_classes(graphs, False)
+    assert class_ids[0] != class_ids[1]
+    assert get_num_individualized_vertices(graphs) == 72
+
+
+def test_classes_of_empty_graphs():
+    assert compute_individualization_classes([create_graph(0, []), create_graph(0, [])], False).tolist() == [0, 0]
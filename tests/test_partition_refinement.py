@@ -0,0 +1,35 @@
+import pytest
+
+from graph_utils import compute_pykwl_classes, create_cycles, to_partition
+
+from src.partition_refinement import SmallerHalfRefinement
+
+
+def get_pykwl_conflict_classes(graphs, ignore_counting):
+    return [conflict_class for conflict_class in to_partition(compute_pykwl_classes(1, graphs, ignore_counting)) if len(conflict_class) > 1]
+
+
+@pytest.mark.parametrize("ignore_counting", [False, True])
+def test_conflict_classes_match_pykwl(problem_graphs, ignore_counting):
+    result = SmallerHalfRefinement(problem_graphs.graphs, ignore_counting).run()
+    assert sorted(sorted(conflict_class) for conflict_class in result.conflict_classes) == get_pykwl_conflict_classes(problem_graphs.graphs, ignore_counting)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_conflict_classes_do_not_depend_on_seed(problem_graphs, seed):
+    result = SmallerHalfRefinement(problem_graphs.graphs, False, seed).run()
+    assert sorted(sorted(conflict_class) for conflict_class in result.conflict_classes) == get_pykwl_conflict_classes(problem_graphs.graphs, False)
+
+
+def test_conflict_classes_of_regular_graphs():
+    result = SmallerHalfRefinement([create_cycles([6]), create_cycles([3, 3]), create_cycles([5]), create_cycles([2, 3])], False).run()
+    ### The 2-cycle is a double edge, hence all vertices have two neighbors.
+    assert sorted(result.conflict_classes) == [[0, 1], [2, 3]]
+    assert result.max_num_iterations == 1
+
+
+def test_moved_vertices_are_bounded(problem_graphs):
+    ### Each vertex only moves when it is in a smaller part of its class, i.e., at most log2 of its number of vertices times.
+    result = SmallerHalfRefinement(problem_graphs.graphs, False).run()
+    num_vertices = sum(graph.get_num_vertices() for graph in problem_graphs.graphs)
+    assert result.num_moved_vertices <= num_vertices * num_vertices.bit_length()
@@ -0,0 +1,22 @@
+import pykwl as kwl
+
+from src.pykwl_utils import to_graph_arrays, to_uvc_graph, to_uvc_graph_elementwise
+
+
+def test_conversions_match_elementwise_reference(problem_graphs):
+    for object_graph in problem_graphs.object_graphs:
+        assert str(to_uvc_graph(object_graph)) == str(to_uvc_graph_elementwise(object_graph))
+
+
+def test_graph_arrays_are_undirected(problem_graphs):
+    for object_graph in problem_graphs.object_graphs:
+        graph_arrays = to_graph_arrays(object_graph)
+        assert graph_arrays.get_num_vertices() == object_graph.get_num_vertices()
+        edges = set(zip(graph_arrays.get_sources().tolist(), graph_arrays.indices.tolist()))
+        assert edges == { (target, source) for source, target in edges }
+
+
+def test_conversions_have_equal_colorings(problem_graphs):
+    wl = kwl.WeisfeilerLeman(1, False)
+    for object_graph in problem_graphs.object_graphs[:10]:
+        assert wl.compute_coloring(to_uvc_graph(object_graph)) == wl.compute_coloring(to_uvc_graph_elementwise(object_graph))
@@ -0,0 +1,21 @@
+from graph_utils import create_cycles, create_graph
+
+from src.state_data import InstanceInformation, StateDataBuilder
+
+
+def test_overwritten_rows_replace_superseded_rows():
+    builder = StateDataBuilder(False)
+    atom = builder.get_atom_id("(at a)")
+    other_atom = builder.get_atom_id("(at b)")
+    builder.add_row(0, 0, 1.0, [0, 0], create_cycles([3]), 10, [atom], [])
+    builder.add_row(0, 1, 2.0, [1], create_graph(2, [(0, 1)]), 11, [atom], [])
+    builder.add_row(1, 5, 3.0, [0], create_graph(1, []), 12, [other_atom], [atom], 0)
+    assert builder.get_num_states() == 2
+
+    state_data = builder.build([InstanceInformation("p1.pddl", dict(), []), InstanceInformation("p2.pddl", dict(), [])], 3, [1, 0])
+    assert state_data.instance_ids.tolist() == [0, 1]
+    assert state_data.state_ids.tolist() == [1, 5]
+    assert state_data.v_stars.tolist() == [2.0, 3.0]
+    assert state_data.get_canonical_initial_coloring(1) == (0,)
+    assert state_data.get_graph_arrays(1).get_num_vertices() == 1
+    assert state_data.get_state_string(1) == "State(index=12, fluent atoms=[(at b)], static atoms=[], derived atoms=[(at a)])"